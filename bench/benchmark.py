@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+'''
+benchmarks of the pipeline on a synthetic metagenome: the scripts are run end to end and the
+library functions one by one, each in its own process. Latency, throughput and peak memory
+are compared with a stored baseline and appended to a history for trends across changes.
+Without --tools real the stand-ins of bench/stubs replace trimmomatic, flash and fastx_collapser.
+'''
+
+# imports
+import sys, os
+import json
+import time
+import shutil
+import subprocess
+from argparse import ArgumentParser
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, ROOT)
+
+# number of read pairs of the predefined sizes
+SIZES = {'tiny': 5000, 'small': 50000, 'medium': 500000, 'large': 5000000}
+# trimming parameters of all runs
+QC_PARAMS = '--leading 3 --trailing 3 --sliding_window 4:15 --minlength 36'
+# environment variables of the external tools with their stand-ins
+STUBS = {'METAPIPELINE_TRIMMOMATIC': 'trimmomatic.py',
+         'METAPIPELINE_FLASH': 'flash.py',
+         'METAPIPELINE_COLLAPSER': 'fastx_collapser.py',
+         'METAPIPELINE_TRIMMOMATIC_WORKER': 'trimmomatic_worker.py'}
+# results compared with the baseline: key, label, True if larger is better
+COMPARED = [('wall_seconds', 'latency', False),
+            ('throughput', 'throughput', True),
+            ('peak_rss_mb', 'memory', False)]
+# benchmarks, that must write the same quality control outputs as the first one
+SAME_OUTPUTS = [('qc', 'qc_native'), ('qc', 'qc_worker')]
+HISTORY_FIELDS = ['time', 'revision', 'benchmark', 'size', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'throughput']
+
+class Data(object):
+  '''files of the synthetic dataset and the work folders of a benchmark run'''
+
+  def __init__(self, prefix, workdir, pairs, hits):
+    self.reads = [prefix + '_1.fastq', prefix + '_2.fastq']
+    self.table = prefix + '.tbl'
+    self.mapping = prefix + '.pfam2go'
+    self.workdir = workdir
+    self.pairs = pairs
+    self.hits = hits
+
+  def folder(self, name):
+    '''empty work folder of a benchmark'''
+    folder = self.workdir + os.sep + name
+    if os.path.isdir(folder):
+      shutil.rmtree(folder)
+    os.makedirs(folder)
+    return folder
+
+  def qc_outputs(self, folder):
+    '''paired and single end outputs of the quality control in folder'''
+    return ([folder + os.sep + 'reads_1.filtered.fastq', folder + os.sep + 'reads_2.filtered.fastq'],
+            folder + os.sep + 'reads_1.single.filtered.fastq')
+
+def python():
+  return sys.executable or 'python'
+
+def environment(tools):
+  '''environment of the benchmarked processes'''
+  env = dict(os.environ)
+  env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+  if tools == 'stubs':
+    for variable, stub in STUBS.items():
+      env[variable] = '%s %s' % (python(), BENCH + os.sep + 'stubs' + os.sep + stub)
+  return env
+
+def has_numpy():
+  try:
+    import numpy
+    return True
+  except ImportError:
+    return False
+
+def revision():
+  '''git revision of the tree, None outside of a repository'''
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = ROOT,
+                                   stderr = open(os.devnull, 'w')).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def dataset(args):
+  '''generate the synthetic dataset once per set of parameters'''
+  pairs = args.pairs or SIZES[args.size]
+  name = 'p%d-l%d-i%d-%s-d%g-s%d' % (pairs, args.length, args.insert, args.quality, args.duplication, args.seed)
+  folder = args.workdir + os.sep + 'data' + os.sep + name
+  prefix = folder + os.sep + 'reads'
+  if not os.path.exists(prefix + '.pfam2go'):
+    if not os.path.isdir(folder):
+      os.makedirs(folder)
+    sys.stdout.write('Generating %d synthetic read pairs in %s\n' % (pairs, folder))
+    subprocess.check_call([python(), BENCH + os.sep + 'synthetic.py', '-o', prefix,
+                           '--pairs', str(pairs), '--length', str(args.length), '--insert', str(args.insert),
+                           '--quality', args.quality, '--duplication', str(args.duplication),
+                           '--seed', str(args.seed)], stdout = open(os.devnull, 'w'))
+  return Data(prefix, args.workdir, pairs, pairs)
+
+def measure(command, env, log):
+  '''run command, returns wall seconds, cpu seconds and peak rss in MB of it and its children'''
+  usage = log + '.usage'
+  with open(log, 'w') as fout:
+    # a forked child inherits the memory high water mark of this process, the command is
+    # started by a small python process instead, that also measures it
+    status = subprocess.call([python(), os.path.abspath(__file__), '--measure', usage] + command,
+                             cwd = ROOT, env = env, stdout = fout, stderr = subprocess.STDOUT)
+  if status != 0:
+    raise RuntimeError('%s failed, see %s' % (' '.join(command), log))
+  with open(usage) as fin:
+    wall, cpu, rss = json.load(fin)
+  os.remove(usage)
+  return wall, cpu, rss / 1024.0
+
+def measure_child(usage, command):
+  '''run command and write wall and cpu seconds and peak rss (kb) of its process tree to usage'''
+  started = time.time()
+  process = subprocess.Popen(command)
+  pid, status, rusage = os.wait4(process.pid, 0)
+  with open(usage, 'w') as fout:
+    json.dump([time.time() - started, rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss], fout)
+  return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+def fastq_records(path):
+  '''records of a fastq file as sorted list, the order of the singles differs between engines'''
+  with open(path, 'rb') as fin:
+    lines = fin.read().splitlines()
+  return sorted(tuple(lines[i:i + 4]) for i in range(0, len(lines), 4))
+
+def same_outputs(data, first, second):
+  '''
+  True if the quality control of two benchmarks gave the same reads: identical paired files and
+  the same single end records in any order
+  '''
+  paired, single = data.qc_outputs(data.workdir + os.sep + first)
+  other_paired, other_single = data.qc_outputs(data.workdir + os.sep + second)
+  for path, other in zip(paired, other_paired):
+    with open(path, 'rb') as fin, open(other, 'rb') as other_fin:
+      if fin.read() != other_fin.read():
+        return False
+  return fastq_records(single) == fastq_records(other_single)
+
+def stage_times(folder):
+  '''wall seconds of the stages in the run report of a script'''
+  try:
+    with open(folder + os.sep + 'metrics.json') as fin:
+      return dict((record['stage'], record['wall_seconds']) for record in json.load(fin)['stages'])
+  except (IOError, ValueError):
+    return {}
+
+# end to end benchmarks: command, output folder with a run report, items and input bytes
+def qc_command(data, threads, folder, engine, options = []):
+  return ([python(), 'quality_control.py', '-t', str(threads), '-o', folder, '--trim_engine', engine]
+          + options + QC_PARAMS.split() + data.reads)
+
+def classify_command(data, threads, folder, engine, options = []):
+  paired, single = data.qc_outputs(data.workdir + os.sep + 'qc')
+  return ([python(), 'generate_classify_input.py', '-t', str(threads), '-o', folder,
+           '--dedup_engine', engine] + options + ['-s', single] + paired)
+
+def scripts(data, threads):
+  '''end to end benchmarks as name: (command, requirements, items, input files)'''
+  paired, single = data.qc_outputs(data.workdir + os.sep + 'qc')
+  return {'qc': (lambda folder: qc_command(data, threads, folder, 'trimmomatic'), [], 2 * data.pairs, data.reads),
+          'qc_native': (lambda folder: qc_command(data, threads, folder, 'native'), [], 2 * data.pairs, data.reads),
+          'qc_worker': (lambda folder: qc_command(data, threads, folder, 'trimmomatic', ['--trimmomatic_worker']),
+                        [], 2 * data.pairs, data.reads),
+          'qc_overlap': (lambda folder: qc_command(data, threads, folder, 'trimmomatic', ['--overlap_singles']),
+                         [], 2 * data.pairs, data.reads),
+          'qc_store': (lambda folder: qc_command(data, threads, folder, 'native', ['--compress', 'store']),
+                       [], 2 * data.pairs, data.reads),
+          'classify_input': (lambda folder: classify_command(data, threads, folder, 'collapser'),
+                             ['qc'], 2 * data.pairs, paired + [single]),
+          'classify_input_native': (lambda folder: classify_command(data, threads, folder, 'native'),
+                                    ['qc'], 2 * data.pairs, paired + [single]),
+          # small memory cap, so that the external sort spills several runs
+          'classify_input_external': (lambda folder: classify_command(data, threads, folder, 'external',
+                                                                      ['--dedup_memory', '16']),
+                                      ['qc'], 2 * data.pairs, paired + [single]),
+          'pfam2go': (lambda folder: [python(), 'pfam2go.py', '-i', data.table, '-m', data.mapping,
+                                      '-x', folder + os.sep + 'pfam2go.idx', '--mode', 'stream', '-t', str(threads),
+                                      '-o', folder + os.sep + 'annotation.tsv'],
+                      [], data.hits, [data.table]),
+          'pipeline': (lambda folder: [python(), 'meta-pipeline.py', '-t', str(threads), '-o', folder]
+                                      + QC_PARAMS.split() + data.reads,
+                       [], 2 * data.pairs, data.reads)}
+
+# function benchmarks, run by a child process with --call
+def call_read_batches(data, threads, folder):
+  from metapipeline.fastq import read_batches
+  with open(data.reads[0], 'rb') as fin:
+    return sum(len(batch[0]) for batch in read_batches(fin))
+
+def call_trim_paired(data, threads, folder):
+  from metapipeline import trimmer
+  with open(data.reads[0], 'rb') as forward, open(data.reads[1], 'rb') as reverse, \
+       open(os.devnull, 'wb') as out:
+    return 2 * trimmer.trim_paired([forward, reverse], [out, out], out, 3, 3, '4:15', 36)['input']
+
+def call_merge_paired(data, threads, folder):
+  from metapipeline import merger
+  with open(data.reads[0], 'rb') as forward, open(data.reads[1], 'rb') as reverse, \
+       open(os.devnull, 'wb') as out:
+    return 2 * merger.merge_paired([forward, reverse], out, out)['total']
+
+def call_remove_duplicates(data, threads, folder):
+  from metapipeline import dedup
+  return dedup.remove_duplicates(data.reads, folder + os.sep + 'nodup.fasta', folder + os.sep + 'nodup.index.tsv',
+                                 threads)[0]
+
+def call_gzip_roundtrip(data, threads, folder):
+  from metapipeline.compress import open_input, open_output
+  from metapipeline.concat import copy_file
+  output = folder + os.sep + 'reads.fastq.gz'
+  with open_output(output, threads) as fout:
+    copy_file(data.reads[0], fout)
+  with open_input(output, threads) as fin:
+    return sum(1 for line in fin) // 4
+
+def call_goindex_build(data, threads, folder):
+  from metapipeline import goindex
+  goindex.build(data.mapping, folder + os.sep + 'pfam2go.idx')
+  return len(goindex.GoIndex(folder + os.sep + 'pfam2go.idx'))
+
+def call_annotate(data, threads, folder):
+  from metapipeline import annotate
+  return annotate.annotate(data.table, data.mapping, folder + os.sep + 'annotation.tsv',
+                           folder + os.sep + 'pfam2go.idx', threads)[0]
+
+FUNCTIONS = {'read_batches': (call_read_batches, lambda data: [data.reads[0]]),
+             'trim_paired': (call_trim_paired, lambda data: data.reads),
+             'merge_paired': (call_merge_paired, lambda data: data.reads),
+             'remove_duplicates': (call_remove_duplicates, lambda data: data.reads),
+             'gzip_roundtrip': (call_gzip_roundtrip, lambda data: [data.reads[0]]),
+             'goindex_build': (call_goindex_build, lambda data: [data.mapping]),
+             'annotate': (call_annotate, lambda data: [data.table])}
+# functions, that need numpy
+NUMPY = ['qc_native', 'qc_store', 'trim_paired', 'merge_paired']
+
+def median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def run_benchmark(name, data, args, env):
+  '''run a benchmark args.repeat times, returns the median results'''
+  runs = []
+  stages = []
+  items = None
+  for repeat in range(args.repeat):
+    folder = data.folder(name)
+    if name in FUNCTIONS:
+      command = [python(), os.path.abspath(__file__), '--call', name, '--data', data.reads[0][:-len('_1.fastq')],
+                 '--workdir', args.workdir, '-t', str(args.threads)]
+      inputs = FUNCTIONS[name][1](data)
+    else:
+      builder, requires, items, inputs = scripts(data, args.threads)[name]
+      command = builder(folder)
+    log = folder + '.log'
+    runs.append(measure(command, env, log))
+    if name in FUNCTIONS:
+      with open(folder + os.sep + 'items.json') as fin:
+        items = json.load(fin)
+    stages.append(stage_times(folder))
+  wall = median([run[0] for run in runs])
+  size = sum(os.path.getsize(item) for item in inputs)
+  result = {'wall_seconds': round(wall, 3),
+            'cpu_seconds': round(median([run[1] for run in runs]), 3),
+            'peak_rss_mb': round(max(run[2] for run in runs), 1),
+            'items': items,
+            'throughput': round(items / wall, 1) if wall > 0 else None,
+            'mb_per_second': round(size / wall / (1 << 20), 2) if wall > 0 else None}
+  if any(stages):
+    # median of every stage of the run report
+    result['stages'] = dict((stage, median([times[stage] for times in stages if stage in times]))
+                            for stage in stages[-1])
+  return result
+
+def change(value, base):
+  '''relative change in percent'''
+  if value is None or not base:
+    return None
+  return (value - base) * 100.0 / base
+
+def compare(results, baseline, tolerance):
+  '''print the results with the change against the baseline, returns the regressed benchmarks'''
+  regressions = []
+  sys.stdout.write('\n%-24s %10s %8s %14s %8s %10s %8s\n' % ('benchmark', 'wall s', '+/-%', 'items/s', '+/-%',
+                                                            'rss MB', '+/-%'))
+  for name in sorted(results):
+    result = results[name]
+    base = baseline.get(name, {})
+    cells = []
+    for key, label, larger_is_better in COMPARED:
+      delta = change(result.get(key), base.get(key))
+      cells += [result.get(key), '' if delta is None else '%+.1f' % (delta)]
+      worse = delta is not None and (-delta if larger_is_better else delta) > tolerance * 100
+      if worse:
+        regressions.append('%s %s' % (name, label))
+    sys.stdout.write('%-24s %10s %8s %14s %8s %10s %8s\n' % tuple([name] + cells))
+    for stage, wall in sorted(result.get('stages', {}).items()):
+      delta = change(wall, base.get('stages', {}).get(stage))
+      sys.stdout.write('  %-22s %10s %8s\n' % (stage, wall, '' if delta is None else '%+.1f' % (delta)))
+  return regressions
+
+def append_history(path, results, size):
+  '''one line per benchmark and run for trends across revisions'''
+  new = not os.path.exists(path)
+  now = time.strftime('%Y-%m-%dT%H:%M:%S')
+  rev = revision() or ''
+  with open(path, 'a') as fout:
+    if new:
+      fout.write('\t'.join(HISTORY_FIELDS) + '\n')
+    for name in sorted(results):
+      row = dict(results[name], time = now, revision = rev, benchmark = name, size = size)
+      fout.write('\t'.join(str(row.get(key, '')) for key in HISTORY_FIELDS) + '\n')
+
+def call(args):
+  '''child process of a function benchmark, the number of items goes to items.json'''
+  prefix = args.data
+  data = Data(prefix, args.workdir, None, None)
+  folder = args.workdir + os.sep + args.call
+  items = FUNCTIONS[args.call][0](data, args.threads, folder)
+  with open(folder + os.sep + 'items.json', 'w') as fout:
+    json.dump(items, fout)
+  return 0
+
+def main(argv = None):
+  argv = sys.argv[1:] if argv is None else argv
+  if argv[:1] == ['--measure']:
+    # internal: measure a command, see measure
+    return measure_child(argv[1], argv[2:])
+  parser = ArgumentParser(description = '%s -- benchmarks of the pipeline on synthetic data' %
+                          (os.path.basename(sys.argv[0])))
+  parser.add_argument('--size', dest = 'size', default = 'small', choices = sorted(SIZES, key = SIZES.get),
+                      help = 'predefined number of read pairs (default = small)')
+  parser.add_argument('--pairs', type = int, dest = 'pairs', default = None,
+                      help = 'number of read pairs, overrides --size')
+  parser.add_argument('--length', type = int, dest = 'length', default = 150,
+                      help = 'read length (default = 150)')
+  parser.add_argument('--insert', type = int, dest = 'insert', default = 250,
+                      help = 'mean insert size (default = 250)')
+  parser.add_argument('--quality', dest = 'quality', default = 'illumina', choices = ['flat', 'illumina', 'degraded'],
+                      help = 'quality profile of the reads (default = illumina)')
+  parser.add_argument('--duplication', type = float, dest = 'duplication', default = 0.1,
+                      help = 'fraction of duplicated pairs (default = 0.1)')
+  parser.add_argument('--seed', type = int, dest = 'seed', default = 1,
+                      help = 'random seed of the dataset (default = 1)')
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1,
+                      help = 'number of cpu of the benchmarked runs (default = 1)')
+  parser.add_argument('--repeat', type = int, dest = 'repeat', default = 3,
+                      help = 'runs per benchmark, the median is reported (default = 3)')
+  parser.add_argument('--only', dest = 'only', action = 'append', default = [],
+                      help = 'run only this benchmark (can be repeated)')
+  parser.add_argument('--tools', dest = 'tools', default = 'stubs', choices = ['stubs', 'real'],
+                      help = 'use the stand-ins of bench/stubs or the configured external tools (default = stubs)')
+  parser.add_argument('--workdir', dest = 'workdir', default = BENCH + os.sep + 'work',
+                      help = 'location of the data, outputs and history (default = bench/work)')
+  parser.add_argument('--baseline', dest = 'baseline', default = BENCH + os.sep + 'baseline.json',
+                      help = 'stored results to compare with (default = bench/baseline.json)')
+  parser.add_argument('--save_baseline', dest = 'save_baseline', action = 'store_true', default = False,
+                      help = 'store the results of this run as new baseline')
+  parser.add_argument('--tolerance', type = float, dest = 'tolerance', default = 0.2,
+                      help = 'relative change that counts as regression (default = 0.2)')
+  parser.add_argument('--check', dest = 'check', action = 'store_true', default = False,
+                      help = 'exit with 1, if a benchmark regressed beyond the tolerance')
+  parser.add_argument('--call', dest = 'call', default = None, choices = sorted(FUNCTIONS),
+                      help = 'internal: run one function benchmark')
+  parser.add_argument('--data', dest = 'data', default = None,
+                      help = 'internal: prefix of the dataset of --call')
+  args = parser.parse_args(argv)
+  args.workdir = os.path.abspath(args.workdir)
+
+  if args.call:
+    return call(args)
+
+  data = dataset(args)
+  env = environment(args.tools)
+  names = args.only or sorted(scripts(data, args.threads)) + sorted(FUNCTIONS)
+  if not has_numpy():
+    sys.stdout.write('numpy is missing, skipping %s\n' % (', '.join(NUMPY)))
+    names = [name for name in names if name not in NUMPY]
+  config = {'pairs': data.pairs, 'length': args.length, 'insert': args.insert, 'quality': args.quality,
+            'duplication': args.duplication, 'seed': args.seed, 'threads': args.threads, 'tools': args.tools}
+  results = {}
+  done = set()
+  for name in names:
+    # outputs of other benchmarks, that a script works on, are created first
+    for required in scripts(data, args.threads).get(name, (None, []))[1]:
+      if required not in done:
+        sys.stdout.write('Preparing %s\n' % (required))
+        measure(scripts(data, args.threads)[required][0](data.folder(required)), env, data.workdir + os.sep + required + '.log')
+        done.add(required)
+    sys.stdout.write('Running %s (%d x)\n' % (name, args.repeat))
+    results[name] = run_benchmark(name, data, args, env)
+    done.add(name)
+
+  baseline = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline) as fin:
+      stored = json.load(fin)
+    if stored['config'] != config:
+      sys.stdout.write('WARNING: the baseline was measured with %s\n' % (json.dumps(stored['config'], sort_keys = True)))
+    baseline = stored['results']
+  regressions = compare(results, baseline, args.tolerance)
+  # engines of the same step are only comparable, if they give the same result
+  differences = ['%s/%s' % (first, second) for first, second in SAME_OUTPUTS
+                 if first in done and second in done and not same_outputs(data, first, second)]
+  append_history(args.workdir + os.sep + 'history.tsv', results, data.pairs)
+  with open(args.workdir + os.sep + 'results.json', 'w') as fout:
+    json.dump({'config': config, 'revision': revision(), 'results': results}, fout, indent = 2, sort_keys = True)
+  if args.save_baseline:
+    with open(args.baseline, 'w') as fout:
+      json.dump({'config': config, 'revision': revision(), 'results': results}, fout, indent = 2, sort_keys = True)
+    sys.stdout.write('Stored the results as baseline in %s\n' % (args.baseline))
+  if differences:
+    sys.stdout.write('ERROR: different outputs of %s\n' % (', '.join(differences)))
+    return 1
+  if regressions:
+    sys.stdout.write('Regressions beyond %d%%: %s\n' % (args.tolerance * 100, ', '.join(regressions)))
+    if args.check:
+      return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
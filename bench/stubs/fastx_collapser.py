@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+'''
+stand-in for fastx_collapser to benchmark the pipeline: identical sequences of a fastq file
+(or stdin) are written once to a fasta file labeled <rank>-<count>, most frequent first
+usage: fastx_collapser.py [-Q33] [-v] [-i INPUT] -o OUTPUT
+'''
+
+# imports
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+
+def main(argv = None):
+  parser = ArgumentParser(description = 'fastx_collapser stand-in')
+  parser.add_argument('-Q', dest = 'offset', default = '33')
+  parser.add_argument('-v', dest = 'verbose', action = 'store_true', default = False)
+  parser.add_argument('-i', dest = 'input', default = None)
+  parser.add_argument('-o', dest = 'output', required = True)
+  args = parser.parse_args(argv)
+
+  handle = open(args.input, 'rb') if args.input else getattr(sys.stdin, 'buffer', sys.stdin)
+  counts = Counter()
+  reads = 0
+  while True:
+    record = [handle.readline() for i in range(4)]
+    if not record[0]:
+      break
+    counts[record[1].rstrip(b'\r\n')] += 1
+    reads += 1
+  with open(args.output, 'wb') as fout:
+    for rank, (sequence, count) in enumerate(sorted(counts.items(), key = lambda item: (-item[1], item[0]))):
+      fout.write(('>%d-%d\n' % (rank + 1, count)).encode('ascii') + sequence + b'\n')
+  if args.verbose:
+    sys.stdout.write('Input: %d sequences (representing %d reads)\n'
+                     'Output: %d sequences (representing %d reads)\n' % (reads, reads, len(counts), reads))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+'''
+stand-in for flash to benchmark the pipeline: a pair is combined, if the end of the forward
+read matches the start of the reverse complement of the reverse read exactly (at least
+-m bases), the progress and the summary are printed in the format of flash
+usage: flash.py [-m MIN] [-M MAX] [--interleaved-output] -o PREFIX -d DIR [-t N] <forward> <reverse>
+'''
+
+# imports
+import sys, os
+import string
+from argparse import ArgumentParser
+
+# pairs between two progress lines
+PROGRESS_PAIRS = 25000
+
+# complement of the bases
+if hasattr(bytes, 'maketrans'):
+  COMPLEMENT = bytes.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+else:
+  COMPLEMENT = string.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+
+def reverse_complement(sequence):
+  return sequence.translate(COMPLEMENT)[::-1]
+
+def overlap(forward, reverse, minimum, maximum):
+  '''length of the longest exact overlap of forward and reverse (already reverse complemented)'''
+  for length in range(min(len(forward), len(reverse), maximum), minimum - 1, -1):
+    if forward[-length:] == reverse[:length]:
+      return length
+  return 0
+
+def records(handle):
+  '''fastq records of handle as lists of 4 lines without line breaks'''
+  while True:
+    record = [handle.readline().rstrip(b'\r\n') for i in range(4)]
+    if not record[0]:
+      return
+    yield record
+
+def main(argv = None):
+  parser = ArgumentParser(description = 'flash stand-in')
+  parser.add_argument('-m', type = int, dest = 'min_overlap', default = 10)
+  parser.add_argument('-M', type = int, dest = 'max_overlap', default = 65)
+  parser.add_argument('--interleaved-output', dest = 'interleaved', action = 'store_true', default = False)
+  parser.add_argument('-o', dest = 'prefix', default = 'out')
+  parser.add_argument('-d', dest = 'directory', default = '.')
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1)
+  parser.add_argument('input', nargs = 2)
+  args = parser.parse_args(argv)
+
+  prefix = args.directory + os.sep + args.prefix
+  total = combined = 0
+  with open(args.input[0], 'rb') as first, open(args.input[1], 'rb') as second, \
+       open(prefix + '.extendedFrags.fastq', 'wb') as extended, \
+       open(prefix + '.notCombined.fastq', 'wb') as not_combined:
+    for forward, reverse in zip(records(first), records(second)):
+      total += 1
+      sequence = reverse_complement(reverse[1])
+      quality = reverse[3][::-1]
+      length = overlap(forward[1], sequence, args.min_overlap, args.max_overlap)
+      if length:
+        combined += 1
+        extended.write(b'\n'.join([forward[0], forward[1] + sequence[length:], b'+',
+                                   forward[3] + quality[length:]]) + b'\n')
+      else:
+        not_combined.write(b'\n'.join(forward + reverse) + b'\n')
+      if total % PROGRESS_PAIRS == 0:
+        sys.stdout.write('[FLASH] Processed %d read pairs.\n' % (total))
+        sys.stdout.flush()
+  sys.stdout.write('[FLASH] Read combination statistics:\n'
+                   '[FLASH]     Total pairs:      %d\n'
+                   '[FLASH]     Combined pairs:   %d\n'
+                   '[FLASH]     Uncombined pairs: %d\n'
+                   '[FLASH]     Percent combined: %.2f%%\n' % (total, combined, total - combined,
+                                                              0.0 if total == 0 else combined * 100.0 / total))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+'''
+stand-in for trimmomatic (PE and SE mode, phred33) to benchmark the pipeline without java:
+LEADING, TRAILING, SLIDINGWINDOW and MINLEN are applied in the given order, the summary
+is written to stderr and a line per read to the trimlog in the format of trimmomatic
+usage: trimmomatic.py PE|SE [-threads N] [-phred33] [-trimlog FILE] <inputs> <outputs> <steps>
+'''
+
+# imports
+import sys, os
+
+# offset of the phred33 quality encoding
+PHRED_OFFSET = 33
+
+def parse_arguments(argv):
+  '''mode, files, trimming steps and trimlog (None without) of a trimmomatic command line'''
+  mode, files, steps, trimlog = argv[0], [], [], None
+  items = iter(argv[1:])
+  for item in items:
+    if item == '-trimlog':
+      trimlog = next(items)
+    elif item == '-threads':
+      # options with a value
+      next(items)
+    elif item.startswith('-'):
+      continue
+    elif ':' in item and item.split(':')[0].isupper():
+      name, values = item.split(':', 1)
+      steps.append((name, [int(value) for value in values.split(':')]))
+    else:
+      files.append(item)
+  return mode, files, steps, trimlog
+
+def trim(quality, steps):
+  '''start and end of the surviving part of a read, None if it is dropped'''
+  scores = [q - PHRED_OFFSET for q in bytearray(quality.rstrip(b'\r\n'))]
+  start, end = 0, len(scores)
+  for name, values in steps:
+    if name == 'LEADING':
+      while start < end and scores[start] < values[0]:
+        start += 1
+    elif name == 'TRAILING':
+      while end > start and scores[end - 1] < values[0]:
+        end -= 1
+    elif name == 'SLIDINGWINDOW':
+      # like trimmomatic (and metapipeline.trimmer): cut at the end of the last good window
+      # and drop its low quality tail, a read failing in its first window is dropped
+      size, required = values
+      if end - start < size:
+        return None
+      for i in range(start, end - size + 1):
+        if sum(scores[i:i + size]) < size * required:
+          if i == start:
+            return None
+          end = i - 1 + size
+          while end > start and scores[end - 1] < required:
+            end -= 1
+          break
+    elif name == 'MINLEN':
+      if end - start < values[0]:
+        return None
+    if end <= start:
+      return None
+  return start, end
+
+def records(handle):
+  '''fastq records of handle as lists of 4 lines'''
+  while True:
+    record = [handle.readline() for i in range(4)]
+    if not record[0]:
+      return
+    yield record
+
+def cut(record, span):
+  '''record cut down to span'''
+  start, end = span
+  return b''.join([record[0], record[1][start:end], b'\n', record[2], record[3][start:end], b'\n'])
+
+def trimlog_line(record, span):
+  '''trimlog line of a read: name, surviving length, first kept base, end of the kept bases, trimmed bases at the end'''
+  length = len(record[1].rstrip(b'\r\n'))
+  start, end = span or (0, 0)
+  return b'%s %d %d %d %d\n' % (record[0][1:].rstrip(b'\r\n'), end - start, start, end, length - end if span else 0)
+
+def percent(count, total):
+  return 0.0 if total == 0 else count * 100.0 / total
+
+def paired_end(files, steps, log = sys.stderr, trimlog = None):
+  '''trim read pairs, reads that lose their mate go to the unpaired outputs'''
+  inputs = [open(item, 'rb') for item in files[:2]]
+  outputs = [open(item, 'wb') for item in files[2:6]] + ([open(trimlog, 'wb')] if trimlog else [])
+  pairs = both = forward = reverse = 0
+  for first, second in zip(records(inputs[0]), records(inputs[1])):
+    pairs += 1
+    spans = [trim(first[3], steps), trim(second[3], steps)]
+    if trimlog:
+      outputs[4].write(trimlog_line(first, spans[0]) + trimlog_line(second, spans[1]))
+    if spans[0] and spans[1]:
+      both += 1
+      outputs[0].write(cut(first, spans[0]))
+      outputs[2].write(cut(second, spans[1]))
+    elif spans[0]:
+      forward += 1
+      outputs[1].write(cut(first, spans[0]))
+    elif spans[1]:
+      reverse += 1
+      outputs[3].write(cut(second, spans[1]))
+  for handle in inputs + outputs:
+    handle.close()
+  dropped = pairs - both - forward - reverse
+  log.write('Input Read Pairs: %d Both Surviving: %d (%.2f%%) Forward Only Surviving: %d (%.2f%%) '
+            'Reverse Only Surviving: %d (%.2f%%) Dropped: %d (%.2f%%)\n'
+            'TrimmomaticPE: Completed successfully\n' % (pairs, both, percent(both, pairs),
+                                                         forward, percent(forward, pairs),
+                                                         reverse, percent(reverse, pairs),
+                                                         dropped, percent(dropped, pairs)))
+
+def single_end(files, steps, log = sys.stderr, trimlog = None):
+  '''trim single reads'''
+  reads = surviving = 0
+  with open(files[0], 'rb') as fin, open(files[1], 'wb') as fout, \
+       open(trimlog or os.devnull, 'wb') as flog:
+    for record in records(fin):
+      reads += 1
+      span = trim(record[3], steps)
+      flog.write(trimlog_line(record, span))
+      if span:
+        surviving += 1
+        fout.write(cut(record, span))
+  log.write('Input Reads: %d Surviving: %d (%.2f%%) Dropped: %d (%.2f%%)\n'
+            'TrimmomaticSE: Completed successfully\n' % (reads, surviving, percent(surviving, reads),
+                                                         reads - surviving, percent(reads - surviving, reads)))
+
+def main(argv = None):
+  mode, files, steps, trimlog = parse_arguments(argv or sys.argv[1:])
+  if mode == 'PE':
+    paired_end(files, steps, trimlog = trimlog)
+  else:
+    single_end(files, steps, trimlog = trimlog)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
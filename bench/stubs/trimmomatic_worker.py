@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''
+stand-in for the trimmomatic worker (metapipeline/TrimmomaticWorker.java): the jobs run with
+the trimmomatic stand-in in threads of one process and are answered like by the jvm worker
+usage: trimmomatic_worker.py (with the access token in METAPIPELINE_WORKER_TOKEN)
+'''
+
+# imports
+import sys, os
+import json
+import time
+import socket
+import threading
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
+
+import trimmomatic
+
+def handle(connection, token):
+  '''run the job of a connection and answer with its status, runtime and log'''
+  request = connection.makefile('rb')
+  fields = request.readline().decode('utf-8').rstrip('\n').split('\t')
+  request.close()
+  log = StringIO()
+  started = time.time()
+  if len(fields) < 2 or fields[0] != token:
+    status = 2
+    log.write('invalid request\n')
+  else:
+    try:
+      mode, files, steps, trimlog = trimmomatic.parse_arguments(fields[1:])
+      (trimmomatic.paired_end if mode == 'PE' else trimmomatic.single_end)(files, steps, log, trimlog)
+      status = 0
+    except Exception as e:
+      log.write('%s\n' % (e))
+      status = 1
+  answer = {'status': status, 'seconds': time.time() - started, 'log': log.getvalue()}
+  connection.sendall((json.dumps(answer) + '\n').encode('utf-8'))
+  connection.close()
+
+def serve(server, token):
+  while True:
+    connection, address = server.accept()
+    job = threading.Thread(target = handle, args = (connection, token))
+    job.daemon = True
+    job.start()
+
+def main(argv = None):
+  token = os.environ.get('METAPIPELINE_WORKER_TOKEN')
+  if not token:
+    sys.stderr.write('trimmomatic_worker.py: no access token in METAPIPELINE_WORKER_TOKEN\n')
+    return 2
+  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  server.bind(('127.0.0.1', 0))
+  server.listen(50)
+  # the port is the only output on stdout
+  sys.stdout.write('%d\n' % (server.getsockname()[1]))
+  sys.stdout.flush()
+  thread = threading.Thread(target = serve, args = (server, token))
+  thread.daemon = True
+  thread.start()
+  # stop with the process that started the worker
+  sys.stdin.read()
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+'''
+reproducible synthetic metagenome for the benchmarks: paired end reads of random genomes
+with lognormal abundances, configurable read length, insert size, quality profile and
+duplication rate, plus a pfam hit table and a pfam2go mapping for the annotation
+'''
+
+# imports
+import sys, os
+import math
+import bisect
+import random
+from argparse import ArgumentParser
+
+# offset of the phred33 quality encoding
+PHRED_OFFSET = 33
+BASES = 'ACGT'
+COMPLEMENT = dict(zip(BASES, 'TGCA'))
+# quality templates drawn per profile, every read takes one with its own sequencing errors
+TEMPLATES = 2000
+# recently written pairs, that duplicates are copied from
+RECENT_PAIRS = 10000
+# mean quality at the start and end of a read, standard deviation and fraction of reads
+# with a quality 2 tail (illumina 'B' tail)
+PROFILES = {'flat': (38, 38, 1.0, 0.0),
+            'illumina': (37, 28, 3.0, 0.03),
+            'degraded': (32, 12, 5.0, 0.15)}
+
+def reverse_complement(sequence):
+  return ''.join(COMPLEMENT[base] for base in reversed(sequence))
+
+def quality_template(rng, length, profile):
+  '''phred scores of one read for a profile, with the bases that get a sequencing error'''
+  start, end, deviation, tails = PROFILES[profile]
+  scores = []
+  for i in range(length):
+    # quality falls off quadratically towards the end of the read
+    mean = start - (start - end) * (float(i) / max(length - 1, 1)) ** 2
+    scores.append(int(min(41, max(2, round(rng.gauss(mean, deviation))))))
+  if rng.random() < tails:
+    tail = rng.randint(length // 2, length - 1)
+    scores[tail:] = [2] * (length - tail)
+  errors = [i for i, score in enumerate(scores) if rng.random() < 10 ** (-score / 10.0)]
+  return ''.join(chr(score + PHRED_OFFSET) for score in scores), errors
+
+def sequence_errors(rng, sequence, errors):
+  '''substitute the bases at the error positions'''
+  if not errors:
+    return sequence
+  bases = list(sequence)
+  for i in errors:
+    bases[i] = rng.choice([base for base in BASES if base != bases[i]])
+  return ''.join(bases)
+
+def genomes(rng, count, size):
+  '''random genomes and their lognormal abundances as cumulative weights'''
+  sequences = [''.join(rng.choice(BASES) for i in range(size)) for genome in range(count)]
+  weights = [rng.lognormvariate(0, 1) for genome in range(count)]
+  total = sum(weights)
+  cumulative = []
+  for weight in weights:
+    cumulative.append((cumulative[-1] if cumulative else 0) + weight / total)
+  return sequences, cumulative
+
+def pick(rng, cumulative):
+  '''index of a genome drawn by abundance'''
+  return min(bisect.bisect(cumulative, rng.random()), len(cumulative) - 1)
+
+def write_reads(prefix, pairs, length, insert, profile, duplication, genome_count, genome_size, seed):
+  '''write <prefix>_1.fastq and <prefix>_2.fastq, returns their names'''
+  rng = random.Random(seed)
+  sequences, cumulative = genomes(rng, genome_count, max(genome_size, insert * 2))
+  templates = [quality_template(rng, length, profile) for i in range(TEMPLATES)]
+  recent = []
+  outputs = [prefix + '_1.fastq', prefix + '_2.fastq']
+  with open(outputs[0], 'w') as forward, open(outputs[1], 'w') as reverse:
+    for i in range(pairs):
+      if recent and rng.random() < duplication:
+        # a duplicate has the sequences of an earlier pair, but its own qualities
+        genome, first, second = recent[rng.randrange(len(recent))]
+      else:
+        genome = pick(rng, cumulative)
+        # fragment of the genome, reads from both ends
+        size = max(length, int(rng.gauss(insert, insert / 10.0)))
+        start = rng.randrange(len(sequences[genome]) - size)
+        fragment = sequences[genome][start:start + size]
+        first, second = fragment[:length], reverse_complement(fragment)[:length]
+      qualities = [templates[rng.randrange(TEMPLATES)] for mate in range(2)]
+      first_read = sequence_errors(rng, first, qualities[0][1])
+      second_read = sequence_errors(rng, second, qualities[1][1])
+      forward.write('@bench:%d:%d/1\n%s\n+\n%s\n' % (genome, i, first_read, qualities[0][0][:len(first_read)]))
+      reverse.write('@bench:%d:%d/2\n%s\n+\n%s\n' % (genome, i, second_read, qualities[1][0][:len(second_read)]))
+      if len(recent) < RECENT_PAIRS:
+        recent.append((genome, first, second))
+      else:
+        recent[i % RECENT_PAIRS] = (genome, first, second)
+  return outputs
+
+def write_annotation(prefix, hits, families, seed):
+  '''write a hmmer --tblout table <prefix>.tbl and a pfam2go mapping <prefix>.pfam2go, returns their names'''
+  rng = random.Random(seed)
+  table, mapping = prefix + '.tbl', prefix + '.pfam2go'
+  with open(mapping, 'w') as fout:
+    fout.write('!version date: synthetic\n!description: pfam2go mapping of the benchmark\n')
+    for family in range(families):
+      # most families have some GO terms, the rest stays unannotated
+      for term in range(rng.choice([0, 1, 1, 2, 3, 4])):
+        fout.write('PF%05d\tGO:%07d\tsynthetic function %d\t%s\n' % (family, rng.randrange(10 ** 7),
+                                                                     term, rng.choice('PFC')))
+  with open(table, 'w') as fout:
+    fout.write('# target name accession query name accession E-value score bias\n')
+    for i in range(hits):
+      family = int(rng.paretovariate(1.2)) % families
+      evalue = 10 ** -rng.uniform(3, 50)
+      fout.write('bench:%d - family%d PF%05d.%d %.1e %.1f 0.1\n' % (i, family, family, rng.randint(1, 20),
+                                                                 evalue, -math.log10(evalue) * 3))
+  return table, mapping
+
+def main(argv = None):
+  parser = ArgumentParser(description = '%s -- synthetic metagenome for the benchmarks' %
+                          (os.path.basename(sys.argv[0])))
+  parser.add_argument('-o', dest = 'prefix', required = True,
+                      help = 'prefix of the output files')
+  parser.add_argument('--pairs', type = int, dest = 'pairs', default = 100000,
+                      help = 'number of read pairs (default = 100000)')
+  parser.add_argument('--length', type = int, dest = 'length', default = 150,
+                      help = 'read length (default = 150)')
+  parser.add_argument('--insert', type = int, dest = 'insert', default = 250,
+                      help = 'mean insert size, pairs with inserts shorter than 2 * length overlap (default = 250)')
+  parser.add_argument('--quality', dest = 'quality', default = 'illumina', choices = sorted(PROFILES),
+                      help = 'quality profile (default = illumina)')
+  parser.add_argument('--duplication', type = float, dest = 'duplication', default = 0.1,
+                      help = 'fraction of duplicated pairs (default = 0.1)')
+  parser.add_argument('--genomes', type = int, dest = 'genomes', default = 20,
+                      help = 'number of genomes (default = 20)')
+  parser.add_argument('--genome_size', type = int, dest = 'genome_size', default = 100000,
+                      help = 'size of every genome (default = 100000)')
+  parser.add_argument('--hits', type = int, dest = 'hits', default = None,
+                      help = 'number of pfam hits (default = number of pairs)')
+  parser.add_argument('--families', type = int, dest = 'families', default = 5000,
+                      help = 'number of pfam families (default = 5000)')
+  parser.add_argument('--seed', type = int, dest = 'seed', default = 1,
+                      help = 'random seed, the same seed and python version give the same files (default = 1)')
+  args = parser.parse_args(argv)
+
+  reads = write_reads(args.prefix, args.pairs, args.length, args.insert, args.quality,
+                      args.duplication, args.genomes, args.genome_size, args.seed)
+  annotation = write_annotation(args.prefix, args.pairs if args.hits is None else args.hits,
+                                args.families, args.seed)
+  sys.stdout.write('%s\n' % ('\n'.join(reads + list(annotation))))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+'''
+parallel driver for create_taxonomyDB.R,
+the same as: python -m metapipeline taxonomy-db
+'''
+
+# imports
+import sys
+
+from metapipeline.commands.taxonomy_db import main
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+'''
+little script to export read stores (.mprs) as fastq files,
+the same as: python -m metapipeline export-fastq
+'''
+
+# imports
+import sys
+
+from metapipeline.commands.export_fastq import main
+
+if __name__ == '__main__':
+  sys.exit(main())
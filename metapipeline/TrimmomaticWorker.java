@@ -0,0 +1,180 @@
+/*
+ * long-lived trimmomatic worker of the meta-pipeline (metapipeline/trimworker.py): one jvm
+ * runs the trimmomatic jobs of a whole run or batch. It listens on a local port (written to
+ * stdout on startup), a job is one line <token>\t<PE|SE>\t<arguments separated by tabs>,
+ * the answer one json line with the exit status, the runtime and the log of the job.
+ * Jobs of several connections run at the same time, the output of every job (and of the
+ * threads started by it) is captured separately. The worker stops, when stdin is closed.
+ *
+ * compile: javac -cp trimmomatic-0.32.jar TrimmomaticWorker.java
+ */
+
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.Writer;
+import java.io.OutputStreamWriter;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.util.Arrays;
+
+public class TrimmomaticWorker {
+
+  // environment variable with the access token of the jobs
+  static final String TOKEN_VARIABLE = "METAPIPELINE_WORKER_TOKEN";
+  // output of the job of the current thread, inherited by the threads of trimmomatic
+  static final InheritableThreadLocal<ByteArrayOutputStream> CAPTURE = new InheritableThreadLocal<ByteArrayOutputStream>();
+
+  // stdout and stderr of the jvm, output outside of a job goes to the original stderr
+  static class CaptureStream extends OutputStream {
+    final OutputStream fallback;
+
+    CaptureStream(OutputStream fallback) {
+      this.fallback = fallback;
+    }
+
+    public void write(int b) throws IOException {
+      write(new byte[] {(byte) b}, 0, 1);
+    }
+
+    public void write(byte[] b, int off, int len) throws IOException {
+      ByteArrayOutputStream capture = CAPTURE.get();
+      if (capture == null) {
+        fallback.write(b, off, len);
+        return;
+      }
+      synchronized (capture) {
+        capture.write(b, off, len);
+      }
+    }
+
+    public void flush() throws IOException {
+      fallback.flush();
+    }
+  }
+
+  public static void main(String[] args) throws IOException {
+    final String token = System.getenv(TOKEN_VARIABLE);
+    if (token == null || token.length() == 0) {
+      System.err.println("TrimmomaticWorker: no access token in " + TOKEN_VARIABLE);
+      System.exit(2);
+    }
+    ServerSocket server = new ServerSocket(0, 50, InetAddress.getByName("127.0.0.1"));
+    PrintStream stdout = System.out;
+    PrintStream stderr = System.err;
+    System.setOut(new PrintStream(new CaptureStream(stderr), true));
+    System.setErr(new PrintStream(new CaptureStream(stderr), true));
+    // the port is the only output on stdout
+    stdout.println(server.getLocalPort());
+    stdout.flush();
+    // stop with the process that started the worker
+    Thread watchdog = new Thread() {
+      public void run() {
+        try {
+          while (System.in.read() >= 0) {
+          }
+        } catch (IOException e) {
+        }
+        System.exit(0);
+      }
+    };
+    watchdog.setDaemon(true);
+    watchdog.start();
+    while (true) {
+      final Socket connection = server.accept();
+      Thread job = new Thread() {
+        public void run() {
+          handle(connection, token);
+        }
+      };
+      job.setDaemon(true);
+      job.start();
+    }
+  }
+
+  // run the job of a connection and answer with its status, runtime and log
+  static void handle(Socket connection, String token) {
+    try {
+      BufferedReader reader = new BufferedReader(new InputStreamReader(connection.getInputStream(), "UTF-8"));
+      Writer writer = new OutputStreamWriter(connection.getOutputStream(), "UTF-8");
+      String line = reader.readLine();
+      String[] fields = line == null ? new String[0] : line.split("\t", -1);
+      if (fields.length < 2 || !token.equals(fields[0])) {
+        writer.write(answer(2, 0.0, "invalid request\n"));
+      } else {
+        ByteArrayOutputStream capture = new ByteArrayOutputStream();
+        CAPTURE.set(capture);
+        long started = System.nanoTime();
+        int status;
+        try {
+          status = run(fields[1], Arrays.copyOfRange(fields, 2, fields.length)) ? 0 : 1;
+        } catch (Throwable e) {
+          Throwable cause = e instanceof InvocationTargetException ? e.getCause() : e;
+          cause.printStackTrace();
+          status = 1;
+        } finally {
+          CAPTURE.remove();
+        }
+        String log;
+        synchronized (capture) {
+          log = new String(capture.toByteArray(), "UTF-8");
+        }
+        writer.write(answer(status, (System.nanoTime() - started) / 1e9, log));
+      }
+      writer.flush();
+    } catch (IOException e) {
+      e.printStackTrace();
+    } finally {
+      try {
+        connection.close();
+      } catch (IOException e) {
+      }
+    }
+  }
+
+  // run trimmomatic in the mode with the arguments, true if it was successful
+  static boolean run(String mode, String[] args) throws Exception {
+    String name;
+    if ("PE".equals(mode)) {
+      name = "org.usadellab.trimmomatic.TrimmomaticPE";
+    } else if ("SE".equals(mode)) {
+      name = "org.usadellab.trimmomatic.TrimmomaticSE";
+    } else {
+      throw new IllegalArgumentException("unknown mode " + mode);
+    }
+    // run returns false on invalid arguments, main would exit the jvm
+    Method method = Class.forName(name).getMethod("run", String[].class);
+    Object result = method.invoke(null, (Object) args);
+    return !(result instanceof Boolean) || ((Boolean) result).booleanValue();
+  }
+
+  // json line of the answer
+  static String answer(int status, double seconds, String log) {
+    return "{\"status\": " + status + ", \"seconds\": " + seconds + ", \"log\": " + quote(log) + "}\n";
+  }
+
+  static String quote(String text) {
+    StringBuilder result = new StringBuilder("\"");
+    for (int i = 0; i < text.length(); i++) {
+      char c = text.charAt(i);
+      if (c == '"' || c == '\\') {
+        result.append('\\').append(c);
+      } else if (c == '\n') {
+        result.append("\\n");
+      } else if (c == '\t') {
+        result.append("\\t");
+      } else if (c < 0x20) {
+        result.append(String.format("\\u%04x", (int) c));
+      } else {
+        result.append(c);
+      }
+    }
+    return result.append('"').toString();
+  }
+}
@@ -0,0 +1,26 @@
+'''
+shared library code for the meta-pipeline scripts:
+	- cli: single entry point with the commands of the scripts (python -m metapipeline <command>)
+	- commands: the scripts as importable commands, that can be called in the same process
+	- fastq: streaming reading and writing of fastq records, naming of outputs
+	- trimmer: native quality trimming and length filtering of paired end reads
+	- merger: native overlap merging of read pairs (alternative to flash)
+	- shard: record aligned splitting of fastq files for parallel processing
+	- concat: fast and virtual concatenation of files
+	- compress: transparent gzip, bgzf and zstd compressed files
+	- readstore: compact columnar read store as intermediate format (2 bit bases, packed qualities)
+	- dedup: native hash based removal of duplicated reads
+	- goindex: memory mapped index of the pfam2go mapping
+	- annotate: streaming GO annotation of hmmer tables
+	- relabel: qiime labels for the fasta headers of many samples
+	- taxonomy: splitting of blast dbs by query and merging of the taxonomy dbs of the partitions
+	- cache: stage manifests for resuming runs, atomic outputs
+	- tools: command lines of the external tools
+	- trimworker: long-lived trimmomatic jvm for the calls of a run or batch (TrimmomaticWorker.java)
+	- scheduler: running the stages of many samples under a core and memory budget
+	- metrics: time, memory and throughput of the stages, parsing of tool summaries
+	- hostprofile: throughput of the stages against their threads on this host, threads per stage
+	- stats: reads, bases and length histograms of the written files (read statistics sidecar)
+'''
+
+__version__ = '1.0'
@@ -0,0 +1,8 @@
+'''python -m metapipeline <command> [options]'''
+
+# imports
+import sys
+
+from metapipeline.cli import main
+
+sys.exit(main())
@@ -0,0 +1,114 @@
+'''
+streaming GO annotation of hmmer tables (--tblout or --domtblout of hmmsearch against Pfam):
+every hit is joined with all GO terms of its family in the pfam2go index and written at once,
+large tables are split into line aligned chunks, that are annotated in parallel
+'''
+
+# imports
+import os
+
+from metapipeline import goindex
+from metapipeline.concat import copy_file
+from metapipeline.compress import open_input, detect
+
+# columns of target name, family accession, e-value and score in the table formats
+COLUMNS = {'tblout': (0, 3, 4, 5),
+           'domtblout': (0, 4, 12, 13)}
+# header of the output table
+HEADER = '#pfam \t target_seq \t GO-ID \t GO-Desc \t GO-Tree \t e-value, \t score\n'
+# do not create chunks smaller than this
+MIN_CHUNK_SIZE = 1 << 24
+
+def line_ranges(path, chunks):
+  '''split a file into at most chunks line aligned byte ranges'''
+  size = os.path.getsize(path)
+  chunks = max(1, min(chunks, size // MIN_CHUNK_SIZE))
+  bounds = [0]
+  with open(path, 'rb') as fin:
+    for i in range(1, chunks):
+      fin.seek(size * i // chunks)
+      fin.readline()
+      if fin.tell() > bounds[-1] and fin.tell() < size:
+        bounds.append(fin.tell())
+  bounds.append(size)
+  return list(zip(bounds[:-1], bounds[1:]))
+
+def read_lines(handle, start, end):
+  '''lines of handle between the byte offsets start and end'''
+  handle.seek(start)
+  position = start
+  while position < end:
+    line = handle.readline()
+    if not line:
+      break
+    position += len(line)
+    yield line
+
+def go_columns(go_table, key):
+  '''GO-ID, GO-Desc and GO-Tree of every GO term of a family as tab separated bytes'''
+  columns = ['\t'.join((go + ['', '', ''])[:3]) for go in go_table.rows(key)]
+  return [item if isinstance(item, bytes) else item.encode('utf-8') for item in columns]
+
+def annotate_lines(lines, go_table, output, table = 'tblout'):
+  '''write one row per hit and GO term of the family, returns the number of hits and annotated hits'''
+  target, accession, evalue, score = COLUMNS[table]
+  hits = annotated = 0
+  # GO terms of the families seen so far, bounded by the number of pfam families
+  terms = {}
+  for line in lines:
+    # ignore comments
+    if line.startswith(b'#') or not line.strip():
+      continue
+    fields = line.split()
+    key = fields[accession].split(b'.', 1)[0]
+    hits += 1
+    columns = terms.get(key)
+    if columns is None:
+      columns = terms[key] = go_columns(go_table, key)
+    if columns:
+      annotated += 1
+      prefix = key + b'\t' + fields[target] + b'\t'
+      suffix = b'\t' + fields[evalue] + b'\t' + fields[score] + b'\n'
+      output.write(b''.join(prefix + go + suffix for go in columns))
+  return hits, annotated
+
+def annotate_chunk(task):
+  '''annotate a byte range of the table into its own part file'''
+  path, start, end, mapping, index, output, table = task
+  # every process maps the same index pages
+  go_table = goindex.load(mapping, index)
+  with open(path, 'rb') as fin, open(output, 'wb') as fout:
+    return annotate_lines(read_lines(fin, start, end), go_table, fout, table)
+
+def annotate(path, mapping, output, index = None, processes = 1, table = 'tblout'):
+  '''
+  annotate the hits of the hmmer table path with GO terms of the mapping file into output,
+  returns the number of hits and annotated hits
+  '''
+  go_table = goindex.load(mapping, index)
+  with open(output, 'wb') as fout:
+    fout.write(HEADER.encode('ascii'))
+    if processes == 1 or detect(path) is not None or not os.path.isfile(path):
+      # compressed tables and streams are annotated in one pass
+      with open_input(path) as fin:
+        return annotate_lines(fin, go_table, fout, table)
+    # annotate the chunks in parallel and append their parts in order
+    tasks = [(path, start, end, mapping, index, '%s.part%04d' % (output, i), table)
+             for i, (start, end) in enumerate(line_ranges(path, processes * 4))]
+    hits = annotated = 0
+    # multiprocessing is only imported for parallel runs, it slows down the start of small jobs
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+      for task, counts in zip(tasks, pool.imap(annotate_chunk, tasks)):
+        copy_file(task[5], fout)
+        os.remove(task[5])
+        hits += counts[0]
+        annotated += counts[1]
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+  return hits, annotated
@@ -0,0 +1,182 @@
+'''
+cache for the pipeline stages: every stage writes a manifest with the fingerprints (size,
+mtime and inode) of its inputs, its parameters and the tool version. A rerun with --resume
+skips stages with a matching manifest and reuses their outputs. With content hashing the
+inputs are addressed by their sha1 instead, which reads every input once more.
+'''
+
+# imports
+import os
+import sys
+import json
+import time
+import hashlib
+
+from metapipeline import __version__, metrics, stats
+
+# block size for hashing
+BLOCK_SIZE = 1 << 24
+# stages of quality_control.py and generate_classify_input.py
+QC_STAGES = ['trimming', 'pe_filtering', 'se_filtering', 'native_trimming']
+CLASSIFY_STAGES = ['concatenation', 'dedup']
+# flash and the duplicate removal with named pipes, measured as one stage (never cached)
+PIPED_STAGES = ['piped_concatenation']
+# file names in manifests are unicode with python 2
+STRING_TYPES = (str, type(u''))
+
+def native_version(engine):
+  '''version string of a native engine'''
+  return 'metapipeline %s %s' % (__version__, engine)
+
+def tool_version(command):
+  '''version string of an external tool: size and mtime of its executable or jar (not its runtime options)'''
+  version = []
+  for item in command.split():
+    if os.path.isfile(item):
+      info = os.stat(item)
+      version.append('%s:%d:%d' % (item, info.st_size, int(info.st_mtime)))
+  return ' '.join(version) or command
+
+def result_files(result):
+  '''all file names in a (nested) stage result'''
+  if isinstance(result, (list, tuple)):
+    return [item for part in result for item in result_files(part)]
+  if isinstance(result, STRING_TYPES):
+    return [result]
+  return []
+
+def partial_name(path):
+  '''temporary name for an output, that is renamed by commit when complete (named pipes are used directly)'''
+  if os.path.exists(path) and not os.path.isfile(path):
+    return path
+  # the extension is kept, it may select the compression
+  return os.path.join(os.path.dirname(path), '.part.%s' % (os.path.basename(path)))
+
+def commit(path):
+  '''move a complete output from its temporary name to its final name'''
+  if partial_name(path) != path:
+    os.rename(partial_name(path), path)
+  return path
+
+class StageCache(object):
+  '''manifests of the stages of one run in directory'''
+
+  def __init__(self, directory, resume = False, force = None, recorder = None, content = False):
+    self.directory = directory
+    self.resume = resume
+    # inputs are addressed by the hash of their content instead of their fingerprint
+    self.content = content
+    self.force = set(force or [])
+    # every stage is measured, if a metrics recorder is given
+    self.recorder = recorder
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    # hashes of files, that are valid while size and mtime do not change
+    self.digests = self.load('digests') or {}
+
+  def load(self, name):
+    '''read a json file of the cache directory, None if it does not exist'''
+    try:
+      with open(self.directory + os.sep + name + '.json') as fin:
+        return json.load(fin)
+    except (IOError, ValueError):
+      return None
+
+  def reusable(self, stage):
+    '''True if the stage may be reused (with resume, not forced and with a manifest of a previous run)'''
+    return self.resume and stage not in self.force and self.load(stage) is not None
+
+  def fingerprint(self, path):
+    '''size, mtime and inode of path'''
+    info = os.stat(path)
+    return '%d:%r:%d:%d' % (info.st_size, info.st_mtime, info.st_dev, info.st_ino)
+
+  def address(self, path):
+    '''address of an input: its sha1 with content hashing, else its fingerprint'''
+    return self.digest(path) if self.content else self.fingerprint(path)
+
+  def save_digests(self):
+    '''write the hashes of the files, once per stage'''
+    if self.content:
+      metrics.write_atomic(self.directory + os.sep + 'digests.json', json.dumps(self.digests))
+
+  def digest(self, path):
+    '''sha1 of the content of path'''
+    info = os.stat(path)
+    key = os.path.abspath(path)
+    entry = self.digests.get(key)
+    if entry is not None and entry[0] == info.st_size and entry[1] == info.st_mtime:
+      return entry[2]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as fin:
+      for block in iter(lambda: fin.read(BLOCK_SIZE), b''):
+        sha.update(block)
+    self.digests[key] = [info.st_size, info.st_mtime, sha.hexdigest()]
+    return sha.hexdigest()
+
+  def key(self, stage, inputs, params, tool):
+    '''content address of a stage run'''
+    description = {'stage': stage,
+                   'inputs': [self.address(item) for item in inputs],
+                   'params': params,
+                   'tool': tool}
+    return hashlib.sha1(json.dumps(description, sort_keys = True).encode('utf-8')).hexdigest()
+
+  def intact(self, outputs):
+    '''True if all outputs still have the size and mtime recorded in the manifest'''
+    for path, (size, mtime) in outputs.items():
+      if not os.path.isfile(path):
+        return False
+      info = os.stat(path)
+      if info.st_size != size or info.st_mtime != mtime:
+        return False
+    return True
+
+  def run(self, stage, inputs, params, tool, func):
+    '''
+    return the result of func(), the stage, unless the manifest of a previous run matches
+    its inputs, params and tool and its outputs are intact (with resume)
+    '''
+    if self.recorder is None:
+      return self.execute(stage, inputs, params, tool, func)
+    result = []
+    with self.recorder.stage(stage, inputs, lambda: result_files(result)):
+      result.append(self.execute(stage, inputs, params, tool, func))
+    return result[0]
+
+  def execute(self, stage, inputs, params, tool, func):
+    '''run or reuse the stage'''
+    if not all(os.path.isfile(item) for item in inputs):
+      # streamed inputs cannot be addressed
+      return func()
+    key = self.key(stage, inputs, params, tool)
+    self.save_digests()
+    manifest_path = self.directory + os.sep + stage + '.json'
+    manifest = self.load(stage)
+    if self.resume and stage not in self.force and manifest is not None \
+       and manifest['key'] == key and self.intact(manifest['outputs']):
+      sys.stdout.write('Reusing %s results of a previous run\n' % (stage))
+      metrics.reused()
+      # the read statistics of the outputs are not counted again
+      stats.RECORDED.extend(manifest.get('stats', []))
+      return manifest['result']
+    # invalidate before running, so an interrupted run never leaves a matching manifest
+    if manifest is not None:
+      os.remove(manifest_path)
+    started = time.time()
+    recorded = len(stats.RECORDED)
+    result = func()
+    outputs = result_files(result)
+    if outputs and all(os.path.isfile(item) for item in outputs):
+      metrics.write_atomic(manifest_path, json.dumps({'stage': stage,
+                                                      'key': key,
+                                                      'params': params,
+                                                      'tool': tool,
+                                                      'inputs': dict((item, self.address(item)) for item in inputs),
+                                                      'outputs': dict((item, [os.stat(item).st_size, os.stat(item).st_mtime])
+                                                                      for item in outputs),
+                                                      'result': result,
+                                                      'stats': stats.RECORDED[recorded:],
+                                                      'runtime': time.time() - started},
+                                                     indent = 2, sort_keys = True))
+    return result
@@ -0,0 +1,34 @@
+'''
+single entry point of the pipeline: python -m metapipeline <command> [options], the module
+of a command is imported only when it runs, so starting a small job does not pay for the
+imports of the other commands (e.g. multiprocessing, numpy)
+'''
+
+# imports
+from argparse import ArgumentParser, RawDescriptionHelpFormatter, REMAINDER
+from importlib import import_module
+
+# command: (module in metapipeline.commands, description)
+COMMANDS = [('qc', 'qc', 'quality control of paired end reads'),
+            ('classify-input', 'classify_input', 'merge the read pairs and remove duplicates'),
+            ('run', 'run', 'run all stages of one sample or a sample sheet'),
+            ('pfam2go', 'pfam2go', 'annotate pfam hits with GO terms'),
+            ('relabel', 'relabel', 'relabel fasta headers of many samples for qiime'),
+            ('export-fastq', 'export_fastq', 'export read stores as fastq'),
+            ('taxonomy-db', 'taxonomy_db', 'generate the taxonomy db of a blast db in parallel')]
+
+def command(name):
+  '''main function of a command'''
+  module = dict((item[0], item[1]) for item in COMMANDS)[name]
+  return import_module('metapipeline.commands.' + module).main
+
+def main(argv = None):
+  parser = ArgumentParser(prog = 'metapipeline', description = 'metapipeline -- commands of the pipeline',
+                          epilog = 'commands:\n' + '\n'.join('%-16s %s' % (name, help) for name, module, help in COMMANDS),
+                          formatter_class = RawDescriptionHelpFormatter)
+  parser.add_argument('command', choices = [name for name, module, help in COMMANDS],
+                      help = 'command to run, see metapipeline <command> -h')
+  parser.add_argument('args', nargs = REMAINDER,
+                      help = 'options and arguments of the command')
+  args = parser.parse_args(argv)
+  return command(args.command)(args.args, 'metapipeline ' + args.command)
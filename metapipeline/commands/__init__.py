@@ -0,0 +1,11 @@
+'''
+commands of the metapipeline cli, every module has a main(argv, prog), that parses the
+arguments of the command and runs it in the calling process:
+	- qc: quality control of paired end reads (quality_control.py)
+	- classify_input: merging of the pairs and removal of duplicates (generate_classify_input.py)
+	- run: all stages of one sample or a sample sheet (meta-pipeline.py)
+	- pfam2go: GO annotation of pfam hits (pfam2go.py)
+	- relabel: qiime labels for the fasta headers of many samples (relabel_fasta_header.py)
+	- export_fastq: export of read stores as fastq (export_fastq.py)
+	- taxonomy_db: parallel generation of the taxonomy db (create_taxonomyDB.py)
+'''
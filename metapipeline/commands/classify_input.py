@@ -0,0 +1,460 @@
+'''
+little wrapper to run flash on the paired end reads to enlength the sequences and add remaining single end
+reads to the output. Also removes duplicates
+ATTENTION: Remove duplicates destroys fastq and fasta header
+'''
+#@author: Philipp Sehnert
+#@contact: philipp.sehnert[a]gmail.com
+
+# global imports
+import sys, os
+from argparse import ArgumentParser
+import subprocess
+import shlex
+import hashlib
+import threading
+
+from metapipeline.concat import cat_files, stream_into, interleave_into, discard_fifos, make_fifo, release_fifo, BackgroundWriter
+from metapipeline.cache import StageCache, CLASSIFY_STAGES, PIPED_STAGES, tool_version, native_version, partial_name, commit
+from metapipeline.tools import FLASH, COLLAPSER, FLASH_PROGRESS, Tool
+from metapipeline.fastq import extract_readname
+from metapipeline.compress import ToolFiles, open_input, open_output, detect, extension
+from metapipeline.hostprofile import stage_threads
+from metapipeline import metrics, stats
+
+# overlap parameters of flash and the native merger
+MIN_OVERLAP = 10
+MAX_OVERLAP = 200
+FLASH_PARAMS = '-m %d -M %d' % (MIN_OVERLAP, MAX_OVERLAP)
+# columns of the lanes of a sample, in classify.nodup.lanes.tsv
+LANES_HEADER = 'lane\tdigest\treverse_complement\treads\tuniques\tnew\n'
+
+def flash_command(input, outputdir, threads):
+  '''command line of flash for the paired end reads'''
+  return shlex.split('%s %s --interleaved-output -o concat -d %s -t %d %s %s' % (FLASH,
+                                                                                 FLASH_PARAMS,
+                                                                                 outputdir,
+                                                                                 threads,
+                                                                                 input[0],
+                                                                                 input[1]))
+
+def concatenation_log(summary, outputdir, result, count = True):
+  '''summarize the merging of the pairs on stdout, in flash.log and in the read statistics'''
+  if count:
+    # every combined pair is one read, the not combined pairs stay two reads
+    metrics.count(2 * summary['total'], summary['combined'] + 2 * summary['uncombined'])
+  if 'lengths' in summary:
+    # the native merger counted the reads while it wrote them
+    stats.record('concat', result[0], summary['lengths']['extended'])
+    stats.record('not_combined', result[1], summary['lengths']['not_combined'])
+  else:
+    stats.record('concat', result[0], reads = summary['combined'])
+    stats.record('not_combined', result[1], reads = 2 * summary['uncombined'])
+  # create outputmsg
+  msg = 'Concatiniation complete:\n\
+         Input reads: %d\n\
+         Concatinated reads %d \n\
+         Not concationated: %d\n\
+         Percentage: %d\n' % (summary['total'], summary['combined'], summary['uncombined'], 
+                              0.0 if summary['combined'] == 0 else round(summary['combined']*100/summary['total'], 4))
+  # create log file and write output 
+  log = outputdir + os.sep + 'flash.log'
+  with open(log,'w') as log:
+    log.write(msg)
+  log.close()
+  # print piped output on stdout
+  sys.stdout.write(msg)
+
+def concatenation(input, outputdir, threads, compression = None, engine = 'flash'):
+  '''wrapper for concatination of paired end reads with flash'''
+  sys.stdout.write('Concatination of paired end reads ...\n')
+  # concatinated and not concatinated files
+  result = [outputdir + os.sep + 'concat.extendedFrags.fastq' + extension(compression),
+            outputdir + os.sep + 'concat.notCombined.fastq' + extension(compression)]
+  metrics.threads(threads, engine)
+  if engine == 'native':
+    concatenation_log(native_merging(input, result, threads), outputdir, result)
+    return result
+  # compressed files are (de)compressed in parallel through named pipes,
+  # that get the names of the flash outputs
+  files = ToolFiles(outputdir, threads)
+  for item in result:
+    files.output(item)
+  # Call flash on paired end reads
+  # every processed pair is two reads
+  concat = Tool(flash_command([files.input(item) for item in input], outputdir, threads), FLASH_PROGRESS, 2)
+  concat.wait()
+  files.close()
+  concatenation_log(metrics.parse_flash(concat.stdout), outputdir, result)
+  # return concatinated and not concatinated files
+  return result
+
+def native_merging(input, result, threads):
+  '''
+  merge the read pairs without flash into the extendedFrags and notCombined outputs,
+  that are written like flash --interleaved-output (they may be named pipes)
+  '''
+  # numpy is only needed for the native engine
+  from metapipeline import merger
+  # files are written under a temporary name and renamed when complete
+  outputs = [partial_name(item) for item in result]
+  if threads > 1 and all(os.path.isfile(item) and detect(item) is None for item in input):
+    # merge record aligned shards of the input in parallel and write them in order
+    summary = merger.merge_paired_sharded(input, outputs, threads, MIN_OVERLAP, MAX_OVERLAP)
+  else:
+    # streamed or compressed inputs are merged in one pass, the outputs are written in the background
+    with open_input(input[0], threads) as forward, open_input(input[1], threads) as reverse, \
+         BackgroundWriter(open_output(outputs[0], threads)) as extended, \
+         BackgroundWriter(open_output(outputs[1], threads)) as not_combined:
+      summary = merger.merge_paired([forward, reverse], extended, not_combined, MIN_OVERLAP, MAX_OVERLAP)
+  for item in result:
+    commit(item)
+  return summary
+
+def remove_duplicates_log(msg, outputdir, output, lengths = None):
+  '''write the collapser output to stdout and no_dup.log, lengths is the histogram of the output'''
+  msg = metrics.text(msg)
+  summary = metrics.parse_collapser(msg)
+  metrics.count(summary['input_reads'], summary['output_sequences'])
+  if lengths is None:
+    stats.record('nodup', output, reads = summary['output_sequences'])
+  else:
+    stats.record('nodup', output, lengths)
+  log = outputdir + os.sep + 'no_dup.log'
+  # write output to stdout ...
+  sys.stdout.write(msg)
+  # ... and in a logfile
+  with open(log,'w') as log:
+    log.write(msg)
+  log.close()
+
+def remove_duplicates(input, outputdir, pipes = False):
+  '''
+  wrapper function to call fastx_collapser on combined single reads, result will be in fasta format
+  input is a single file or a list of files, that are streamed into the collapser one after another
+  (or all at the same time, if they are named pipes)
+  '''
+  sys.stdout.write('Remove duplicated reads ...\n')
+  # create outputs
+  output = outputdir + os.sep + 'classify.nodup.fasta'
+  if not isinstance(input, list) and detect(input) is not None:
+    # the collapser reads plain files only, compressed files are streamed
+    input = [input]
+  if isinstance(input, list):
+    # call fastx_collapser on stdin and feed all (decompressed) files without combining them on disk
+    duplicates = Tool(shlex.split('%s -Q33 -v -o %s' % (COLLAPSER,
+                                                        partial_name(output))),
+                      stdin = subprocess.PIPE, stderr = None)
+    if pipes:
+      feeder = interleave_into(input, duplicates.stdin)
+    else:
+      feeder = stream_into(input, duplicates.stdin)
+  else:
+    # call fastx_collapser
+    duplicates = Tool(shlex.split('%s -Q33 -v -i %s -o %s' % (COLLAPSER,
+                                                              input,
+                                                              partial_name(output))),
+                      stderr = None)
+    feeder = None
+  duplicates.wait()
+  if feeder is not None:
+    # a failed read of the inputs must not pass as their end
+    feeder.wait()
+  # the output appears, when the collapser succeeded
+  commit(output)
+  # get piped output
+  remove_duplicates_log(duplicates.stdout, outputdir, output)
+  # return created file
+  return output
+
+def native_remove_duplicates(input, outputdir, threads, reverse_complement, memory = None):
+  '''
+  remove duplicates without fastx_collapser, result will be in fasta format like with the collapser
+  the read names of every unique sequence are written to classify.nodup.index.tsv, with a memory
+  cap (MB) the reads are deduplicated by an external sort
+  '''
+  from metapipeline import dedup
+  sys.stdout.write('Remove duplicated reads ...\n')
+  # create outputs
+  output = outputdir + os.sep + 'classify.nodup.fasta'
+  index = outputdir + os.sep + 'classify.nodup.index.tsv'
+  input = input if isinstance(input, list) else [input]
+  if memory is None:
+    reads, uniques, lengths = dedup.remove_duplicates(input, output, index, threads, reverse_complement)
+  else:
+    reads, uniques, lengths, spill = dedup.remove_duplicates_external(input, output, index, memory << 20,
+                                                                      threads, reverse_complement)
+    metrics.spilled(spill['bytes'])
+    sys.stdout.write('Spilled: %d runs, %.1f MB (memory cap %d MB)\n' % (spill['runs'], spill['bytes'] / 1048576.0, memory))
+  remove_duplicates_log('Input: %d sequences (representing %d reads)\nOutput: %d sequences (representing %d reads)\n' % 
+                        (reads, reads, uniques, reads), outputdir, output, lengths)
+  # the setting of the first dedup is kept with the index, lanes merged later have to use it too
+  with open(outputdir + os.sep + 'classify.nodup.lanes.tsv', 'w') as fout:
+    fout.write(LANES_HEADER)
+    fout.write('%s\t-\t%s\t%d\t%d\t%d\n' % (os.path.abspath(outputdir), reverse_complement, reads, uniques, uniques))
+  # return created file
+  return output
+
+def merge_lane(outputdir, sampledir, reverse_complement):
+  '''
+  merge the unique sequences of a new lane (deduplicated in outputdir) into classify.nodup.fasta
+  and classify.nodup.index.tsv of the sample in sampledir, a lane is merged only once, the merged
+  lanes are listed in classify.nodup.lanes.tsv after the first dedup of the sample
+  '''
+  from metapipeline import dedup
+  sys.stdout.write('Merging lane into sample ...\n')
+  lane_index = outputdir + os.sep + 'classify.nodup.index.tsv'
+  output = sampledir + os.sep + 'classify.nodup.fasta'
+  index = sampledir + os.sep + 'classify.nodup.index.tsv'
+  lanes = sampledir + os.sep + 'classify.nodup.lanes.tsv'
+  if os.path.isfile(output) and not os.path.isfile(index):
+    raise RuntimeError('%s has no dedup index, the sample has to be deduplicated with a native engine' % (sampledir))
+  if not os.path.isdir(sampledir):
+    os.makedirs(sampledir)
+  # the lanes merged before are known by the digest of their index
+  with open(lane_index, 'rb') as fin:
+    digest = hashlib.sha1()
+    for block in iter(lambda: fin.read(1 << 24), b''):
+      digest.update(block)
+  merged = []
+  if os.path.isfile(lanes):
+    with open(lanes) as fin:
+      merged = [line.rstrip('\n').split('\t') for line in list(fin)[1:]]
+  if any(lane[1] == digest.hexdigest() for lane in merged):
+    sys.stdout.write('Lane %s was merged before, the sample is unchanged\n' % (os.path.abspath(outputdir)))
+    metrics.reused()
+    return output
+  if any(lane[2] != str(reverse_complement) for lane in merged):
+    raise RuntimeError('the reads of %s were deduplicated %s --reverse_complement' % (sampledir, 'without' if reverse_complement else 'with'))
+  reads, uniques, new, total, sequences, lengths = dedup.merge_index(lane_index, output, index)
+  metrics.count(reads, sequences)
+  # the unique reads of the sample change in its read statistics, not in the ones of the lane
+  stats.record('nodup', output, lengths)
+  stats.replace_rows(sampledir + os.sep + 'read_stats.tsv',
+                     {'sample': os.path.basename(os.path.dirname(os.path.abspath(sampledir))),
+                      'script': 'generate_classify_input'},
+                     [stats.RECORDED.pop()])
+  # the lane is recorded, when the files of the sample are complete
+  with open(lanes, 'a') as fout:
+    if not merged:
+      fout.write(LANES_HEADER)
+    fout.write('%s\t%s\t%s\t%d\t%d\t%d\n' % (os.path.abspath(outputdir), digest.hexdigest(), reverse_complement,
+                                             reads, uniques, new))
+  msg = 'Lane merged:\n\
+         Lane: %d unique sequences (representing %d reads)\n\
+         New sequences: %d\n\
+         Sample: %d sequences (representing %d reads)\n' % (uniques, reads, new, sequences, total)
+  with open(outputdir + os.sep + 'merge.log', 'w') as log:
+    log.write(msg)
+  sys.stdout.write(msg)
+  return output
+
+def piped_concatenation(input, single, outputdir, threads, dedup_engine = 'collapser', reverse_complement = False,
+                        concat_engine = 'flash', dedup_memory = None):
+  '''
+  run flash (or the native merger) and the duplicate removal at the same time, connected by
+  named pipes, input and single may be named pipes as well (e.g. written by quality_control.py)
+  '''
+  sys.stdout.write('Concatination of paired end reads and removing of duplicates ...\n')
+  metrics.threads(threads, '%s+%s' % (concat_engine, dedup_engine))
+  # flash writes into named pipes instead of files
+  concatenated = [make_fifo(outputdir + os.sep + 'concat.extendedFrags.fastq'),
+                  make_fifo(outputdir + os.sep + 'concat.notCombined.fastq')]
+  # compressed inputs are decompressed into named pipes
+  files = ToolFiles(outputdir, threads)
+  try:
+    summary = []
+    errors = []
+    if concat_engine == 'native':
+      def drain():
+        # merge in the background, the duplicate removal reads the pipes
+        try:
+          summary.append(native_merging(input, concatenated, threads))
+        except Exception as error:
+          errors.append(error)
+          # the reads of the pairs are still written
+          discard_fifos(input)
+        # the merger may have failed without opening its outputs
+        for item in concatenated:
+          release_fifo(item)
+    else:
+      # the output of flash is drained while it runs, a full pipe would block it
+      concat = Tool(flash_command([files.input(item) for item in input], outputdir, threads), FLASH_PROGRESS, 2)
+      def drain():
+        try:
+          concat.wait()
+          summary.append(metrics.parse_flash(concat.stdout))
+        except Exception as error:
+          errors.append(error)
+          # flash may have failed before reading all pairs, that are still written
+          discard_fifos(input)
+        # flash may have failed without opening its outputs
+        for item in concatenated:
+          release_fifo(item)
+    drainer = threading.Thread(target = drain)
+    drainer.start()
+    # all flash outputs and the single end reads are read at the same time
+    reads = concatenated + ([single] if single else [])
+    if dedup_engine in ('native', 'external'):
+      output = native_remove_duplicates(reads, outputdir, threads, reverse_complement,
+                                        dedup_memory if dedup_engine == 'external' else None)
+    else:
+      output = remove_duplicates(reads, outputdir, pipes = True)
+    drainer.join()
+    files.close()
+    if errors:
+      # the duplicate removal read incomplete pairs, its outputs are not kept
+      for item in (output, outputdir + os.sep + 'classify.nodup.index.tsv'):
+        if os.path.isfile(item):
+          os.remove(item)
+      raise errors[0]
+    # the reads of the combined stage are counted by the duplicate removal
+    concatenation_log(summary[0], outputdir, concatenated, count = False)
+  finally:
+    # remove the named pipes
+    for item in concatenated:
+      os.remove(item)
+
+  return output
+
+def main(argv = None, prog = None):
+
+  # Setup cmd interface
+  parser = ArgumentParser(prog = prog, description = '%s -- concatination with Flash and removing of duplicates from resolving single end reads' % 
+                          (prog or os.path.basename(sys.argv[0])),
+                          epilog = 'created by Philipp Sehnert',
+                          add_help = True)
+  parser.add_argument('--version', action = 'version', version = '%s 1.0' % 
+                      (prog or os.path.basename(sys.argv[0])))
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1, required = True,
+                      help = 'specify the number of cpu to be used')
+  parser.add_argument('-o', dest = 'output', default = '.',
+                      help = 'location for output files (default = .)')
+  parser.add_argument('--stage_threads', type = stage_threads, dest = 'stage_threads', action = 'append', default = [],
+                      help = 'number of cpu of one stage as <stage>=<threads> instead of -t (can be repeated)')
+  parser.add_argument('-s', dest = 'single',
+                      help = 'include single end reads remaining after quality control')
+  parser.add_argument('--virtual_concat', dest = 'virtual_concat', action = 'store_true', default = False,
+                      help = 'stream all reads into the collapser without writing classify.fastq')
+  parser.add_argument('--concat_engine', dest = 'concat_engine', default = 'flash', choices = ['flash', 'native'],
+                      help = 'merge the read pairs with flash or the native overlap merger (default = flash)')
+  parser.add_argument('--dedup_engine', dest = 'dedup_engine', default = 'collapser', choices = ['collapser', 'native', 'external'],
+                      help = 'remove duplicates with fastx_collapser, the native hash based engine or the native external sort (default = collapser)')
+  parser.add_argument('--dedup_memory', type = int, dest = 'dedup_memory', default = 1024,
+                      help = 'external dedup engine: memory cap in MB for buffered reads, the rest is spilled to disk (default = 1024)')
+  parser.add_argument('--reverse_complement', dest = 'reverse_complement', action = 'store_true', default = False,
+                      help = 'native engines: treat a read and its reverse complement as duplicates')
+  parser.add_argument('--pipes', dest = 'pipes', action = 'store_true', default = False,
+                      help = 'run flash and the collapser at the same time connected by named pipes, inputs may be named pipes')
+  parser.add_argument('--compress', dest = 'compress', default = 'none', choices = ['none', 'gzip', 'zstd', 'store'],
+                      help = 'write the flash outputs compressed with a fast level or as read stores, inputs are detected (default = none)')
+  parser.add_argument('--bin_qualities', dest = 'bin_qualities', action = 'store_true', default = False,
+                      help = 'read stores: bin the qualities to the 8 Illumina levels (lossy, smaller stores)')
+  parser.add_argument('--merge_into', dest = 'merge_into', default = None,
+                      help = 'native engines: merge the unique sequences into the classify input of a sample in this folder (a new lane of the sample)')
+  parser.add_argument('--cache_dir', dest = 'cache_dir', default = None,
+                      help = 'location of the stage manifests (default = <output>/.cache)')
+  parser.add_argument('--resume', dest = 'resume', action = 'store_true', default = False,
+                      help = 'skip stages, whose inputs, parameters and tool are unchanged since the last run')
+  parser.add_argument('--hash_inputs', dest = 'hash_inputs', action = 'store_true', default = False,
+                      help = 'address the inputs of the stages by the sha1 of their content instead of their size, mtime and inode (reads every input once more)')
+  parser.add_argument('--force-stage', dest = 'force_stage', action = 'append', default = [], choices = CLASSIFY_STAGES,
+                      help = 'run this stage again, even if it could be resumed (can be repeated)')
+  parser.add_argument('--metrics', dest = 'metrics', default = None,
+                      help = 'prefix of the json and tsv run report with time, memory and throughput per stage (default = <output>/metrics)')
+  parser.add_argument('--prometheus', dest = 'prometheus', default = None,
+                      help = 'also export the run report to this Prometheus textfile')
+  parser.add_argument('--sample', dest = 'sample', default = None,
+                      help = 'name of the sample in the run report and the read statistics (default = name of the first input file)')
+  parser.add_argument('--read_stats', dest = 'read_stats', default = None,
+                      help = 'tsv with the reads of every written file, bases and read lengths with native engines (default = <output>/read_stats.tsv)')
+  parser.add_argument('input', nargs = '+', action = 'store', 
+                      help = 'paired end input files in <fastq> format')
+  
+  # get arguments of cmd
+  args = parser.parse_args(argv)
+  # define first inputs
+  input = args.input
+  single = args.single
+  compression = None if args.compress == 'none' else args.compress
+  # binned qualities change the content of read stores
+  binning = ['binned'] if compression == 'store' and args.bin_qualities else []
+  if args.merge_into and args.dedup_engine == 'collapser':
+    parser.error('--merge_into needs the dedup index of a native engine (--dedup_engine native or external)')
+  for stage, count in args.stage_threads:
+    if stage not in CLASSIFY_STAGES + PIPED_STAGES:
+      parser.error('--stage_threads: unknown stage %s (choose from %s)' % (stage, ', '.join(CLASSIFY_STAGES + PIPED_STAGES)))
+  # threads of every stage, -t unless given per stage
+  threads = dict((stage, dict(args.stage_threads).get(stage, args.threads)) for stage in CLASSIFY_STAGES + PIPED_STAGES)
+
+  # create output dir
+  try:
+    os.makedirs(args.output)
+  except OSError:
+    # if dir exists and is dir go ahead
+    if not os.path.isdir(args.output):
+      raise
+
+  # wall time, cpu time, memory and throughput of every stage
+  recorder = metrics.Recorder({'sample': args.sample or extract_readname(input, 0), 'script': 'generate_classify_input'})
+  stats.reset()
+  if binning:
+    # numpy is only needed for read stores
+    from metapipeline import readstore
+    readstore.BIN_QUALITIES = True
+  def add_lane():
+    # the new lane is merged into its sample as a stage of its own
+    with recorder.stage('lane_merge', [args.output + os.sep + 'classify.nodup.index.tsv'],
+                        lambda: [args.merge_into + os.sep + 'classify.nodup.fasta']):
+      return merge_lane(args.output, args.merge_into, args.reverse_complement)
+  try:
+    if args.pipes:
+      # stream from flash into the collapser without intermediate files, measured as one stage
+      with recorder.stage('piped_concatenation', input + ([single] if single else []),
+                          lambda: [args.output + os.sep + 'classify.nodup.fasta']):
+        input = piped_concatenation(input, args.single, args.output, threads['piped_concatenation'],
+                                    args.dedup_engine, args.reverse_complement, args.concat_engine,
+                                    args.dedup_memory)
+      if args.merge_into:
+        input = add_lane()
+      sys.stdout.write('Generation of classify input complete.\nresult: %s' % (input))
+      return 0
+    # manifests of finished stages, that are reused with --resume
+    cache = StageCache(args.cache_dir or args.output + os.sep + '.cache', args.resume, args.force_stage, recorder,
+                       args.hash_inputs)
+    # call flash
+    input = cache.run('concatenation', input, [FLASH_PARAMS, compression] + binning,
+                      native_version('merger') if args.concat_engine == 'native' else tool_version(FLASH),
+                      lambda: concatenation(input, args.output, threads['concatenation'], compression, args.concat_engine))
+    # extend flash results with single end reads of quality control
+    input.append(args.single) if args.single else None
+    def dereplicate(input):
+      # files can only be combined without recompression, if they use the same codec
+      codecs = set(detect(item) for item in input)
+      if not args.virtual_concat and len(codecs) == 1:
+        # combine all reads in one file
+        sys.stdout.write('Combining all reads ...\n')
+        input = cat_files(input, args.output + os.sep + 'classify.fastq' + extension(codecs.pop()))
+      # remove duplicated from that file and convert to fasta
+      if args.dedup_engine in ('native', 'external'):
+        metrics.threads(threads['dedup'], args.dedup_engine)
+        return [native_remove_duplicates(input, args.output, threads['dedup'], args.reverse_complement,
+                                         args.dedup_memory if args.dedup_engine == 'external' else None),
+                args.output + os.sep + 'classify.nodup.index.tsv']
+      # the collapser runs single threaded
+      metrics.threads(1, args.dedup_engine)
+      return [remove_duplicates(input, args.output)]
+    input = cache.run('dedup', input,
+                      [args.dedup_engine, args.reverse_complement],
+                      native_version('dedup') if args.dedup_engine != 'collapser' else tool_version(COLLAPSER),
+                      lambda: dereplicate(input))[0]
+    if args.merge_into:
+      input = add_lane()
+    sys.stdout.write('Generation of classify input complete.\nresult: %s' % (input))
+  except KeyboardInterrupt:
+    sys.stdout.write('\nERROR 1 : Operation cancelled by User!\n')
+    sys.exit(1)
+  finally:
+    # the stages finished so far are reported even if a stage failed, the failed one with error set
+    recorder.write(args.metrics or args.output + os.sep + 'metrics', args.prometheus)
+    stats.write_sidecar(args.read_stats or args.output + os.sep + 'read_stats.tsv', recorder.labels)
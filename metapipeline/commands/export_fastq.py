@@ -0,0 +1,47 @@
+'''
+little script to export read stores (.mprs) written by the pipeline stages with
+--compress store as fastq files
+'''
+
+# imports
+import sys, os
+from argparse import ArgumentParser
+
+from metapipeline.compress import open_input, open_output, detect
+from metapipeline.cache import partial_name, commit
+
+# bytes copied at once
+BLOCK_SIZE = 1 << 24
+
+def export_fastq(input, output, threads):
+  '''write the reads of all inputs in fastq format to output (stdout for None), compressed by its extension'''
+  fout = open_output(partial_name(output), threads) if output else getattr(sys.stdout, 'buffer', sys.stdout)
+  try:
+    for item in input:
+      if detect(item) != 'store':
+        sys.stderr.write('%s is no read store, it is copied as it is\n' % (item))
+      with open_input(item, threads) as fin:
+        for block in iter(lambda: fin.read(BLOCK_SIZE), b''):
+          fout.write(block)
+  finally:
+    if output:
+      fout.close()
+  if output:
+    commit(output)
+    sys.stdout.write('Export complete!\nresult:\n\t%s\n' % (output))
+
+def main(argv = None, prog = None):
+  # Setup cmd interface
+  parser = ArgumentParser(prog = prog, description = '%s -- export read stores as fastq' %
+                          (prog or os.path.basename(sys.argv[0])))
+  parser.add_argument('-o', dest = 'output', default = None,
+                      help = 'fastq file, compressed with the codec of its extension (default = stdout)')
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1,
+                      help = 'specify the number of cpu to be used for compression')
+  parser.add_argument('input', nargs = '+', action = 'store',
+                      help = 'read stores (e.g. r1.filtered.fastq.mprs), exported one after another')
+  # parse cmd arguments
+  args = parser.parse_args(argv)
+
+  export_fastq(args.input, args.output, args.threads)
+  return 0
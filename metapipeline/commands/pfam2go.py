@@ -0,0 +1,111 @@
+'''
+script to create out of a pfam annotation file a new file with go annotation
+'''
+#@author: Philipp Sehnert
+#@contact: philipp.sehnert[a]gmail.com
+
+# IMPORTS
+import sys, os
+from argparse import ArgumentParser
+
+from metapipeline import goindex, annotate
+
+# GLOBAL VARIABLES
+
+def create_go_table(mapping_file, index_file = None):
+    sys.stdout.write('Import Pfam2GO Index from %s\n' % (mapping_file))
+    # memory map the compiled index of the mapping file, that is only
+    # rebuilt if the mapping file changed since the last run
+    go_table = goindex.load(mapping_file, index_file)
+    sys.stdout.write('Loaded %d GO annotations.\n' % (len(go_table)))
+    return(go_table)
+
+def read_pfam_file(pfam_file):
+    # init the pfam dictionary
+    pfam_table = {}
+    sys.stdout.write('Load pfam file: %s\n' % (pfam_file))
+    # open the pfam annotation file
+    with open(pfam_file,'r') as f:
+        # iterate over the file line by line and create key:value pairs
+        for line in f:
+            # ignore commented lines at start
+            if not line.startswith('#'):
+                # remove \n
+                line = line.strip()
+                # split the line into fields
+                fields = line.split()
+                # key = PfamID
+                key = fields[3].split('.',1)[0]
+                # create key:value pair with value = rest of line
+                pfam_table[key] = fields[0:]
+        f.close()
+    sys.stdout.write('Successfully imported %d pfam annotations\n' % (len(pfam_table)))
+    return(pfam_table)
+
+def compare_keys(pfam_table, go_table):
+    sys.stdout.write('Annotate Pfam with GOs.\n')
+    # init count and array for matching key combinations
+    count = 0
+    key_list = []
+    # iterate over pfam annotation keys
+    for key in pfam_table.keys():
+        # compare actual key with key from go table (binary search in the index)
+        if key in go_table:
+            # raise count if combination was found and add key to array
+            count +=1
+            key_list.append(key)
+
+    sys.stdout.write('Successfully annotated %d/%d pfams\n' % (count, len(pfam_table)))
+    return(key_list)
+
+def create_output_table(key_list, pfam_table, go_table, outputfile):
+    # open an output file and create lines with following fields
+    # pfam target_seq GO GO name GO origin e-value score 
+    with open(outputfile,'w') as f:
+        # write header
+        f.write('#pfam \t target_seq \t GO-ID \t GO-Desc \t GO-Tree \t e-value, \t score\n')
+        # for every key in the array create a new line and write it to file
+        for key in key_list:
+            pfam = pfam_table.get(key)
+            go = go_table.get(key)
+            line = [key,pfam[0],go[0], go[1], go[2], pfam[4], pfam[5]]
+            # create tab seperated line in file
+            f.write('\t'.join(map(str,line)))
+            f.write('\n')
+
+def stream_annotation(pfam_file, mapping_file, index_file, outputfile, processes, table):
+    sys.stdout.write('Annotate Pfam hits of %s with GOs.\n' % (pfam_file))
+    # every hit gets one line per GO term of its family, the output is written while reading
+    hits, annotated = annotate.annotate(pfam_file, mapping_file, outputfile, index_file, processes, table)
+    sys.stdout.write('Successfully annotated %d/%d pfam hits\n' % (annotated, hits))
+
+def main(argv = None, prog = None):
+
+    # Setup cmd interface
+    parser = ArgumentParser(prog = prog, description = '%s -- map GO terms to pfam annotation' % 
+                            (prog or os.path.basename(sys.argv[0])),
+                            epilog = 'created by Philipp Sehnert')
+    parser.add_argument('-i', dest = 'pfam', required = True,
+                        help = 'location of pfam input file')
+    parser.add_argument('-o', dest = 'output', required = True, 
+                        help = 'destination for output')
+    parser.add_argument('-m', dest='mapping', required = True,
+                        help = ' loaction of pfam2go mapping file')
+    parser.add_argument('-x', dest='index', default = None,
+                        help = 'location of the compiled mapping index (default = <mapping>.idx)')
+    parser.add_argument('-t', type = int, dest = 'threads', default = 1,
+                        help = 'annotate large pfam files in parallel chunks (default = 1)')
+    parser.add_argument('--format', dest = 'table', default = 'tblout', choices = ['tblout', 'domtblout'],
+                        help = 'hmmer table format of the pfam file (default = tblout)')
+    parser.add_argument('--mode', dest = 'mode', default = 'table', choices = ['table', 'stream'],
+                        help = 'load the last hit per pfam in memory (table) or stream all hits with all GO terms, -t and --format apply to stream (default = table)')
+    # parse arguments from cmd interface
+    args = parser.parse_args(argv)
+
+    if args.mode == 'stream':
+        stream_annotation(args.pfam, args.mapping, args.index, args.output, args.threads, args.table)
+        return 0
+    go = create_go_table(args.mapping, args.index)
+    pfam = read_pfam_file(args.pfam)
+    key_list = compare_keys(pfam,go)
+    create_output_table(key_list,pfam,go,args.output)
@@ -0,0 +1,557 @@
+'''
+litte wrapper script for automated quality improvement of Illumina fastq files in 2 steps:
+- quality based trimming of reads
+- length filtering
+'''
+#@author: Philipp Sehnert
+#@contact: philipp.sehnert[a]gmail.com
+
+# imports
+import sys, os
+from argparse import ArgumentParser
+import shlex
+
+try:
+  from queue import Queue
+except ImportError:
+  from Queue import Queue
+
+from metapipeline.concat import cat_files, fifo_from, fifo_from_queue, Feeder, BackgroundWriter
+from metapipeline.fastq import extract_readname
+from metapipeline.cache import StageCache, QC_STAGES, tool_version, native_version, partial_name, commit
+from metapipeline.tools import TRIMMOMATIC, JAVA_HEAP, with_heap, Tool, LineCounter
+from metapipeline.compress import ToolFiles, open_input, open_output, detect, extension
+from metapipeline.hostprofile import stage_threads
+from metapipeline import metrics, stats, trimworker
+
+# Executables
+trimmomatic = TRIMMOMATIC
+# long-lived trimmomatic worker (trimworker.Client), None starts a jvm per call
+worker = None
+
+def fastq_name(outputdir, input, index, suffix, compression):
+  '''name of an output file of the read file input[index] with the extension of the compression'''
+  return outputdir + os.sep + extract_readname(input, index) + suffix + '.fastq' + extension(compression)
+
+def paired_reads(summary):
+  '''reads in and out of a paired end trimming summary'''
+  return (2 * summary['input'],
+          2 * summary['both'] + summary['forward'] + summary['reverse'])
+
+def run_trimmomatic(mode, threads, trimlog, files, steps, progress = True):
+  '''
+  run trimmomatic in mode (PE or SE) on the input and output files with the steps, on the
+  worker or in a new jvm, returns the summary counts, jobs in the background of another
+  stage do not report progress
+  '''
+  args = ['-threads', str(threads), '-phred33', '-trimlog', trimlog] + files + steps
+  if worker is not None:
+    # the worker may run in another directory
+    args = args[:4] + [os.path.abspath(item) for item in [trimlog] + files] + steps
+    # the trimlog has a line per processed read
+    counter = LineCounter(trimlog) if progress else None
+    try:
+      return worker.submit(mode, args)
+    finally:
+      if counter is not None:
+        counter.stop()
+  tool = Tool(shlex.split(trimmomatic) + [mode] + args, log = trimlog if progress else None)
+  tool.wait()
+  # parse the summary line of trimmomatic
+  return trimworker.PARSERS[mode](tool.stderr)
+
+def trimming(input, outputdir, threads, leading, trailing, sliding_window, singletons, virtual = False, compression = None):
+  '''wrapper for the trimming process with trimmomatic'''
+  sys.stdout.write('Starting quality based trimming with args:\n\
+                    LEADING: %d\n\
+                    TRAILING: %d\n\
+                    SLIDING_WINDOW: %s\n' % (leading, 
+                                             trailing, 
+                                             sliding_window))
+  # get successfull trimmed paired end files
+  result = [fastq_name(outputdir, input, 0, '.trimmed', compression), 
+            fastq_name(outputdir, input, 1, '.trimmed', compression)]
+  # get successfull trimmed but now unpaired files
+  unpaired = [fastq_name(outputdir, input, 0, '.unpaired_after_trimming', compression), 
+              fastq_name(outputdir, input, 1, '.unpaired_after_trimming', compression)]
+  # compressed files are (de)compressed in parallel through named pipes
+  files = ToolFiles(outputdir, threads)
+  # quality based trimming of 3' and 5' ends with sliding window algorithm with trimmomatic
+  summary = run_trimmomatic('PE', threads,
+                            outputdir + os.sep + extract_readname(input, 0) + '.trim.log',
+                            [files.input(str(i)) for i in input] +
+                            [files.output(result[0]),
+                             files.output(unpaired[0]),
+                             files.output(result[1]),
+                             files.output(unpaired[1])],
+                            ['LEADING:%d' % (leading),
+                             'TRAILING:%d' % (trailing),
+                             'SLIDINGWINDOW:%s' % (sliding_window)])
+  files.close()
+  metrics.threads(threads, 'trimmomatic')
+  metrics.count(*paired_reads(summary))
+  for item in input:
+    stats.record('raw', item, reads = summary['input'])
+  # new cmd output
+  sys.stdout.write('Input Reads: %d          \n\
+                    Both Surviving: %d - %5.2f%%  \n\
+                    Forward only: %d - %5.2f%%    \n\
+                    Reverse only: %d  - %5.2f%%   \n\
+                    Filtered out: %d - %5.2f%%    \n' % (summary['input'], 
+                                                         summary['both'], 
+                                                         0.0 if summary['both'] == 0 else round(summary['both']*100/summary['input'],2),
+                                                         summary['forward'], 
+                                                         0.0 if summary['forward'] == 0 else round(summary['forward']*100/summary['input'],2),
+                                                         summary['reverse'], 
+                                                         0.0 if summary['reverse'] == 0 else round(summary['reverse']*100/summary['input'],2),
+                                                         summary['dropped'], 
+                                                         0.0 if summary['dropped'] == 0 else round(summary['dropped']*100/summary['input'],2))
+                        )
+  if singletons and virtual:
+    # hand over the forward and reverse only reads without combining them
+    single = unpaired
+  elif singletons:
+    # cat forward and reverse only reads for length filtering
+    single = cat_files(unpaired, fastq_name(outputdir, input, 0, '.single_tmp.trimmed', compression))
+  else:
+    single = None
+  
+  # retrun paired and single results
+  return [result, single]
+
+def length_filtering_PE(input, outputdir, threads, minlength, singletons, virtual = False, compression = None):
+  '''wrapper for trimmomatic length filtering'''
+  sys.stdout.write('Starting length filtering for PE with args:\nMINLEN: %d\n' % (minlength))
+  # get successfull filtered reads
+  result = [fastq_name(outputdir, input, 0, '.filtered', compression),
+            fastq_name(outputdir, input, 1, '.filtered', compression)]
+  # get unpaired reads remaining after filtering
+  unpaired = [fastq_name(outputdir, input, 0, '.unpaired_after_filtering', compression),
+              fastq_name(outputdir, input, 1, '.unpaired_after_filtering', compression)]
+  # compressed files are (de)compressed in parallel through named pipes
+  files = ToolFiles(outputdir, threads)
+  # paired end length filtering of reads with trimmomatic
+  summary = run_trimmomatic('PE', threads,
+                            outputdir + os.sep + extract_readname(input, 0) + '.filtered.log',
+                            [files.input(str(i)) for i in input] +
+                            [files.output(result[0]),
+                             files.output(unpaired[0]),
+                             files.output(result[1]),
+                             files.output(unpaired[1])],
+                            ['MINLEN:%d' % (minlength)])
+  files.close()
+  metrics.threads(threads, 'trimmomatic')
+  metrics.count(*paired_reads(summary))
+  for item in result:
+    stats.record('paired', item, reads = summary['both'])
+  # new cmd output
+  sys.stdout.write('Input Reads: %d              \n\
+                    Both Surviving: %d - %5.2f%% \n\
+                    Forward only: %d - %5.2f%%   \n\
+                    Reverse only: %d  - %5.2f%%  \n\
+                    Filtered out: %d - %5.2f%%   \n' % (summary['input'], 
+                                                        summary['both'], 
+                                                        0.0 if summary['both'] == 0 else round(summary['both']*100/summary['input'],2),
+                                                        summary['forward'], 
+                                                        0.0 if summary['forward'] == 0 else round(summary['forward']*100/summary['input'],2),
+                                                        summary['reverse'], 
+                                                        0.0 if summary['reverse'] == 0 else round(summary['reverse']*100/summary['input'],2),
+                                                        summary['dropped'], 
+                                                        0.0 if summary['dropped'] == 0 else round(summary['dropped']*100/summary['input'],2))
+                  ) 
+  # if processing of singletons is switched on, then combine the unpaired reads
+  if singletons and virtual:
+    single = unpaired
+  elif singletons:
+    single = cat_files(unpaired, fastq_name(outputdir, input, 0, '.single_tmp.filtered', compression))
+  else:
+    single = None
+  # return filtered and single end reads 
+  return [result, single]
+
+def filter_single(input, result, trimlog, outputdir, threads, minlength, progress = True):
+  '''trimmomatic length filtering of the single end reads input into result, returns the summary counts'''
+  # compressed files are (de)compressed in parallel through named pipes
+  files = ToolFiles(outputdir, threads)
+  summary = run_trimmomatic('SE', threads, trimlog,
+                            [files.input(input), files.output(result)],
+                            ['MINLEN:%d' % (minlength)], progress)
+  files.close()
+  return summary
+
+def length_filtering_SE(input, outputdir, threads, minlength, compression = None):
+  # do length filtering for single end reads
+  sys.stdout.write('Starting length filtering for SE with args:\nMINLEN: %d\n' % (minlength))
+  result = fastq_name(outputdir, [input], 0, '.single.filtered', compression)
+  summary = filter_single(input, result, outputdir + os.sep + extract_readname([input], 0) + '.single.log',
+                          outputdir, threads, minlength)
+  # the singletons filtered in the background (SingleFiltering) ran during the paired end
+  # filtering, their threads are not reported
+  metrics.threads(threads, 'trimmomatic')
+  return single_summary(result, summary)
+
+def single_summary(result, summary):
+  '''count and report the single end reads of the length filtering'''
+  metrics.count(summary['input'], summary['surviving'])
+  stats.record('single', result, reads = summary['surviving'])
+  # new cmd output
+  sys.stdout.write('Input Reads: %d\nSurviving: %d - %5.2f%%\nFiltered out: %d - %5.2f%%\n' % (summary['input'], 
+                                                                                               summary['surviving'], 
+                                                                                               0.0 if summary['surviving'] == 0 else round(summary['surviving']*100/summary['input'],2),
+                                                                                               summary['dropped'], 
+                                                                                               0.0 if summary['dropped'] == 0 else round(summary['dropped']*100/summary['input'],2))
+                  )
+  # return successfull filtered single end reads
+  return result
+
+class SingleFiltering(object):
+  '''
+  length filtering of single end read files in one background trimmomatic job, that starts
+  with the first files (the singletons of the trimming while the paired end reads are
+  filtered): the files are streamed in the order they are added through a named pipe and the
+  job writes the result of the single end reads and its trimlog directly
+  '''
+
+  def __init__(self, outputdir, name, threads, minlength, compression = None):
+    self.outputdir = outputdir
+    self.name = name
+    # the job shares the cpus with the paired end filtering
+    self.threads = max(1, threads // 2)
+    self.minlength = minlength
+    self.compression = compression
+    self.result = fastq_name(outputdir, [name], 0, '.single.filtered', compression)
+    self.trimlog = outputdir + os.sep + name + '.single.log'
+    # lists of files to filter, None ends the stream
+    self.queue = Queue()
+    # feeders of the named pipe and of the job, None until the first files are added
+    self.feeder = None
+    self.job = None
+    self.summary = []
+
+  def add(self, input):
+    '''filter the single end read files input after the files added before'''
+    if self.job is None:
+      self.feeder = fifo_from_queue(self.queue, fastq_name(self.outputdir, [self.name], 0, '.single', None))
+      def run():
+        self.summary.append(filter_single(self.feeder.name, self.result, self.trimlog,
+                                          self.outputdir, self.threads, self.minlength, False))
+      self.job = Feeder()
+      self.job.start(run)
+    self.queue.put(list(input))
+
+  def wait(self):
+    '''end the stream and wait for the job, raises the error of the job before the one of the pipe'''
+    self.queue.put(None)
+    errors = []
+    try:
+      self.job.wait()
+    except Exception as e:
+      errors.append(e)
+      # the job may have ended without reading the pipe to its end, the writer must not wait for it forever
+      for thread in self.feeder.threads:
+        while thread.is_alive():
+          os.close(os.open(self.feeder.name, os.O_RDONLY | os.O_NONBLOCK))
+          thread.join(0.1)
+    try:
+      self.feeder.wait()
+    except Exception as e:
+      errors.append(e)
+    os.remove(self.feeder.name)
+    self.job = None
+    if errors:
+      raise errors[0]
+
+  def merge(self):
+    '''wait for the job, returns the result of the single end reads'''
+    sys.stdout.write('Starting length filtering for SE with args:\nMINLEN: %d\n' % (self.minlength))
+    self.wait()
+    return single_summary(self.result, self.summary[0])
+
+  def discard(self):
+    '''stop a running job and remove its outputs (e.g. if the paired end filtering failed)'''
+    if self.job is None:
+      return
+    try:
+      self.wait()
+    except Exception:
+      pass
+    for item in (self.result, self.trimlog):
+      if os.path.exists(item):
+        os.remove(item)
+
+def native_trimming(input, outputdir, threads, leading, trailing, sliding_window, minlength, singletons, compression = None):
+  '''trimming and length filtering of PE and SE reads in one pass without trimmomatic'''
+  # numpy is only needed for the native engine
+  from metapipeline import trimmer
+  sys.stdout.write('Starting native trimming and length filtering with args:\n\
+                    LEADING: %d\n\
+                    TRAILING: %d\n\
+                    SLIDING_WINDOW: %s\n\
+                    MINLEN: %d\n' % (leading,
+                                     trailing,
+                                     sliding_window,
+                                     minlength))
+  # get paired and single end result files
+  result = [fastq_name(outputdir, input, 0, '.filtered', compression),
+            fastq_name(outputdir, input, 1, '.filtered', compression)]
+  single = fastq_name(outputdir, input, 0, '.single.filtered', compression) if singletons else None
+  # files are written under a temporary name and renamed when complete
+  outputs = [partial_name(item) if item is not None else None for item in result + [single]]
+  if threads > 1 and all(os.path.isfile(item) and detect(item) is None for item in input):
+    # process record aligned shards of the input in parallel and merge them in order,
+    # compressed shards are merged as independent gzip members or zstd frames
+    summary = trimmer.trim_paired_sharded(input, outputs, threads,
+                                          leading, trailing, sliding_window, minlength)
+  else:
+    # remaining single end reads are dropped, if singletons are switched off
+    single_out = BackgroundWriter(open_output(outputs[2], threads)) if singletons else None
+    try:
+      # outputs are written in the background, they may be named pipes read in lockstep,
+      # compressed inputs cannot be sharded and are decompressed with all threads instead
+      with open_input(input[0], threads) as forward, open_input(input[1], threads) as reverse, \
+           BackgroundWriter(open_output(outputs[0], threads)) as paired_forward, \
+           BackgroundWriter(open_output(outputs[1], threads)) as paired_reverse:
+        summary = trimmer.trim_paired([forward, reverse],
+                                      [paired_forward, paired_reverse],
+                                      single_out,
+                                      leading, trailing, sliding_window, minlength)
+    finally:
+      if single_out is not None:
+        single_out.close()
+  for item in result + [single]:
+    if item is not None:
+      commit(item)
+  metrics.threads(threads, 'native')
+  metrics.count(*paired_reads(summary))
+  # the reads were counted while they were written
+  lengths = summary['lengths']
+  for kind, item, key in [('raw', input[0], 'input_forward'), ('raw', input[1], 'input_reverse'),
+                          ('paired', result[0], 'forward'), ('paired', result[1], 'reverse'),
+                          ('single', single, 'single')]:
+    if item is not None:
+      stats.record(kind, item, lengths[key])
+  # new cmd output
+  sys.stdout.write('Input Reads: %d          \n\
+                    Both Surviving: %d - %5.2f%%  \n\
+                    Forward only: %d - %5.2f%%    \n\
+                    Reverse only: %d  - %5.2f%%   \n\
+                    Filtered out: %d - %5.2f%%    \n' % (summary['input'],
+                                                         summary['both'],
+                                                         0.0 if summary['both'] == 0 else round(summary['both']*100.0/summary['input'],2),
+                                                         summary['forward'],
+                                                         0.0 if summary['forward'] == 0 else round(summary['forward']*100.0/summary['input'],2),
+                                                         summary['reverse'],
+                                                         0.0 if summary['reverse'] == 0 else round(summary['reverse']*100.0/summary['input'],2),
+                                                         summary['dropped'],
+                                                         0.0 if summary['dropped'] == 0 else round(summary['dropped']*100.0/summary['input'],2))
+                  )
+  # return paired and single results
+  return [result, single]
+
+def main(argv = None, prog = None):
+  global trimmomatic, worker
+  # Setup cmd interface
+  parser = ArgumentParser(prog = prog, description = '%s -- preprocessing of paired end Illumina Reads' % 
+                         (prog or os.path.basename(sys.argv[0])),
+                          epilog = 'created by Philipp Sehnert',
+                          add_help = True)
+  parser.add_argument('--version', action = 'version', version = '%s 1.0' % 
+                     (prog or os.path.basename(sys.argv[0])))
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1, required = True,
+                      help = 'specify the number of cpu to be used')
+  parser.add_argument('-o', dest = 'output', default = '.', required = True,
+                      help = 'location for output files (default = .)')
+  parser.add_argument('--stage_threads', type = stage_threads, dest = 'stage_threads', action = 'append', default = [],
+                      help = 'number of cpu of one stage as <stage>=<threads> instead of -t (can be repeated)')
+  parser.add_argument('--leading', type = int, dest = 'leading', default = 3, required = True,
+                      help = 'Cut bases off the start of a read, if below a threshold quality')
+  parser.add_argument('--trailing', type = int, dest = 'trailing', default = 3, required = True,
+                      help = 'Cut bases off the end of a read, if below a threshold quality')
+  parser.add_argument('--sliding_window', dest = 'sliding_window', default = '4:15', required = True,
+                      help = 'Perform a sliding window trimming, cutting once the average quality within the window falls below a threshold. ')
+  parser.add_argument('--minlength', type = int, dest = 'minlength', default = 150, required = True,
+                      help = 'Drop the read if it is below a specified length')
+  parser.add_argument('--use_no_singletons', dest = 'singletons', action = 'store_false', default = True, 
+                      help = 'permit length filtering of remaining singletons reads')
+  parser.add_argument('--trim_engine', dest = 'trim_engine', default = 'trimmomatic', choices = ['trimmomatic', 'native'],
+                      help = 'use trimmomatic or the native single pass engine for trimming and filtering (default = trimmomatic)')
+  parser.add_argument('--java_heap', dest = 'java_heap', default = None,
+                      help = 'maximum heap of the trimmomatic jvm, e.g. 4G (default = %s)' % (JAVA_HEAP))
+  parser.add_argument('--trimmomatic_worker', dest = 'trimmomatic_worker', action = 'store_true', default = False,
+                      help = 'run all trimmomatic calls in one long-lived jvm instead of a jvm per call')
+  parser.add_argument('--trimmomatic_server', dest = 'trimmomatic_server', default = None,
+                      help = 'submit the trimmomatic calls to a running worker at <host>:<port> (e.g. of meta-pipeline.py)')
+  parser.add_argument('--virtual_concat', dest = 'virtual_concat', action = 'store_true', default = False,
+                      help = 'stream single end reads to the length filtering without writing combined temp files')
+  parser.add_argument('--overlap_singles', dest = 'overlap_singles', action = 'store_true', default = False,
+                      help = 'filter the singletons of the trimming while the paired end reads are filtered and merge the single end results without temp files')
+  parser.add_argument('--compress', dest = 'compress', default = 'none', choices = ['none', 'gzip', 'zstd', 'store'],
+                      help = 'write all outputs compressed with a fast level or as read stores, inputs are detected (default = none)')
+  parser.add_argument('--bin_qualities', dest = 'bin_qualities', action = 'store_true', default = False,
+                      help = 'read stores: bin the qualities to the 8 Illumina levels (lossy, smaller stores)')
+  parser.add_argument('--cache_dir', dest = 'cache_dir', default = None,
+                      help = 'location of the stage manifests (default = <output>/.cache)')
+  parser.add_argument('--resume', dest = 'resume', action = 'store_true', default = False,
+                      help = 'skip stages, whose inputs, parameters and tool are unchanged since the last run')
+  parser.add_argument('--hash_inputs', dest = 'hash_inputs', action = 'store_true', default = False,
+                      help = 'address the inputs of the stages by the sha1 of their content instead of their size, mtime and inode (reads every input once more)')
+  parser.add_argument('--force-stage', dest = 'force_stage', action = 'append', default = [], choices = QC_STAGES,
+                      help = 'run this stage again, even if it could be resumed (can be repeated)')
+  parser.add_argument('--metrics', dest = 'metrics', default = None,
+                      help = 'prefix of the json and tsv run report with time, memory and throughput per stage (default = <output>/metrics)')
+  parser.add_argument('--prometheus', dest = 'prometheus', default = None,
+                      help = 'also export the run report to this Prometheus textfile')
+  parser.add_argument('--sample', dest = 'sample', default = None,
+                      help = 'name of the sample in the run report and the read statistics (default = name of the first input file)')
+  parser.add_argument('--read_stats', dest = 'read_stats', default = None,
+                      help = 'tsv with the reads of every written file, bases and read lengths with native engines (default = <output>/read_stats.tsv)')
+  parser.add_argument('input', nargs = '+', action = 'store', 
+                      help = 'single or paired input files in <fastq> format')
+  # parse cmd arguments
+  args = parser.parse_args(argv)
+  # define input
+  input = args.input
+  compression = None if args.compress == 'none' else args.compress
+  # binned qualities change the content of read stores
+  binning = ['binned'] if compression == 'store' and args.bin_qualities else []
+  for stage, count in args.stage_threads:
+    if stage not in QC_STAGES:
+      parser.error('--stage_threads: unknown stage %s (choose from %s)' % (stage, ', '.join(QC_STAGES)))
+  # threads of every stage, -t unless given per stage
+  threads = dict((stage, dict(args.stage_threads).get(stage, args.threads)) for stage in QC_STAGES)
+  
+ 
+  # create output dir
+  try:
+    os.makedirs(args.output)
+  except OSError:
+    # if dir exists and is dir go ahead
+    if not os.path.isdir(args.output):
+      raise
+
+  # wall time, cpu time, memory and throughput of every stage
+  recorder = metrics.Recorder({'sample': args.sample or extract_readname(input, 0), 'script': 'quality_control'})
+  stats.reset()
+  # manifests of finished stages, that are reused with --resume
+  cache_dir = args.cache_dir or args.output + os.sep + '.cache'
+  cache = StageCache(cache_dir, args.resume, args.force_stage, recorder,
+                     args.hash_inputs)
+  trimmomatic = with_heap(TRIMMOMATIC, args.java_heap)
+  if binning:
+    # numpy is only needed for read stores
+    from metapipeline import readstore
+    readstore.BIN_QUALITIES = True
+  try:
+    if args.trim_engine == 'native':
+      # trimming and length filtering of PE and SE reads in a single pass
+      input = cache.run('native_trimming', input,
+                        [args.leading, args.trailing, args.sliding_window, args.minlength, args.singletons, compression] + binning,
+                        native_version('trimmer'),
+                        lambda: native_trimming(input, args.output, threads['native_trimming'],
+                                                args.leading, args.trailing,
+                                                args.sliding_window, args.minlength,
+                                                args.singletons, compression))
+      # give information about result files
+      sys.stdout.write('Quality control complete!\nresult:\n\t%s\n\t%s\n\t%s\n' % (input[0][0],
+                                                                                   input[0][1],
+                                                                                   input[1]))
+      return 0
+    if args.trimmomatic_server:
+      # jvm of the batch, the access token is inherited from meta-pipeline.py
+      worker = trimworker.Client(args.trimmomatic_server)
+    elif args.trimmomatic_worker:
+      # one jvm for the trimming and the length filtering steps
+      worker = trimworker.Worker(cache_dir + os.sep + 'trimmomatic_worker', args.java_heap or JAVA_HEAP)
+    # start trimming process, the unpaired reads are kept in separate files
+    trimmed = cache.run('trimming', input,
+                        [args.leading, args.trailing, args.sliding_window, args.singletons, compression] + binning,
+                        tool_version(trimmomatic),
+                        lambda: trimming(input, args.output, threads['trimming'],
+                                         args.leading, args.trailing, 
+                                         args.sliding_window, args.singletons, True, compression))
+    # seperate single end reads from trimming
+    trim_single = trimmed[1]
+    singles = None
+    pe_threads = threads['pe_filtering']
+    if args.singletons and args.overlap_singles:
+      # the singletons of the trimming are length filtered while the paired end reads are,
+      # unless the single end stage can be reused anyway
+      singles = SingleFiltering(args.output, extract_readname(trimmed[0], 0), threads['se_filtering'],
+                                args.minlength, compression)
+      if not cache.reusable('se_filtering'):
+        singles.add(trim_single)
+        # both jobs share the threads of the paired end filtering
+        pe_threads = max(1, pe_threads - singles.threads)
+    # filter paired end reads for minlength
+    try:
+      input = cache.run('pe_filtering', trimmed[0],
+                        [args.minlength, args.singletons, compression] + binning,
+                        tool_version(trimmomatic),
+                        lambda: length_filtering_PE(trimmed[0], args.output, pe_threads,
+                                                    args.minlength, args.singletons, True, compression))
+    except:
+      if singles is not None:
+        singles.discard()
+      raise
+    # seperate single end reads
+    filtered_single = input[1]
+    all_singles = None
+    if args.singletons:
+      def filter_singles():
+        if singles is not None:
+          # the singletons of the paired end filtering follow the ones of the trimming
+          if singles.job is None:
+            singles.add(trim_single)
+          singles.add(filtered_single)
+          return singles.merge()
+        feeder = None
+        if args.virtual_concat:
+          # stream all unpaired reads decompressed through a named pipe into the length filtering
+          feeder = fifo_from(trim_single + filtered_single,
+                             fastq_name(args.output, input[0], 0, '.single', None))
+          all_singles_tmp = feeder.name
+        else:
+          # combine all single end reads in one file, compressed files of the same codec
+          # are combined without recompression
+          all_singles_tmp = cat_files(trim_single + filtered_single, 
+                                      fastq_name(args.output, input[0], 0, '.single', compression))
+        # do a length filtereing for all remaining single end reads
+        result = length_filtering_SE(all_singles_tmp,
+                                     args.output,
+                                     threads['se_filtering'],
+                                     args.minlength,
+                                     compression)
+        # clean up not used files, the unpaired files are kept as outputs of their stages
+        try:
+          os.remove(all_singles_tmp)
+        except:
+          sys.stderr.write("Cannot cleanup completly\n")
+        if feeder is not None:
+          # a failed read of the unpaired reads must not pass as their end
+          feeder.wait()
+        return result
+      try:
+        all_singles = cache.run('se_filtering', trim_single + filtered_single,
+                                [args.minlength, compression] + binning,
+                                tool_version(trimmomatic),
+                                filter_singles)
+      finally:
+        if singles is not None:
+          # a job, that was started but not merged, is stopped
+          singles.discard()
+
+    # give information about result files
+    sys.stdout.write('Quality control complete!\nresult:\n\t%s\n\t%s\n\t%s\n' % (input[0][0],
+                                                                                 input[0][1], 
+                                                                                 all_singles))
+
+  except KeyboardInterrupt:
+    sys.stdout.write('\nERROR 1 : Operation cancelled by User!\n')
+    sys.exit(1)
+  finally:
+    if worker is not None:
+      worker.close()
+      worker = None
+    # the stages finished so far are reported even if a stage failed, the failed one with error set
+    recorder.write(args.metrics or args.output + os.sep + 'metrics', args.prometheus)
+    stats.write_sidecar(args.read_stats or args.output + os.sep + 'read_stats.tsv', recorder.labels)
@@ -0,0 +1,65 @@
+'''
+little script to label header for qiime pick_otu.py.
+'''
+#@author: Philipp Sehnert
+#@contact: philipp.sehnert[a]gmail.com
+
+# IMPORTS
+import sys, os
+from argparse import ArgumentParser
+
+from metapipeline import relabel
+from metapipeline.fastq import extract_readname
+
+# GLOBAL VARIABLES
+
+def sample_ids(input, names = None):
+    # use the given names or the names of the files
+    if names is not None:
+        names = names.split(',')
+        if len(names) != len(input):
+            raise ValueError('%d sample ids for %d input files' % (len(names), len(input)))
+    else:
+        names = [extract_readname(input, i) for i in range(len(input))]
+    ids = [relabel.sample_id(name) for name in names]
+    # the reads of every sample need unique labels
+    if len(set(ids)) != len(ids):
+        raise ValueError('sample ids are not unique: %s, use --sample_ids' % (','.join(ids)))
+    return ids
+
+def relabel_header(input, ids, output, mapping, minlength, threads, count_start):
+    sys.stdout.write('Relabel %d fasta files for qiime with args:\nMINLEN: %d\n' % (len(input), minlength))
+    # every file is relabeled in its own process and appended in the order of the input
+    counts = relabel.relabel(input, ids, output, mapping, minlength, threads, count_start)
+    for sample, (records, written) in zip(ids, counts):
+        sys.stdout.write('%s: %d/%d sequences\n' % (sample, written, records))
+    sys.stdout.write('Relabeling complete!\nresult:\n\t%s\n\t%s\n' % (output, mapping))
+
+def main(argv = None, prog = None):
+
+    # Setup cmd interface
+    parser = ArgumentParser(prog = prog, description = '%s -- relabel header for pick_otu.py' %
+                            (prog or os.path.basename(sys.argv[0])),
+                            epilog = 'created by Philipp Sehnert')
+    parser.add_argument('-o', dest = 'output', default = 'seqs.fna',
+                        help = 'combined fasta file with the relabeled reads of all samples (default = seqs.fna)')
+    parser.add_argument('-m', dest = 'mapping', default = None,
+                        help = 'mapping of the new to the old read ids (default = <output>.map.tsv)')
+    parser.add_argument('-t', type = int, dest = 'threads', default = 1,
+                        help = 'relabel this many files in parallel (default = 1)')
+    parser.add_argument('--minlength', type = int, dest = 'minlength', default = 150, required = True,
+                        help = 'Drop the read if it is below a specified length')
+    parser.add_argument('--sample_ids', dest = 'sample_ids', default = None,
+                        help = 'sample ids of the input files (in format \'a,b,c,...\', default = names of the files)')
+    parser.add_argument('--count_start', type = int, dest = 'count_start', default = 0,
+                        help = 'number of the first read of every sample (default = 0)')
+    parser.add_argument('input', nargs = '+', action = 'store',
+                        help = 'fasta files of the samples (e.g. classify.nodup.fasta), may be compressed')
+
+    # parse arguments from cmd interface
+    args = parser.parse_args(argv)
+
+    ids = sample_ids(args.input, args.sample_ids)
+    relabel_header(args.input, ids, args.output, args.mapping or args.output + '.map.tsv',
+                   args.minlength, args.threads, args.count_start)
+    return 0
@@ -0,0 +1,431 @@
+'''
+main script for meta-pipeline, that runs the commands:
+	- qc (quality_control.py)
+	- classify-input (generate_classify_input.py)
+with given parameters, one after another in this process or at the same time in their own.
+'''
+#@author: Philipp Sehnert
+#@contact: philipp.sehnert[a]gmail.com
+
+# global imports
+import sys, os
+import stat
+import errno
+import signal
+from argparse import ArgumentParser, Namespace
+import subprocess
+import shlex
+import time
+
+from metapipeline.concat import make_fifo, release_fifo
+from metapipeline.fastq import extract_readname
+from metapipeline.cache import QC_STAGES, CLASSIFY_STAGES, PIPED_STAGES
+from metapipeline.tools import TRIMMOMATIC, JAVA_HEAP, java_heap, with_heap
+from metapipeline.compress import extension
+from metapipeline import scheduler, metrics, stats, trimworker, hostprofile
+
+# command line of a command running in its own interpreter, the one running this command
+METAPIPELINE = [sys.executable or 'python', '-m', 'metapipeline']
+# folder, that holds the package
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def stage_command(command, arguments):
+  '''command line of a command (e.g. qc) with its arguments'''
+  return METAPIPELINE + [command] + arguments
+
+def find_package():
+  '''let the interpreters of the commands import this package from any working directory'''
+  paths = [item for item in os.environ.get('PYTHONPATH', '').split(os.pathsep) if item]
+  if PACKAGE_PATH not in paths:
+    os.environ['PYTHONPATH'] = os.pathsep.join([PACKAGE_PATH] + paths)
+
+def cache_options(args, stages):
+  '''--resume, --hash_inputs and --force-stage options for the stages of one script'''
+  return '%s %s %s' % ('--resume' if args.resume else '',
+                       '--hash_inputs' if args.hash_inputs else '',
+                       ' '.join('--force-stage %s' % (stage) for stage in args.force_stage if stage in stages))
+
+def sample_options(args):
+  '''--sample option of the scripts, the name may contain spaces'''
+  return ['--sample', args.sample] if args.sample else []
+
+def stage_threads_options(args, stages):
+  '''--stage_threads options for the stages of one script'''
+  return ' '.join('--stage_threads %s=%d' % (stage, threads) for stage, threads in sorted(args.stage_threads.items())
+                  if stage in stages)
+
+def job_cores(args, stages, cores):
+  '''cores of a job running the stages of one script, the most threads of one of its stages'''
+  allocated = [threads for stage, threads in args.stage_threads.items() if stage in stages]
+  return min(max(allocated) if allocated else args.threads, cores)
+
+def profiled_stages(args, streaming):
+  '''(stage, engine) of the stages of a run, streaming runs flash and the duplicate removal as one stage'''
+  if args.trim_engine == 'native':
+    stages = [('native_trimming', 'native')]
+  else:
+    stages = [(stage, 'trimmomatic') for stage in ('trimming', 'pe_filtering', 'se_filtering')]
+  if streaming:
+    return stages + [('piped_concatenation', '%s+%s' % (args.concat_engine, args.dedup_engine))]
+  return stages + [('concatenation', args.concat_engine), ('dedup', args.dedup_engine)]
+
+def quality_outputs(args, input, quality_dir, compress):
+  '''paired and single end (None without singletons) result files of quality_control.py'''
+  suffix = '.fastq' + extension(None if compress == 'none' else compress)
+  paired = [quality_dir + os.sep + extract_readname(input, 0) + '.filtered' + suffix,
+            quality_dir + os.sep + extract_readname(input, 1) + '.filtered' + suffix]
+  single = quality_dir + os.sep + extract_readname(input, 0) + '.single.filtered' + suffix if args.singletons else None
+  return paired, single
+
+def trimmomatic_options(args, server):
+  '''heap, worker and singleton options of quality_control.py, server is the address of the worker of a batch'''
+  return '%s %s %s' % ('--java_heap %s' % (args.java_heap) if args.java_heap else '',
+                       '--trimmomatic_server %s' % (server) if server else
+                       '--trimmomatic_worker' if args.trimmomatic_worker else '',
+                       '--overlap_singles' if args.overlap_singles else '')
+
+def quality_control_arguments(args, input, outputdir, virtual, compress, server = None):
+  '''arguments of the qc command'''
+  return sample_options(args) + shlex.split('-t %d -o %s --leading %d --trailing %d --sliding_window %s --minlength %s --trim_engine %s --compress %s %s %s %s %s %s %s %s' % 
+                     (args.threads,
+                      outputdir,
+                      args.leading,
+                      args.trailing,
+                      args.sliding_window,
+                      args.minlength,
+                      args.trim_engine,
+                      compress,
+                      '--bin_qualities' if args.bin_qualities and compress == 'store' else '',
+                      '--virtual_concat' if virtual else '',
+                      '--use_no_singletons' if not args.singletons else '',
+                      trimmomatic_options(args, server),
+                      stage_threads_options(args, QC_STAGES),
+                      cache_options(args, QC_STAGES),
+                      ' '.join(input)))
+
+def classify_arguments(args, input, single, outputdir, pipes, compress):
+  '''arguments of the classify-input command'''
+  return sample_options(args) + shlex.split('-t %d -o %s --concat_engine %s --dedup_engine %s --dedup_memory %d --compress %s %s %s %s %s %s %s %s %s %s' % 
+                     (args.threads,
+                      outputdir,
+                      args.concat_engine,
+                      args.dedup_engine,
+                      args.dedup_memory,
+                      compress,
+                      '--bin_qualities' if args.bin_qualities and compress == 'store' else '',
+                      '--reverse_complement' if args.reverse_complement else '',
+                      '--virtual_concat' if args.virtual_concat else '',
+                      '--pipes' if pipes else '',
+                      '--merge_into %s' % (args.merge_into) if args.merge_into else '',
+                      stage_threads_options(args, CLASSIFY_STAGES + PIPED_STAGES),
+                      cache_options(args, CLASSIFY_STAGES),
+                      '-s %s' % (single) if single else '',
+                      ' '.join(input)))
+
+def start_stage(command, arguments):
+  '''start a command in its own process group, that holds the tools it starts'''
+  return subprocess.Popen(stage_command(command, arguments), preexec_fn = os.setsid)
+
+def stop_stage(process):
+  '''
+  kill a stage started by start_stage with its tools, none of them may stay blocked on a
+  named pipe, whose other end is gone
+  '''
+  try:
+    os.killpg(process.pid, signal.SIGTERM)
+  except OSError as e:
+    if e.errno != errno.ESRCH:
+      raise
+  process.wait()
+
+def remove_fifos(folder):
+  '''remove the named pipes in folder (e.g. of stopped stages)'''
+  for name in os.listdir(folder):
+    path = folder + os.sep + name
+    if stat.S_ISFIFO(os.lstat(path).st_mode):
+      os.remove(path)
+
+def wait_all(processes):
+  '''wait for all processes, if one fails (or the wait is interrupted) the others are stopped'''
+  running = list(processes)
+  try:
+    while running:
+      for process in list(running):
+        if process.poll() is None:
+          continue
+        running.remove(process)
+        if process.returncode != 0:
+          raise RuntimeError('stage failed with exit code %d' % (process.returncode))
+      time.sleep(0.5)
+  finally:
+    # the tools of a failed stage may still run as well
+    for process in processes:
+      if process.returncode != 0:
+        stop_stage(process)
+
+def stage_folders(args, samples):
+  '''output folders of the scripts, each with its own run report'''
+  folders = []
+  for name in samples:
+    sample_dir = args.output + os.sep + name if name else args.output
+    folders += [sample_dir + os.sep + 'quality_controled', sample_dir + os.sep + 'classify_input']
+  return folders
+
+def merge_metrics(args, samples):
+  '''
+  combine the run reports of all scripts and samples in <output>/metrics.json and .tsv
+  and their read statistics in <output>/read_stats.tsv (read by show_read_distribution.R)
+  '''
+  folders = stage_folders(args, samples)
+  records = metrics.merge_reports([folder + os.sep + 'metrics.json' for folder in folders],
+                                  args.output + os.sep + 'metrics', args.prometheus,
+                                  {'run': os.path.basename(os.path.abspath(args.output))})
+  stats.merge_sidecars([folder + os.sep + 'read_stats.tsv' for folder in folders],
+                       args.output + os.sep + 'read_stats.tsv')
+  return records
+
+def update_profile(args, records):
+  '''add the throughput of the stages of the run to the profile of the host'''
+  try:
+    hostprofile.update(args.profile or hostprofile.profile_path(), records)
+  except (IOError, OSError) as error:
+    # the results of the run are complete without the profile
+    sys.stderr.write('Cannot update the throughput profile: %s\n' % (error))
+
+def run_with_intermediates(args, input):
+  '''run the stages one after another, all intermediate files are written to disk'''
+  quality_dir = args.output + os.sep + 'quality_controled'
+  # the commands run in this process, one after another
+  from metapipeline.commands import qc, classify_input
+  sys.stdout.write('Running Quality Control Step\n')
+  # call quality control with RAW input
+  qc.main(quality_control_arguments(args, input, quality_dir, args.virtual_concat, args.compress), 'metapipeline qc')
+  # quality controlled paired and single end files
+  input, single = quality_outputs(args, input, quality_dir, args.compress)
+  sys.stdout.write('Running Assembly and Dereplication Step\n')
+  # call generate classify input for assembly and removing of duplicates
+  classify_input.main(classify_arguments(args, input, single, args.output + os.sep + 'classify_input', False, args.compress),
+                      'metapipeline classify-input')
+
+def run_streaming(args, input):
+  '''
+  run all stages at the same time, the quality controlled reads flow through named pipes
+  into flash and the collapser and are never written to disk. The trimming and the length
+  filtering run one after another, so the trimmed reads are still written to disk
+  '''
+  quality_dir = args.output + os.sep + 'quality_controled'
+  classify_dir = args.output + os.sep + 'classify_input'
+  for folder in (quality_dir, classify_dir):
+    if not os.path.isdir(folder):
+      os.makedirs(folder)
+  # outputs of the quality control become named pipes
+  # intermediates are never compressed, they do not touch the disk
+  paired, single = quality_outputs(args, input, quality_dir, 'none')
+  fifos = [make_fifo(item) for item in paired + [single] if item is not None]
+  sys.stdout.write('Running Quality Control, Assembly and Dereplication Step\n')
+  quality_control = start_stage('qc', quality_control_arguments(args, input, quality_dir, True, 'none'))
+  generate_classify = start_stage('classify-input', classify_arguments(args, paired, single, classify_dir, True, 'none'))
+  try:
+    wait_all([quality_control, generate_classify])
+  finally:
+    # unblock readers of pipes, that were never opened
+    for item in fifos:
+      release_fifo(item)
+    # remove them and the pipes of stopped stages
+    for folder in (quality_dir, classify_dir):
+      remove_fifos(folder)
+
+def run_lane(args, input):
+  '''
+  process the input as a new lane of the sample in the output folder: only the reads of the lane
+  run through the stages (in <output>/lanes/<name>), its unique sequences and counts are merged
+  into the classify input of the sample
+  '''
+  lane = Namespace(**dict(vars(args), output = args.output + os.sep + 'lanes' + os.sep + args.add_lane,
+                          merge_into = args.output + os.sep + 'classify_input',
+                          sample = args.sample + os.sep + 'lanes' + os.sep + args.add_lane if args.sample else None))
+  sys.stdout.write('Adding lane %s\n' % (args.add_lane))
+  if lane.keep_intermediates or lane.resume:
+    run_with_intermediates(lane, input)
+  else:
+    run_streaming(lane, input)
+
+def run_batch(args, samples):
+  '''
+  run the stages of all samples of a sample sheet at the same time, as far as the core
+  and memory budget allows (e.g. flash of one sample next to the trimming of another)
+  '''
+  cores = args.cores or scheduler.available_cores()
+  memory = args.memory << 30 if args.memory else scheduler.available_memory()
+  sys.stdout.write('Running %d samples with %d cores and %d GB memory\n' % (len(samples), cores, memory >> 30))
+  heap = java_heap(with_heap(TRIMMOMATIC, args.java_heap)) if args.trim_engine == 'trimmomatic' else 0
+  worker = None
+  if args.trim_engine == 'trimmomatic' and args.trimmomatic_worker:
+    # one jvm runs the trimmomatic calls of all samples, its heap is reserved once
+    worker = trimworker.Worker(args.output + os.sep + '.cache' + os.sep + 'trimmomatic_worker',
+                               args.java_heap or JAVA_HEAP)
+    # the quality control scripts inherit the access token
+    os.environ[trimworker.TOKEN_VARIABLE] = worker.token
+    memory = max(memory - heap, scheduler.DEFAULT_MEMORY)
+    heap = 0
+  # every other trimmomatic instance reserves the heap of its jvm, with --overlap_singles
+  # the single end filtering runs in a second jvm next to the paired end filtering
+  qc_memory = heap * (2 if args.overlap_singles and args.singletons else 1)
+  batch = scheduler.Scheduler(cores, memory)
+  for name, input in samples:
+    sample_dir = args.output + os.sep + name
+    # the statistics are labeled with the name of the sheet, the read files of samples may have the same names
+    sample = Namespace(**dict(vars(args), sample = name))
+    quality_dir = sample_dir + os.sep + 'quality_controled'
+    # the classify input are the deterministic outputs of the quality control
+    paired, single = quality_outputs(args, input, quality_dir, args.compress)
+    if not os.path.isdir(sample_dir):
+      os.makedirs(sample_dir)
+    quality_control = batch.add(scheduler.Job('%s quality control' % (name),
+                                              stage_command('qc', quality_control_arguments(sample, input, quality_dir, args.virtual_concat,
+                                                                                            args.compress, worker.address if worker else None)),
+                                              job_cores(args, QC_STAGES, cores),
+                                              max(qc_memory, scheduler.DEFAULT_MEMORY),
+                                              sample_dir + os.sep + 'quality_control.log'))
+    batch.add(scheduler.Job('%s classify input' % (name),
+                            stage_command('classify-input', classify_arguments(sample, paired, single, sample_dir + os.sep + 'classify_input',
+                                                                               False, args.compress)),
+                            job_cores(args, CLASSIFY_STAGES, cores),
+                            max(args.dedup_memory << 20, scheduler.DEFAULT_MEMORY) if args.dedup_engine == 'external'
+                            else scheduler.DEFAULT_MEMORY,
+                            sample_dir + os.sep + 'classify_input.log',
+                            [quality_control]))
+  try:
+    failed = batch.run()
+  finally:
+    if worker is not None:
+      worker.close()
+  if failed:
+    raise RuntimeError('%d of %d jobs failed or were skipped: %s' % (len(failed), len(batch.jobs),
+                                                                     ', '.join(job.name for job in failed)))
+
+def main(argv = None, prog = None):
+
+  # Setup cmd interface
+  parser = ArgumentParser(prog = prog, description = '%s -- main script for meta-pipeline' % 
+                          (prog or os.path.basename(sys.argv[0])),
+                          epilog = 'created by Philipp Sehnert',
+                          add_help = True)
+  parser.add_argument('--version', action = 'version', version = '%s 1.0' % 
+                      (prog or os.path.basename(sys.argv[0])))
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1, required = True,
+                      help = 'specify the number of cpu to be used')
+  parser.add_argument('-o', dest = 'output', default = '.', required = True,
+                      help = 'specify output folder')
+  parser.add_argument('-s', dest = 'single',
+                      help = 'include single end reads remaining after quality control')
+  parser.add_argument('--leading', type = int, dest = 'leading', default = 3, required = True,
+                      help = 'Cut bases off the start of a read, if below a threshold quality')
+  parser.add_argument('--trailing', type = int, dest = 'trailing', default = 3, required = True,
+                      help = 'Cut bases off the end of a read, if below a threshold quality')
+  parser.add_argument('--sliding_window', dest = 'sliding_window', default = '4:15', required = True,
+                      help = 'Perform a sliding window trimming, cutting once the average quality within the window falls below a threshold. ')
+  parser.add_argument('--minlength', type = int, dest = 'minlength', default = 150, required = True,
+                      help = 'Drop the read if it is below a specified length')
+  parser.add_argument('--use_no_singletons', dest = 'singletons', action = 'store_false', default = True, 
+                      help = 'permit length filtering of remaining singletons reads')
+  parser.add_argument('--trim_engine', dest = 'trim_engine', default = 'trimmomatic', choices = ['trimmomatic', 'native'],
+                      help = 'use trimmomatic or the native single pass engine for quality control (default = trimmomatic)')
+  parser.add_argument('--java_heap', dest = 'java_heap', default = None,
+                      help = 'maximum heap of the trimmomatic jvm, e.g. 4G (default = %s)' % (JAVA_HEAP))
+  parser.add_argument('--trimmomatic_worker', dest = 'trimmomatic_worker', action = 'store_true', default = False,
+                      help = 'run the trimmomatic calls in a long-lived jvm, of every sample or of the whole sample sheet')
+  parser.add_argument('--overlap_singles', dest = 'overlap_singles', action = 'store_true', default = False,
+                      help = 'filter the singletons of the trimming while the paired end reads are filtered')
+  parser.add_argument('--virtual_concat', dest = 'virtual_concat', action = 'store_true', default = False,
+                      help = 'stream reads between the tools instead of writing combined temp files')
+  parser.add_argument('--concat_engine', dest = 'concat_engine', default = 'flash', choices = ['flash', 'native'],
+                      help = 'merge the read pairs with flash or the native overlap merger (default = flash)')
+  parser.add_argument('--dedup_engine', dest = 'dedup_engine', default = 'collapser', choices = ['collapser', 'native', 'external'],
+                      help = 'remove duplicates with fastx_collapser, the native hash based engine or the native external sort (default = collapser)')
+  parser.add_argument('--dedup_memory', type = int, dest = 'dedup_memory', default = 1024,
+                      help = 'external dedup engine: memory cap in MB for buffered reads, the rest is spilled to disk (default = 1024)')
+  parser.add_argument('--reverse_complement', dest = 'reverse_complement', action = 'store_true', default = False,
+                      help = 'native dedup engines: treat a read and its reverse complement as duplicates')
+  parser.add_argument('--compress', dest = 'compress', default = 'none', choices = ['none', 'gzip', 'zstd', 'store'],
+                      help = 'write intermediate files compressed with a fast level or as read stores, inputs are detected (default = none)')
+  parser.add_argument('--bin_qualities', dest = 'bin_qualities', action = 'store_true', default = False,
+                      help = 'read stores: bin the qualities to the 8 Illumina levels (lossy, smaller stores)')
+  parser.add_argument('--keep-intermediates', dest = 'keep_intermediates', action = 'store_true', default = False,
+                      help = 'run the steps one after another and keep all intermediate files (for debugging), else the filtered reads are streamed through named pipes into flash and the collapser (the trimmed reads are still written to disk)')
+  parser.add_argument('--resume', dest = 'resume', action = 'store_true', default = False,
+                      help = 'reuse the results of stages, whose inputs, parameters and tool did not change (implies --keep-intermediates)')
+  parser.add_argument('--hash_inputs', dest = 'hash_inputs', action = 'store_true', default = False,
+                      help = 'address the inputs of the stages by the sha1 of their content instead of their size, mtime and inode (reads every input once more)')
+  parser.add_argument('--force-stage', dest = 'force_stage', action = 'append', default = [], choices = QC_STAGES + CLASSIFY_STAGES,
+                      help = 'run this stage again with --resume (can be repeated)')
+  parser.add_argument('--sample', dest = 'sample', default = None,
+                      help = 'name of the sample in the run report and the read statistics (default = name of the first input file, with a sample sheet its names)')
+  parser.add_argument('--sample_sheet', dest = 'sample_sheet', default = None,
+                      help = 'run all samples of a tab separated file with <sample> <forward reads> <reverse reads> per line')
+  parser.add_argument('--cores', type = int, dest = 'cores', default = None,
+                      help = 'sample sheet: number of cpu shared by all samples, -t is used per stage (default = all)')
+  parser.add_argument('--memory', type = int, dest = 'memory', default = None,
+                      help = 'sample sheet: memory in GB shared by all samples (default = all)')
+  parser.add_argument('--prometheus', dest = 'prometheus', default = None,
+                      help = 'export the time, memory and throughput of all stages to this Prometheus textfile')
+  parser.add_argument('--adaptive_threads', dest = 'adaptive_threads', action = 'store_true', default = False,
+                      help = 'give every stage up to -t cpu, as many as it used efficiently in previous runs on this host (with a sample sheet the cpu left run other samples)')
+  parser.add_argument('--profile', dest = 'profile', default = None,
+                      help = 'throughput profile of the stages, updated by every run (default = %s)' % (hostprofile.profile_path()))
+  parser.add_argument('--add_lane', dest = 'add_lane', default = None,
+                      help = 'process the input as new lane with this name of the sample in the output folder and merge its unique sequences into the sample (native dedup engines)')
+  # folder of the sample, a lane is merged into, and threads of the stages other than -t
+  parser.set_defaults(merge_into = None, stage_threads = {})
+  parser.add_argument('input', nargs = '*', action = 'store',
+                      help = 'single or paired input files in <fastq> format')
+  
+  # get arguments of cmd
+  args = parser.parse_args(argv)
+  if not args.input and not args.sample_sheet:
+    parser.error('input files or --sample_sheet are required')
+  if args.add_lane and (args.sample_sheet or args.dedup_engine == 'collapser' or os.sep in args.add_lane):
+    parser.error('--add_lane needs input files, a lane name without %s and --dedup_engine native or external' % (os.sep))
+  find_package()
+  # define first inputs
+  input = args.input
+  single = args.single
+
+  # create output dir
+  try:
+    os.makedirs(args.output)
+  except OSError:
+    # if dir exists and is dir go ahead
+    if not os.path.isdir(args.output):
+      raise
+
+  if args.adaptive_threads:
+    # without intermediate files flash and the duplicate removal run as one stage
+    streaming = not (args.sample_sheet or args.keep_intermediates or args.resume)
+    args.stage_threads = hostprofile.allocate(hostprofile.load(args.profile or hostprofile.profile_path()),
+                                              profiled_stages(args, streaming), args.threads)
+    sys.stdout.write('Threads per stage: %s\n' % (', '.join('%s %d' % (stage, threads) for stage, threads
+                                                            in sorted(args.stage_threads.items()))))
+
+  samples = [None]
+  try:
+    if args.sample_sheet:
+      # all samples with intermediate files, scheduled as DAG
+      sheet = scheduler.read_sample_sheet(args.sample_sheet)
+      samples = [name for name, _ in sheet]
+      run_batch(args, sheet)
+    elif args.add_lane:
+      # the report covers the sample and the new lane
+      samples = [None, 'lanes' + os.sep + args.add_lane]
+      run_lane(args, input)
+    # only stages with intermediate files on disk can be resumed
+    elif args.keep_intermediates or args.resume:
+      run_with_intermediates(args, input)
+    else:
+      run_streaming(args, input)
+  except KeyboardInterrupt:
+    sys.stdout.write('\nERROR 1 : Operation cancelled by User!\n')
+    sys.exit(1)
+  finally:
+    # one report of the whole run, also of the stages finished before a failure
+    update_profile(args, merge_metrics(args, samples))
@@ -0,0 +1,102 @@
+'''
+parallel driver for create_taxonomyDB.R: the blast db is split by query into partitions,
+their taxonomy reports are generated in parallel and merged into one taxonomy db
+'''
+
+# imports
+import sys, os
+from argparse import ArgumentParser
+import shutil
+
+from metapipeline.tools import RSCRIPT
+from metapipeline.scheduler import Job, Scheduler, available_memory
+from metapipeline.cache import partial_name, commit
+from metapipeline import taxonomy, metrics
+
+# R script generating the taxonomy report of one blast db (in the folder of the scripts)
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'create_taxonomyDB.R')
+
+def taxonomy_command(input, output, args):
+  '''command line of create_taxonomyDB.R for one blast db'''
+  return RSCRIPT.split() + [SCRIPT,
+                            '--input', input,
+                            '--output', output,
+                            '--bitscore_tolerance', str(args.bitscore),
+                            '--coverage_threshold', str(args.coverage)] + \
+         (['--lib', args.lib] if args.lib else [])
+
+def taxonomy_reports(parts, tmpdir, args):
+  '''generate the taxonomy dbs of the partitions, as many at the same time as cpus are given'''
+  batch = Scheduler(args.threads, available_memory())
+  outputs = []
+  for part in parts:
+    name = os.path.basename(part).replace('blast.', 'taxonomy.')
+    outputs.append(tmpdir + os.sep + name)
+    # the report must not add to the db of an earlier run
+    if os.path.exists(outputs[-1]):
+      os.remove(outputs[-1])
+    batch.add(Job(name, taxonomy_command(part, outputs[-1], args), log = outputs[-1] + '.log'))
+  failed = batch.run()
+  if failed:
+    raise RuntimeError('%d of %d taxonomy reports failed, see the logs in %s: %s' %
+                       (len(failed), len(parts), tmpdir, ', '.join(job.name for job in failed)))
+  return outputs
+
+def create_taxonomy_db(args, recorder):
+  '''split the blast db, generate the taxonomy reports of the partitions and merge them'''
+  tmpdir = args.tmpdir or args.output + '.parts'
+  if not os.path.isdir(tmpdir):
+    os.makedirs(tmpdir)
+  with recorder.stage('partitioning', [args.input]):
+    bounds = taxonomy.query_bounds(args.input, args.partitions or 2 * args.threads)
+    parts = taxonomy.split_db(args.input, bounds, tmpdir) if bounds else [args.input]
+  sys.stdout.write('Generate Taxonomy Database of %d partitions ...\n' % (len(parts)))
+  with recorder.stage('taxonomy_report', parts):
+    outputs = taxonomy_reports(parts, tmpdir, args)
+  with recorder.stage('merging', outputs, lambda: [args.output]):
+    if len(outputs) == 1:
+      shutil.copyfile(outputs[0], partial_name(args.output))
+      commit(args.output)
+    else:
+      taxonomy.merge_dbs(outputs, args.output)
+  if not args.keep_partitions:
+    shutil.rmtree(tmpdir)
+  sys.stdout.write('Taxonomy Database complete!\nresult:\n\t%s\n' % (args.output))
+
+def main(argv = None, prog = None):
+  # Setup cmd interface
+  parser = ArgumentParser(prog = prog, description = '%s -- generate the taxonomy db of a blast db in parallel' %
+                          (prog or os.path.basename(sys.argv[0])))
+  parser.add_argument('--input', dest = 'input', required = True,
+                      help = 'location of the blast db')
+  parser.add_argument('--output', dest = 'output', required = True,
+                      help = 'path for the taxonomy db')
+  parser.add_argument('--bitscore_tolerance', type = float, dest = 'bitscore', default = 0.90,
+                      help = 'bitscore tolerance (default = 0.90)')
+  parser.add_argument('--coverage_threshold', type = float, dest = 'coverage', default = 0.30,
+                      help = 'coverage threshold (default = 0.30)')
+  parser.add_argument('--lib', dest = 'lib', default = None,
+                      help = 'specify R libary position')
+  parser.add_argument('-t', type = int, dest = 'threads', default = 1,
+                      help = 'number of taxonomy reports generated at the same time')
+  parser.add_argument('--partitions', type = int, dest = 'partitions', default = None,
+                      help = 'number of partitions of the blast db (default = 2 * threads)')
+  parser.add_argument('--tmpdir', dest = 'tmpdir', default = None,
+                      help = 'location of the partitions and their logs (default = <output>.parts)')
+  parser.add_argument('--keep_partitions', dest = 'keep_partitions', action = 'store_true', default = False,
+                      help = 'keep the partitions and their taxonomy dbs and logs')
+  parser.add_argument('--metrics', dest = 'metrics', default = None,
+                      help = 'prefix of the json and tsv run report with time and memory per stage')
+  # parse cmd arguments
+  args = parser.parse_args(argv)
+
+  recorder = metrics.Recorder({'sample': os.path.basename(args.input), 'script': 'create_taxonomyDB'})
+  try:
+    create_taxonomy_db(args, recorder)
+  except KeyboardInterrupt:
+    sys.stdout.write('\nERROR 1 : Operation cancelled by User!\n')
+    sys.exit(1)
+  finally:
+    if args.metrics:
+      recorder.write(args.metrics)
+  return 0
@@ -0,0 +1,256 @@
+'''
+transparent reading and writing of compressed (gzip, bgzf, zstd) fastq files:
+multi-threaded external tools (bgzip, pigz, zstd) are used if they are installed,
+the python modules gzip and zstandard otherwise. Named pipes hand decompressed
+input and compressed output to external tools, that only work on plain files.
+Read stores (readstore, .mprs) are handled like a codec, that is exported as fastq.
+'''
+
+# imports
+import os
+import gzip
+import errno
+import threading
+import subprocess
+
+# file extensions of the codecs
+EXTENSIONS = {'gzip': ['.gz', '.bgz', '.bgzf'], 'zstd': ['.zst', '.zstd'], 'store': ['.mprs']}
+# magic bytes at the start of compressed files
+MAGIC = [(b'\x1f\x8b', 'gzip'), (b'\x28\xb5\x2f\xfd', 'zstd'), (b'MPRS', 'store')]
+# fast levels with low compression ratio for intermediate files
+FAST_LEVEL = {'gzip': 1, 'zstd': 1}
+# external tools in order of preference, with options to read and write (threads, level)
+READERS = {'bgzf': [['bgzip', '-d', '-c', '-@', '%(threads)d']],
+           'gzip': [['pigz', '-d', '-c', '-p', '%(threads)d'], ['gzip', '-d', '-c']],
+           'zstd': [['zstd', '-d', '-c', '-q', '-T%(threads)d']]}
+WRITERS = {'gzip': [['bgzip', '-c', '-@', '%(threads)d', '-l', '%(level)d'],
+                    ['pigz', '-c', '-p', '%(threads)d', '-%(level)d'], ['gzip', '-c', '-%(level)d']],
+           'zstd': [['zstd', '-c', '-q', '-T%(threads)d', '-%(level)d']]}
+
+def extension(codec):
+  '''file extension of a codec, empty for plain files'''
+  return EXTENSIONS[codec][0] if codec else ''
+
+def strip_extension(path):
+  '''path without the extension of a codec'''
+  for extensions in EXTENSIONS.values():
+    for item in extensions:
+      if path.endswith(item):
+        return path[:-len(item)]
+  return path
+
+def codec_of_name(path):
+  '''codec belonging to the extension of path, None for plain files'''
+  for name, extensions in EXTENSIONS.items():
+    if any(path.endswith(item) for item in extensions):
+      return name
+  return None
+
+def detect(path):
+  '''codec of a file by its extension or magic bytes (bgzf for blocked gzip), None for plain files'''
+  codec = codec_of_name(path)
+  if not os.path.isfile(path):
+    # named pipes cannot be peeked at
+    return codec
+  with open(path, 'rb') as fin:
+    head = fin.read(16)
+  for magic, name in MAGIC:
+    if head.startswith(magic):
+      codec = name
+  # bgzf is gzip with the extra field BC, its blocks can be decompressed in parallel
+  if codec == 'gzip' and len(head) >= 14 and ord(head[3:4]) & 4 and head[12:14] == b'BC':
+    codec = 'bgzf'
+  return codec
+
+def which(name):
+  '''full path of an executable in PATH or None'''
+  for folder in os.environ.get('PATH', '').split(os.pathsep):
+    path = os.path.join(folder, name)
+    if os.path.isfile(path) and os.access(path, os.X_OK):
+      return path
+  return None
+
+def tool_command(tools, threads, level = None):
+  '''command line of the first installed tool or None'''
+  for tool in tools:
+    if which(tool[0]):
+      return [item % {'threads': threads, 'level': level} for item in tool]
+  return None
+
+class ProcessFile(object):
+  '''file object reading from or writing to an external (de)compression process'''
+
+  def __init__(self, process, handle, name):
+    self.process = process
+    self.handle = handle
+    self.name = name
+
+  def read(self, size = -1):
+    return self.handle.read(size)
+
+  def readline(self):
+    return self.handle.readline()
+
+  def __iter__(self):
+    return iter(self.handle)
+
+  def write(self, data):
+    self.handle.write(data)
+
+  def flush(self):
+    self.handle.flush()
+
+  def fileno(self):
+    return self.handle.fileno()
+
+  def close(self):
+    self.handle.close()
+    if self.process.wait() != 0:
+      raise IOError('(de)compression of %s failed with exit code %d' % (self.name, self.process.returncode))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+def zstandard():
+  '''the optional zstandard module'''
+  try:
+    import zstandard
+  except ImportError:
+    raise IOError('zstd or the python module zstandard is required for zstd compressed files')
+  return zstandard
+
+def readstore():
+  '''the read store module, that needs numpy'''
+  from metapipeline import readstore
+  return readstore
+
+def open_input(path, threads = 1):
+  '''open a plain or compressed file for binary reading of the plain content'''
+  codec = detect(path)
+  if codec is None:
+    return open(path, 'rb')
+  if codec == 'store':
+    return readstore().FastqReader(path)
+  # bgzf is read by bgzip in parallel, or as any gzip file
+  command = tool_command(READERS[codec] + (READERS['gzip'] if codec == 'bgzf' else []), threads)
+  if command is not None:
+    # with python 2 the (de)compressors would keep pipes of concurrent tools open
+    process = subprocess.Popen(command + [path], stdout = subprocess.PIPE, close_fds = True)
+    return ProcessFile(process, process.stdout, path)
+  if codec == 'zstd':
+    return zstandard().open(path, 'rb')
+  return gzip.open(path, 'rb')
+
+def open_output(path, threads = 1, level = None):
+  '''open a file for binary writing, compressed if its extension belongs to a codec'''
+  codec = codec_of_name(path)
+  if codec is None or (os.path.exists(path) and not os.path.isfile(path)):
+    return open(path, 'wb')
+  if codec == 'store':
+    return readstore().StoreWriter(path)
+  level = level or FAST_LEVEL[codec]
+  command = tool_command(WRITERS[codec], threads, level)
+  if command is not None:
+    with open(path, 'wb') as fout:
+      process = subprocess.Popen(command, stdin = subprocess.PIPE, stdout = fout, close_fds = True)
+    return ProcessFile(process, process.stdin, path)
+  if codec == 'zstd':
+    return zstandard().open(path, 'wb', cctx = zstandard().ZstdCompressor(level = level, threads = threads))
+  return gzip.open(path, 'wb', level)
+
+def make_fifo(output):
+  '''create a named pipe, an existing file is replaced'''
+  if os.path.lexists(output):
+    os.remove(output)
+  os.mkfifo(output)
+  return output
+
+def release_fifo(output):
+  '''let a reader blocked on opening the named pipe output see the end of the stream'''
+  try:
+    os.close(os.open(output, os.O_WRONLY | os.O_NONBLOCK))
+  except OSError as e:
+    # nobody is waiting on the pipe
+    if e.errno not in (errno.ENXIO, errno.ENOENT):
+      raise
+
+class ToolFiles(object):
+  '''
+  compressed inputs and outputs for external tools: compressed inputs are decompressed into
+  named pipes, compressed outputs are written by the tool into named pipes and compressed
+  '''
+
+  def __init__(self, directory, threads = 1):
+    # location of the named pipes for inputs, that may be in read only folders
+    self.directory = directory
+    self.threads = threads
+    self.fifos = []
+    self.workers = []
+    self.errors = []
+
+  def pipe(self, fifo, target):
+    '''run target in a background thread, that serves the named pipe fifo'''
+    def run():
+      try:
+        target()
+      except Exception as e:
+        self.errors.append(e)
+    thread = threading.Thread(target = run)
+    thread.daemon = True
+    thread.start()
+    self.fifos.append(fifo)
+    self.workers.append(thread)
+
+  def input(self, path):
+    '''name of the plain content of path for a tool'''
+    if detect(path) is None:
+      return path
+    fifo = make_fifo(self.directory + os.sep + '.plain.' + os.path.basename(strip_extension(path)))
+    def feed():
+      with open_input(path, self.threads) as fin:
+        # unbuffered, a tool that stops reading must not fail the final flush
+        with open(fifo, 'wb', 0) as fout:
+          try:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+              fout.write(block)
+          except IOError as e:
+            # the tool stopped reading
+            if e.errno != errno.EPIPE:
+              raise
+    self.pipe(fifo, feed)
+    return fifo
+
+  def output(self, path, fifo = None):
+    '''name for a tool to write the content of path to, compressed if path has the extension of a codec'''
+    if codec_of_name(path) is None:
+      return path
+    fifo = make_fifo(fifo or strip_extension(path))
+    def drain():
+      with open(fifo, 'rb') as fin:
+        with open_output(path, self.threads) as fout:
+          for block in iter(lambda: fin.read(1 << 20), b''):
+            fout.write(block)
+    self.pipe(fifo, drain)
+    return fifo
+
+  def close(self):
+    '''wait for all compressions and remove the named pipes'''
+    for fifo, thread in zip(self.fifos, self.workers):
+      while thread.is_alive():
+        # the tool may have ended without opening the pipe, unblock the waiting side
+        release_fifo(fifo)
+        os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+        thread.join(0.1)
+    for fifo in self.fifos:
+      os.remove(fifo)
+    if self.errors:
+      raise self.errors[0]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,292 @@
+'''
+concatenation of (fastq) files without copying every line through python:
+	- cat_files copies whole files with copy_file_range/sendfile or large buffered blocks
+	- open_chain reads several (compressed) files as one stream, so no concatenated file is written
+	- fifo_from/stream_into hand such a stream to external tools, their errors are raised by the Feeder
+	- fifo_from_queue does the same for files, that become available one after another
+	- interleave_into drains several (piped) fastq streams at once into one
+	- BackgroundWriter writes to several (piped) outputs without blocking each other
+'''
+
+# imports
+import os
+import stat
+import shutil
+import threading
+try:
+  from queue import Queue
+except ImportError:
+  from Queue import Queue
+
+from metapipeline.fastq import read_batches
+from metapipeline.cache import partial_name, commit
+from metapipeline.compress import open_input, make_fifo, release_fifo
+
+# block size for buffered and kernel copies
+BLOCK_SIZE = 1 << 24
+
+def copy_range(fin, fout, size):
+  '''copy size bytes between two file descriptors inside the kernel, returns the number of bytes copied'''
+  copied = 0
+  for method in ('copy_file_range', 'sendfile'):
+    if not hasattr(os, method):
+      continue
+    try:
+      while copied < size:
+        if method == 'copy_file_range':
+          sent = os.copy_file_range(fin, fout, min(BLOCK_SIZE, size - copied))
+        else:
+          sent = os.sendfile(fout, fin, None, min(BLOCK_SIZE, size - copied))
+        if sent == 0:
+          break
+        copied += sent
+      return copied
+    except OSError:
+      # not supported for this pair of files, try the next method from the current position
+      continue
+  return copied
+
+def copy_file(input, fout):
+  '''append the file input to the open binary file fout'''
+  with open(input, 'rb') as fin:
+    size = os.fstat(fin.fileno()).st_size
+    copied = 0
+    if os.path.isfile(input):
+      # flush buffered data before writing to the descriptor directly
+      fout.flush()
+      copied = copy_range(fin.fileno(), fout.fileno(), size)
+    if copied < size:
+      # buffered copy in large blocks for pipes or without kernel support
+      fin.seek(copied)
+      shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+
+def cat_files(input, output):
+  '''combine all input file in one file, output appears when it is complete'''
+  with open(partial_name(output), 'wb') as fout:
+    for item in input:
+      copy_file(item, fout)
+
+  return commit(output)
+
+class ChainedReader(object):
+  '''read only file object, that returns the (decompressed) content of several files one after another'''
+
+  def __init__(self, input):
+    self.input = list(input)
+    self.name = ' '.join(self.input)
+    self.current = None
+    self.next_file()
+
+  def next_file(self):
+    '''close the current file and open the next one, returns False at the end'''
+    if self.current is not None:
+      self.current.close()
+    self.current = open_input(self.input.pop(0)) if self.input else None
+    return self.current is not None
+
+  def read(self, size = -1):
+    '''read up to size bytes, crossing file borders'''
+    chunks = []
+    while self.current is not None and (size < 0 or size > 0):
+      chunk = self.current.read(size)
+      if not chunk:
+        self.next_file()
+        continue
+      chunks.append(chunk)
+      if size > 0:
+        size -= len(chunk)
+    return b''.join(chunks)
+
+  def readline(self):
+    '''read the next line, crossing file borders'''
+    while self.current is not None:
+      line = self.current.readline()
+      if line:
+        return line
+      self.next_file()
+    return b''
+
+  def __iter__(self):
+    while self.current is not None:
+      for line in self.current:
+        yield line
+      self.next_file()
+
+  def close(self):
+    self.input = []
+    self.next_file()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+def open_chain(input):
+  '''virtual concatenation of all input files'''
+  return ChainedReader(input)
+
+class Feeder(object):
+  '''
+  background threads, that feed (decompressed) files to tools. A failed read must not look
+  like the end of the input, the errors of the threads are raised by wait.
+  '''
+
+  def __init__(self, name = None):
+    # named pipe fed by the threads, if any
+    self.name = name
+    self.threads = []
+    self.errors = []
+
+  def start(self, target, *args):
+    '''run target(*args) in a background thread'''
+    def run():
+      try:
+        target(*args)
+      except Exception as e:
+        self.errors.append(e)
+    thread = threading.Thread(target = run)
+    thread.daemon = True
+    thread.start()
+    self.threads.append(thread)
+    return thread
+
+  def wait(self):
+    '''wait for all threads, raises the first error'''
+    for thread in list(self.threads):
+      thread.join()
+    if self.errors:
+      raise self.errors[0]
+
+def stream_into(input, fout, close = True):
+  '''copy all input files into the file object fout (e.g. stdin of a process) in a background thread, returns the Feeder'''
+  def copy():
+    try:
+      with open_chain(input) as fin:
+        shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+    finally:
+      if close:
+        fout.close()
+  feeder = Feeder()
+  feeder.start(copy)
+  return feeder
+
+def interleave_into(input, fout, close = True):
+  '''
+  copy the fastq records of all input files concurrently into the file object fout,
+  needed when the inputs are named pipes, whose writers must not block each other,
+  returns the Feeder
+  '''
+  lock = threading.Lock()
+  def copy(item):
+    with open_input(item) as fin:
+      for batch in read_batches(fin):
+        # write whole records only
+        data = b''.join(b''.join(record) for record in zip(*batch))
+        with lock:
+          fout.write(data)
+  feeder = Feeder()
+  copies = [feeder.start(copy, item) for item in input]
+  def wait():
+    try:
+      for thread in copies:
+        thread.join()
+    finally:
+      if close:
+        fout.close()
+  feeder.start(wait)
+  return feeder
+
+def fifo_from(input, output):
+  '''
+  create the named pipe output, that delivers the concatenation of all input files to one reader,
+  returns the Feeder of the pipe (its name is output)
+  '''
+  make_fifo(output)
+  def feed():
+    # opening blocks until the consumer opens the pipe
+    with open(output, 'wb') as fout:
+      with open_chain(input) as fin:
+        shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+  feeder = Feeder(output)
+  feeder.start(feed)
+  return feeder
+
+def fifo_from_queue(queue, output):
+  '''
+  create the named pipe output, that delivers the lists of files put into queue one after
+  another to one reader, None ends the stream, returns the Feeder of the pipe
+  '''
+  make_fifo(output)
+  def feed():
+    # opening blocks until the consumer opens the pipe
+    with open(output, 'wb') as fout:
+      for input in iter(queue.get, None):
+        with open_chain(input) as fin:
+          shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+        # the reader gets the whole files before the next ones are available
+        fout.flush()
+  feeder = Feeder(output)
+  feeder.start(feed)
+  return feeder
+
+def discard_fifos(input):
+  '''
+  read the named pipes in input to their end at the same time and drop their content, their
+  writers (e.g. quality_control.py) must not block forever when the reader failed
+  '''
+  feeder = Feeder()
+  for item in input:
+    if os.path.exists(item) and stat.S_ISFIFO(os.stat(item).st_mode):
+      def discard(item):
+        with open(item, 'rb') as fin:
+          while fin.read(BLOCK_SIZE):
+            pass
+      feeder.start(discard, item)
+  feeder.wait()
+
+class BackgroundWriter(object):
+  '''
+  file object, that writes in a background thread. Outputs read in lockstep by another
+  process (e.g. paired named pipes read by flash) must not wait for each other.
+  '''
+
+  def __init__(self, handle, depth = 16):
+    self.handle = handle
+    self.name = getattr(handle, 'name', None)
+    self.queue = Queue(depth)
+    self.error = None
+    self.thread = threading.Thread(target = self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def run(self):
+    while True:
+      data = self.queue.get()
+      if data is None:
+        break
+      if self.error is None:
+        try:
+          data() if callable(data) else self.handle.write(data)
+        except Exception as e:
+          # keep draining the queue, the error is raised in the writing thread
+          self.error = e
+
+  def write(self, data):
+    '''queue data or a callable to run in the writer thread'''
+    if self.error is not None:
+      raise self.error
+    self.queue.put(data)
+
+  def close(self):
+    self.queue.put(None)
+    self.thread.join()
+    self.handle.close()
+    if self.error is not None:
+      raise self.error
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,384 @@
+'''
+native replacement for fastx_collapser: reads are streamed, keyed by a 128 bit hash of
+their sequence and spilled into hash partitions on disk, that are collapsed in parallel.
+The result has the format of fastx_collapser (>rank-count, sorted by count), the read
+names of every unique sequence are kept in a sidecar index. Read stores are read block by
+block without parsing fastq, their qualities are not decoded.
+For samples, whose partitions do not fit in memory, the external sort mode buffers the reads
+up to a memory cap, spills them as runs sorted by sequence and collapses the runs in a k-way
+merge, the unique sequences are sorted by count the same way.
+The unique sequences of a new sequencing lane are merged into the index and fasta of the
+sample, without processing the reads of its earlier lanes again.
+'''
+
+# imports
+import os
+import shutil
+import string
+import hashlib
+import heapq
+from operator import itemgetter
+from multiprocessing import Pool
+
+from metapipeline.fastq import read_batches
+from metapipeline.shard import split_records, read_range
+from metapipeline.cache import partial_name, commit
+from metapipeline.compress import open_input, detect
+
+# complement of the bases for reverse complement canonicalization
+if hasattr(bytes, 'maketrans'):
+  COMPLEMENT = bytes.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+else:
+  COMPLEMENT = string.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+# limits for the number of hash partitions (open files per scanning process)
+MIN_PARTITIONS = 16
+MAX_PARTITIONS = 512
+# input bytes per partition, that are held in memory at once when collapsing
+PARTITION_SIZE = 1 << 28
+# external sort: memory of a buffered read besides its sequence and name (python objects),
+# smallest memory cap of a spilling process and runs merged at once (open files)
+RECORD_OVERHEAD = 200
+MIN_MEMORY = 1 << 24
+MERGE_FANIN = 64
+
+def canonical(sequence):
+  '''lexicographically smaller one of sequence and its reverse complement'''
+  return min(sequence, sequence.translate(COMPLEMENT)[::-1])
+
+def sequence_key(sequence):
+  '''128 bit hash of a sequence as hex string'''
+  return hashlib.md5(sequence).hexdigest().encode('ascii')
+
+def partition_name(prefix, partition):
+  '''name of the spill file of a partition'''
+  return '%s.part%04d' % (prefix, partition)
+
+def named_sequences(path, start = None, end = None):
+  '''yield batches of (read names, sequences) of one input or a byte range of it'''
+  if detect(path) == 'store' and os.path.isfile(path):
+    from metapipeline import readstore
+    for block in readstore.read_blocks(path, start or 0, end):
+      yield block.read_names(), block.sequences()
+    return
+  with (open_input(path) if end is None else open(path, 'rb')) as fin:
+    lines = fin if end is None else read_range(fin, start, end)
+    for headers, sequences, plus, qualities in read_batches(lines):
+      yield [header[1:].split()[0] for header in headers], [sequence.rstrip() for sequence in sequences]
+
+def scan(task):
+  '''hash the reads of one input (or a byte range of it) into partition files'''
+  path, start, end, prefix, partitions, reverse_complement = task
+  outputs = [open(partition_name(prefix, p), 'wb') for p in range(partitions)]
+  count = 0
+  try:
+    for names, sequences in named_sequences(path, start, end):
+      for name, sequence in zip(names, sequences):
+        if reverse_complement:
+          sequence = canonical(sequence)
+        key = sequence_key(sequence)
+        # spill <hash> <sequence> <read name> to the partition of the hash
+        outputs[int(key[:8], 16) % partitions].write(b'\t'.join([key, sequence, name]) + b'\n')
+      count += len(names)
+  finally:
+    for output in outputs:
+      output.close()
+  return count
+
+def collapse(task):
+  '''count the unique sequences of one partition, written sorted by count to output'''
+  inputs, output = task
+  table = {}
+  for item in inputs:
+    with open(item, 'rb') as fin:
+      for line in fin:
+        key, sequence, name = line.rstrip(b'\n').split(b'\t')
+        entry = table.get(key)
+        if entry is None:
+          table[key] = [sequence, [name]]
+        else:
+          entry[1].append(name)
+    os.remove(item)
+  # write <count> <sequence> <hash> <read names> sorted by count and sequence
+  with open(output, 'wb') as fout:
+    for key, (sequence, names) in sorted(table.items(), key = lambda x: (-len(x[1][1]), x[1][0])):
+      fout.write(b'\t'.join([str(len(names)).encode('ascii'), sequence, key, b','.join(names)]) + b'\n')
+  return len(table)
+
+def sorted_entries(path):
+  '''yield (-count, sequence, line) of a collapsed partition for merging'''
+  with open(path, 'rb') as fin:
+    for line in fin:
+      count, sequence, rest = line.split(b'\t', 2)
+      yield (-int(count), sequence, line)
+
+def scan_tasks(input, tmpdir, processes, *options):
+  '''split the inputs in tasks for scanning, named pipes and compressed files can only be read as a whole'''
+  tasks = []
+  for item in input:
+    if os.path.isfile(item) and detect(item) == 'store':
+      # read stores are split at block boundaries
+      from metapipeline import readstore
+      for start, end in readstore.ReadStore(item).ranges(processes):
+        tasks.append([item, start, end])
+    elif os.path.isfile(item) and detect(item) is None:
+      for ranges in split_records([item], processes):
+        tasks.append([item, ranges[0][0], ranges[0][1]])
+    elif os.path.isfile(item):
+      tasks.append([item, None, None])
+    else:
+      # streams come first, they have to be read at the same time
+      tasks.insert(0, [item, None, None])
+  return [tuple(task + [tmpdir + os.sep + 'scan%04d' % (i)] + list(options))
+          for i, task in enumerate(tasks)]
+
+def remove_duplicates(input, output, index, processes = 1, reverse_complement = False, tmpdir = None):
+  '''
+  collapse identical reads of all fastq input files into the fasta output,
+  index gets <label> <count> <hash> <read names> for every unique sequence
+  returns the number of input reads and unique sequences and the length histogram of the output
+  '''
+  tmpdir = tmpdir or output + '.tmp'
+  if not os.path.isdir(tmpdir):
+    os.makedirs(tmpdir)
+  # enough partitions to keep every collapsed partition small
+  size = sum(os.path.getsize(item) for item in input if os.path.isfile(item))
+  partitions = max(MIN_PARTITIONS, processes, min(MAX_PARTITIONS, size // PARTITION_SIZE + 1))
+  tasks = scan_tasks(input, tmpdir, processes, partitions, reverse_complement)
+  # every stream needs its own process
+  pool = Pool(max(processes, len([task for task in tasks if not os.path.isfile(task[0])])))
+  try:
+    reads = sum(pool.map(scan, tasks, 1))
+    # collapse the partitions, every partition is read from all scanning tasks
+    collapsed = [tmpdir + os.sep + 'collapsed%04d' % (p) for p in range(partitions)]
+    uniques = sum(pool.map(collapse, [([partition_name(task[3], p) for task in tasks], collapsed[p])
+                                      for p in range(partitions)], 1))
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  # merge the sorted partitions into the final output, that appears when it is complete
+  lengths = {}
+  with open(partial_name(output), 'wb') as fasta, open(partial_name(index), 'wb') as fout:
+    entries = heapq.merge(*[sorted_entries(item) for item in collapsed])
+    for rank, (count, sequence, line) in enumerate(entries):
+      label = ('%d-%d' % (rank + 1, -count)).encode('ascii')
+      fasta.write(b'>' + label + b'\n' + sequence + b'\n')
+      fout.write(label + b'\t' + line)
+      lengths[len(sequence)] = lengths.get(len(sequence), 0) + 1
+  commit(output)
+  commit(index)
+  shutil.rmtree(tmpdir)
+
+  return reads, uniques, lengths
+
+def write_run(path, lines):
+  '''write the lines of a run, returns its size'''
+  with open(path, 'wb') as fout:
+    for line in lines:
+      fout.write(line)
+  return os.path.getsize(path)
+
+def sequence_line(entry):
+  '''line <sequence> <count> <read names> of a run sorted by sequence'''
+  sequence, count, names = entry
+  return b'\t'.join([sequence, str(count).encode('ascii'), names]) + b'\n'
+
+def sequence_run(buffer):
+  '''lines of the buffered (sequence, name) reads collapsed and sorted by sequence'''
+  # the sort is stable, the names stay in input order
+  buffer.sort(key = itemgetter(0))
+  start = 0
+  for end in range(1, len(buffer) + 1):
+    if end == len(buffer) or buffer[end][0] != buffer[start][0]:
+      yield sequence_line((buffer[start][0], end - start, b','.join(name for sequence, name in buffer[start:end])))
+      start = end
+
+def spill_runs(task):
+  '''
+  read one input (or a byte range of it) into a buffer of at most memory bytes and spill it
+  as sorted runs, returns the number of reads, the runs and the spilled bytes
+  '''
+  path, start, end, prefix, memory, reverse_complement = task
+  reads, runs, spilled = 0, [], 0
+  buffer, used = [], 0
+  for names, sequences in named_sequences(path, start, end):
+    for name, sequence in zip(names, sequences):
+      if reverse_complement:
+        sequence = canonical(sequence)
+      buffer.append((sequence, name))
+      used += len(sequence) + len(name) + RECORD_OVERHEAD
+    reads += len(names)
+    if used >= memory:
+      runs.append('%s.run%04d' % (prefix, len(runs)))
+      spilled += write_run(runs[-1], sequence_run(buffer))
+      buffer, used = [], 0
+  if buffer:
+    runs.append('%s.run%04d' % (prefix, len(runs)))
+    spilled += write_run(runs[-1], sequence_run(buffer))
+  return reads, runs, spilled
+
+def read_sequence_run(path, order):
+  '''yield (sequence, order, count, names) of a run sorted by sequence'''
+  with open(path, 'rb') as fin:
+    for line in fin:
+      sequence, count, names = line.rstrip(b'\n').split(b'\t')
+      yield sequence, order, int(count), names
+
+def collapse_runs(runs):
+  '''yield (sequence, count, names) of the unique sequences of runs sorted by sequence'''
+  current = None
+  # equal sequences come in the order of the runs
+  for sequence, order, count, names in heapq.merge(*[read_sequence_run(path, i) for i, path in enumerate(runs)]):
+    if current is not None and current[0] == sequence:
+      current[1] += count
+      current[2].append(names)
+      continue
+    if current is not None:
+      yield current[0], current[1], b','.join(current[2])
+    current = [sequence, count, [names]]
+  if current is not None:
+    yield current[0], current[1], b','.join(current[2])
+
+def read_count_run(path):
+  '''yield (-count, sequence, names) of a run sorted by count'''
+  with open(path, 'rb') as fin:
+    for line in fin:
+      count, sequence, names = line.rstrip(b'\n').split(b'\t')
+      yield -int(count), sequence, names
+
+def count_line(entry):
+  '''line <count> <sequence> <read names> of a run sorted by count'''
+  count, sequence, names = entry
+  return b'\t'.join([str(-count).encode('ascii'), sequence, names]) + b'\n'
+
+def merge_passes(runs, entries, line, prefix):
+  '''
+  merge groups of MERGE_FANIN runs with entries (iterator of the sorted entries of runs) into
+  larger runs, until all can be merged at once, returns the runs, the spilled bytes and runs
+  '''
+  spilled, spills, level = 0, 0, 0
+  while len(runs) > MERGE_FANIN:
+    merged = []
+    for i in range(0, len(runs), MERGE_FANIN):
+      merged.append('%s.merge%d.%04d' % (prefix, level, len(merged)))
+      spilled += write_run(merged[-1], (line(entry) for entry in entries(runs[i:i + MERGE_FANIN])))
+      for item in runs[i:i + MERGE_FANIN]:
+        os.remove(item)
+    spills += len(merged)
+    runs = merged
+    level += 1
+  return runs, spilled, spills
+
+def remove_duplicates_external(input, output, index, memory, processes = 1, reverse_complement = False, tmpdir = None):
+  '''
+  collapse identical reads like remove_duplicates (same output and index) with at most about
+  memory bytes of buffered reads, returns the number of input reads and unique sequences,
+  the length histogram of the output and the spilled runs and bytes
+  '''
+  tmpdir = tmpdir or output + '.tmp'
+  if not os.path.isdir(tmpdir):
+    os.makedirs(tmpdir)
+  tasks = scan_tasks(input, tmpdir, processes)
+  # every stream needs its own process, the memory is shared by all of them
+  workers = max(processes, len([task for task in tasks if not os.path.isfile(task[0])]), 1)
+  tasks = [task + (max(memory // workers, MIN_MEMORY), reverse_complement) for task in tasks]
+  pool = Pool(workers)
+  try:
+    results = pool.map(spill_runs, tasks, 1)
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  reads = sum(result[0] for result in results)
+  runs = [run for result in results for run in result[1]]
+  spilled = sum(result[2] for result in results)
+  spills = len(runs)
+  # collapse the runs by sequence and spill the unique sequences sorted by count
+  runs, size, count = merge_passes(runs, collapse_runs, sequence_line, tmpdir + os.sep + 'sequences')
+  spilled, spills = spilled + size, spills + count
+  counted, buffer, used, uniques = [], [], 0, 0
+  for sequence, count, names in collapse_runs(runs):
+    buffer.append((-count, sequence, names))
+    used += len(sequence) + len(names) + RECORD_OVERHEAD
+    uniques += 1
+    if used >= memory:
+      counted.append(tmpdir + os.sep + 'counts.run%04d' % (len(counted)))
+      buffer.sort()
+      spilled += write_run(counted[-1], (count_line(entry) for entry in buffer))
+      buffer, used = [], 0
+  # the runs sorted by sequence are no longer needed
+  for item in runs:
+    os.remove(item)
+  if buffer:
+    counted.append(tmpdir + os.sep + 'counts.run%04d' % (len(counted)))
+    buffer.sort()
+    spilled += write_run(counted[-1], (count_line(entry) for entry in buffer))
+  spills += len(counted)
+  counted, size, count = merge_passes(counted, lambda group: heapq.merge(*[read_count_run(path) for path in group]),
+                                      count_line, tmpdir + os.sep + 'counts')
+  spilled, spills = spilled + size, spills + count
+  # merge the runs sorted by count into the final output, that appears when it is complete
+  lengths = {}
+  with open(partial_name(output), 'wb') as fasta, open(partial_name(index), 'wb') as fout:
+    entries = heapq.merge(*[read_count_run(path) for path in counted])
+    for rank, (count, sequence, names) in enumerate(entries):
+      label = ('%d-%d' % (rank + 1, -count)).encode('ascii')
+      fasta.write(b'>' + label + b'\n' + sequence + b'\n')
+      fout.write(b'\t'.join([label, str(-count).encode('ascii'), sequence, sequence_key(sequence), names]) + b'\n')
+      lengths[len(sequence)] = lengths.get(len(sequence), 0) + 1
+  commit(output)
+  commit(index)
+  shutil.rmtree(tmpdir)
+
+  return reads, uniques, lengths, {'runs': spills, 'bytes': spilled}
+
+def read_index(path):
+  '''yield (-count, sequence, hash, read names) of the entries of an index sorted by count'''
+  with open(path, 'rb') as fin:
+    for line in fin:
+      label, count, sequence, key, names = line.rstrip(b'\n').split(b'\t', 4)
+      yield -int(count), sequence, key, names
+
+def merge_index(lane_index, output, index):
+  '''
+  add the unique sequences of a new lane (its index) to the fasta output and index of a sample,
+  that does not need to exist yet, sequences of both get the sum of their counts and the read
+  names of both. Only the entries of the lane are held in memory, the index of the sample is
+  read twice and written again with new ranks. Returns the reads and unique sequences of the
+  lane, the new sequences, the reads and unique sequences of the sample and the length
+  histogram of the output
+  '''
+  lane = {}
+  for count, sequence, key, names in read_index(lane_index):
+    lane[key] = (count, sequence, names)
+  lane_reads, lane_uniques = -sum(entry[0] for entry in lane.values()), len(lane)
+  # entries of the sample, that get reads of the lane
+  changed, updated = [], set()
+  if os.path.isfile(index):
+    for count, sequence, key, names in read_index(index):
+      if key in lane:
+        added, _, more = lane.pop(key)
+        changed.append((count + added, sequence, key, names + b',' + more))
+        updated.add(key)
+  new = len(lane)
+  changed.extend((count, sequence, key, names) for key, (count, sequence, names) in lane.items())
+  changed.sort()
+  unchanged = (entry for entry in read_index(index) if entry[2] not in updated) if os.path.isfile(index) else iter([])
+  # the unchanged entries stay sorted by count, the changed ones are merged in
+  lengths, reads, uniques = {}, 0, 0
+  with open(partial_name(output), 'wb') as fasta, open(partial_name(index), 'wb') as fout:
+    for rank, (count, sequence, key, names) in enumerate(heapq.merge(unchanged, changed)):
+      label = ('%d-%d' % (rank + 1, -count)).encode('ascii')
+      fasta.write(b'>' + label + b'\n' + sequence + b'\n')
+      fout.write(b'\t'.join([label, str(-count).encode('ascii'), sequence, key, names]) + b'\n')
+      lengths[len(sequence)] = lengths.get(len(sequence), 0) + 1
+      reads -= count
+      uniques += 1
+  commit(output)
+  commit(index)
+
+  return lane_reads, lane_uniques, new, reads, uniques, lengths
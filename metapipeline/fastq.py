@@ -0,0 +1,69 @@
+'''
+streaming helpers to read and write fastq files in batches of records
+'''
+
+# imports
+from itertools import islice
+
+# extensions of compressed files, read files and suffixes of the pipeline stages, that are
+# removed from file names to get the name of a read file
+COMPRESSION_EXTENSIONS = ['.gz', '.bgz', '.bgzf', '.zst', '.zstd', '.mprs']
+READ_EXTENSIONS = ['.fastq', '.fq', '.fasta', '.fa']
+STAGE_SUFFIXES = ['.trimmed', '.filtered', '.single', '.single_tmp',
+                  '.unpaired_after_trimming', '.unpaired_after_filtering']
+
+def strip_suffix(name, suffixes):
+  '''name without one of the suffixes'''
+  for suffix in suffixes:
+    if name.endswith(suffix) and len(name) > len(suffix):
+      return name[:-len(suffix)]
+  return name
+
+def extract_readname(item, index):
+  '''extract the name of the file without compression, read file extension and stage suffixes'''
+  name = strip_suffix(item[index].split('/')[-1], COMPRESSION_EXTENSIONS)
+  name = strip_suffix(name, READ_EXTENSIONS)
+  while strip_suffix(name, STAGE_SUFFIXES) != name:
+    name = strip_suffix(name, STAGE_SUFFIXES)
+  return name
+
+def read_batches(handle, size = 10000):
+  '''yield lists of (header, sequence, plus, quality) lines with at most size records'''
+  while True:
+    # pull the next 4 * size lines in one go
+    lines = list(islice(handle, 4 * size))
+    if not lines:
+      break
+    if len(lines) % 4:
+      raise ValueError('truncated fastq record in %s' % (getattr(handle, 'name', handle)))
+    # the last line of a file may come without line break
+    if not lines[-1].endswith(b'\n'):
+      lines[-1] += b'\n'
+    yield [lines[0::4], lines[1::4], lines[2::4], lines[3::4]]
+
+def read_paired_batches(forward, reverse, size = 10000):
+  '''
+  yield the batches of both mates like read_batches, but read record by record in turns
+  (like flash), so the writer of paired named pipes can finish one before the other
+  '''
+  while True:
+    left, right = [[], [], [], []], [[], [], [], []]
+    for i in range(size):
+      record, mate = list(islice(forward, 4)), list(islice(reverse, 4))
+      if not record and not mate:
+        break
+      if len(record) != 4 or len(mate) != 4:
+        raise ValueError('paired input files contain an unequal number of reads')
+      for lines, batch in ((record, left), (mate, right)):
+        # the last line of a file may come without line break
+        if not lines[3].endswith(b'\n'):
+          lines[3] += b'\n'
+        for k in range(4):
+          batch[k].append(lines[k])
+    if not left[0]:
+      break
+    yield left, right
+
+def format_record(header, sequence, plus, quality, start, end):
+  '''build a fastq record from the lines of a read, cut down to [start:end]'''
+  return b''.join([header, sequence[start:end], b'\n', plus, quality[start:end], b'\n'])
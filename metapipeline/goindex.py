@@ -0,0 +1,168 @@
+'''
+compiled on-disk index of a pfam2go mapping: the Pfam accessions are stored sorted with a
+fixed width, each with the offset of its GO rows in a string blob. The index is memory
+mapped, so loading needs no parsing and concurrent processes share the pages. It is
+rebuilt when the size, mtime and hash of the mapping file do not match anymore.
+'''
+
+# imports
+import os
+import mmap
+import struct
+import bisect
+import hashlib
+
+# file layout: header, sorted keys (width bytes each), count + 1 offsets, blob
+MAGIC = b'P2GOIDX1'
+HEADER = struct.Struct('<8sQd20sQQ')
+OFFSET = struct.Struct('<Q')
+
+def text(data):
+  '''native string of bytes read from the index'''
+  return data if isinstance(data, str) else data.decode('utf-8')
+
+def source_digest(path):
+  '''sha1 of the mapping file'''
+  sha = hashlib.sha1()
+  with open(path, 'rb') as fin:
+    for block in iter(lambda: fin.read(1 << 20), b''):
+      sha.update(block)
+  return sha.digest()
+
+def read_mapping(path):
+  '''{pfam accession: [GO row, ...]} of a mapping file with two header lines, rows in file order'''
+  table = {}
+  with open(path, 'rb') as fin:
+    # skip the header
+    next(fin, None)
+    next(fin, None)
+    for line in fin:
+      line = line.strip()
+      if not line:
+        continue
+      key, rest = (line.split(b'\t', 1) + [b''])[:2]
+      table.setdefault(key, []).append(rest)
+  return table
+
+def build(mapping, index):
+  '''compile the mapping file into the index file, written atomically'''
+  table = read_mapping(mapping)
+  keys = sorted(table)
+  width = max([len(key) for key in keys] + [1])
+  info = os.stat(mapping)
+  tmp = '%s.%d.tmp' % (index, os.getpid())
+  with open(tmp, 'wb') as fout:
+    fout.write(HEADER.pack(MAGIC, info.st_size, info.st_mtime, source_digest(mapping), len(keys), width))
+    fout.write(b''.join(key.ljust(width, b'\0') for key in keys))
+    # the rows of a key are separated by line breaks
+    rows = [b'\n'.join(table[key]) for key in keys]
+    offset = 0
+    for row in rows:
+      fout.write(OFFSET.pack(offset))
+      offset += len(row)
+    fout.write(OFFSET.pack(offset))
+    fout.write(b''.join(rows))
+  os.rename(tmp, index)
+
+class Keys(object):
+  '''sequence view on the sorted keys of a mapped index for bisect'''
+
+  def __init__(self, buffer, start, count, width):
+    self.buffer = buffer
+    self.start = start
+    self.count = count
+    self.width = width
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, i):
+    position = self.start + i * self.width
+    return self.buffer[position:position + self.width].rstrip(b'\0')
+
+class GoIndex(object):
+  '''read only mapping of pfam accessions to their GO rows, backed by a memory mapped index'''
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as fin:
+      self.buffer = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+    magic, self.size, self.mtime, self.digest, self.count, width = HEADER.unpack_from(self.buffer, 0)
+    if magic != MAGIC:
+      raise ValueError('%s is not a pfam2go index' % (path))
+    self.keys = Keys(self.buffer, HEADER.size, self.count, width)
+    self.offsets = HEADER.size + self.count * width
+    self.blob = self.offsets + (self.count + 1) * OFFSET.size
+
+  def __len__(self):
+    return self.count
+
+  def __contains__(self, key):
+    return self.find(key) is not None
+
+  def __iter__(self):
+    for i in range(self.count):
+      yield self.keys[i]
+
+  def find(self, key):
+    '''position of key in the index or None'''
+    if not isinstance(key, bytes):
+      key = key.encode('ascii')
+    i = bisect.bisect_left(self.keys, key)
+    if i < self.count and self.keys[i] == key:
+      return i
+    return None
+
+  def rows(self, key):
+    '''all GO rows of key as lists of fields, empty if key is unknown'''
+    i = self.find(key)
+    if i is None:
+      return []
+    start, end = [OFFSET.unpack_from(self.buffer, self.offsets + j * OFFSET.size)[0] for j in (i, i + 1)]
+    return [text(row).split('\t') for row in self.buffer[self.blob + start:self.blob + end].split(b'\n')]
+
+  def get(self, key, default = None):
+    '''last GO row of key (like a dict built from the mapping file) or default'''
+    rows = self.rows(key)
+    return rows[-1] if rows else default
+
+  def matches(self, mapping):
+    '''True if the index was built from the current content of mapping'''
+    info = os.stat(mapping)
+    if info.st_size != self.size:
+      return False
+    if info.st_mtime == self.mtime:
+      return True
+    if source_digest(mapping) != self.digest:
+      return False
+    # same content with a new mtime (e.g. copied), remember it to skip hashing next time
+    try:
+      with open(self.path, 'r+b') as fout:
+        fout.write(HEADER.pack(MAGIC, info.st_size, info.st_mtime, self.digest, self.count, self.keys.width))
+    except (IOError, OSError):
+      pass
+    return True
+
+  def close(self):
+    self.buffer.close()
+
+def default_index(mapping):
+  '''<mapping>.idx, or a file in ~/.cache/metapipeline if the folder of mapping is read only'''
+  folder = os.path.dirname(os.path.abspath(mapping))
+  if os.access(folder, os.W_OK) or os.path.exists(mapping + '.idx'):
+    return mapping + '.idx'
+  cache = os.path.join(os.path.expanduser('~'), '.cache', 'metapipeline')
+  if not os.path.isdir(cache):
+    os.makedirs(cache)
+  return os.path.join(cache, hashlib.sha1(os.path.abspath(mapping).encode('utf-8')).hexdigest() + '.idx')
+
+def load(mapping, index = None):
+  '''memory map the index of mapping (default <mapping>.idx), built first if missing or outdated'''
+  index = index or default_index(mapping)
+  if os.path.exists(index):
+    go_index = GoIndex(index)
+    if go_index.matches(mapping):
+      return go_index
+    go_index.close()
+  build(mapping, index)
+  return GoIndex(index)
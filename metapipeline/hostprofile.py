@@ -0,0 +1,111 @@
+'''
+throughput profile of the stages on this host, built from the run reports of previous runs:
+the reads per second of every stage and engine are kept for every thread count it ran with.
+A stage gets the fewest threads, that reach nearly the best throughput measured, so a stage
+that does not scale (e.g. flash limited by I/O) leaves its cores to stages running next to it.
+Thread counts next to the chosen one are tried in later runs, the profile grows with every run.
+'''
+
+# imports
+import os
+import json
+import socket
+from argparse import ArgumentTypeError
+
+from metapipeline.metrics import write_atomic
+
+# folder of the profiles, one per host
+PROFILE_DIR = os.environ.get('METAPIPELINE_PROFILE_DIR', os.path.join(os.path.expanduser('~'), '.metapipeline'))
+# stages shorter than this are dominated by the start of their tools and are not profiled
+MIN_SECONDS = float(os.environ.get('METAPIPELINE_PROFILE_MIN_SECONDS', '5'))
+# measurements kept per stage and thread count, their median is used
+MAX_SAMPLES = 5
+# the fewest threads reaching this fraction of the best throughput are chosen
+TOLERANCE = 0.9
+# engines running single threaded, whatever threads they get
+SINGLE_THREADED = ['collapser']
+
+def profile_path(directory = None):
+  '''profile of this host in directory (default = PROFILE_DIR)'''
+  return os.path.join(directory or PROFILE_DIR, 'profile.%s.json' % (socket.gethostname()))
+
+def stage_key(stage, engine):
+  '''key of a stage and its engine in the profile'''
+  return '%s/%s' % (stage, engine)
+
+def stage_threads(text):
+  '''<stage>=<threads> of a --stage_threads option as (stage, threads)'''
+  stage, separator, threads = text.partition('=')
+  if not separator or not threads.isdigit() or int(threads) < 1:
+    raise ArgumentTypeError('expected <stage>=<threads>, got %s' % (text))
+  return stage, int(threads)
+
+def load(path):
+  '''the profile in path, empty if it does not exist'''
+  try:
+    with open(path) as fin:
+      return json.load(fin)
+  except (IOError, ValueError):
+    return {}
+
+def update(path, records):
+  '''
+  add the reads per second of the stages of a run report to the profile in path, only stages
+  with their threads, that were not reused, did not fail and ran at least MIN_SECONDS, returns
+  their number
+  '''
+  profile = load(path)
+  stages = profile.setdefault('stages', {})
+  added = 0
+  for record in records:
+    if record.get('threads') is None or record.get('reused') or record.get('error') or not record.get('reads_in_per_second') \
+       or (record.get('wall_seconds') or 0) < MIN_SECONDS:
+      continue
+    samples = stages.setdefault(stage_key(record['stage'], record['engine']), {}).setdefault(str(record['threads']), [])
+    samples.append(record['reads_in_per_second'])
+    del samples[:-MAX_SAMPLES]
+    added += 1
+  if added:
+    profile['host'] = socket.gethostname()
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    # runs of other processes may update the profile at the same time, it is never left partial
+    write_atomic(path, json.dumps(profile, indent = 2, sort_keys = True))
+  return added
+
+def median(values):
+  '''median of a list of numbers'''
+  values = sorted(values)
+  middle = len(values) // 2
+  return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def throughput(profile, stage, engine, limit):
+  '''median reads per second of a stage for every measured thread count up to limit'''
+  measured = profile.get('stages', {}).get(stage_key(stage, engine), {})
+  return dict((int(threads), median(samples)) for threads, samples in measured.items()
+              if samples and int(threads) <= limit)
+
+def choose(profile, stage, engine, limit):
+  '''
+  threads of a stage, at most limit: the fewest threads with TOLERANCE of the best throughput
+  measured. Without measurements the stage gets limit threads. If it still scaled with the most
+  threads measured, limit threads are tried, if it did not slow down with the fewest threads
+  measured, half of them are tried
+  '''
+  if engine in SINGLE_THREADED:
+    return 1
+  measured = throughput(profile, stage, engine, limit)
+  if not measured:
+    return limit
+  best = max(measured.values())
+  threads = min(count for count, value in measured.items() if value >= TOLERANCE * best)
+  if threads == max(measured) and threads < limit:
+    return limit
+  if threads == min(measured) and threads > 1:
+    return threads // 2
+  return threads
+
+def allocate(profile, stages, limit):
+  '''threads of every (stage, engine) in stages as dictionary by stage'''
+  return dict((stage, choose(profile, stage, engine, limit)) for stage, engine in stages)
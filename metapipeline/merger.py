@@ -0,0 +1,178 @@
+'''
+native replacement for flash: the forward read and the reverse complement of the reverse
+read are merged at the overlap with the lowest mismatch density. The mismatches of all
+overlap lengths of a whole batch of pairs are counted at once as convolution of the one-hot
+encoded reads (FFT with numpy).
+'''
+
+# imports
+import numpy as np
+
+from metapipeline.fastq import read_paired_batches
+from metapipeline.shard import read_range, run_sharded
+from metapipeline.compress import open_output
+from metapipeline.stats import add_lengths
+from metapipeline import metrics
+
+# offset of the phred33 quality encoding
+PHRED_OFFSET = 33
+# flash defaults: minimum overlap, maximum overlap for the mismatch density, max mismatch density
+MIN_OVERLAP = 10
+MAX_OVERLAP = 200
+MAX_MISMATCH_DENSITY = 0.25
+# lowest quality of a mismatching base in the overlap
+MIN_MISMATCH_QUALITY = 2
+# base codes, everything but ACGT is ambiguous
+AMBIGUOUS = 4
+CODES = np.full(256, AMBIGUOUS, dtype = np.int8)
+for code, bases in enumerate([b'Aa', b'Cc', b'Gg', b'Tt']):
+  for base in bytearray(bases):
+    CODES[base] = code
+# bases as corners of a regular tetrahedron: the dot product of two bases is 1 if they
+# match and -1/3 otherwise, ambiguous bases are 0 and not compared
+TETRAHEDRON = np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1], [0, 0, 0]], dtype = np.float64) / np.sqrt(3)
+# complement of the bases
+COMPLEMENT = np.arange(256, dtype = np.uint8)
+for base, other in zip(bytearray(b'ACGTNacgtn'), bytearray(b'TGCANtgcan')):
+  COMPLEMENT[base] = other
+
+def padded_matrix(lines, reverse = False):
+  '''lines without line break as padded byte matrix (reversed per read) and the line lengths'''
+  lengths = np.array([len(line) - 1 for line in lines], dtype = np.int64)
+  offsets = np.zeros(len(lines), dtype = np.int64)
+  offsets[1:] = np.cumsum(lengths + 1)[:-1]
+  width = max(int(lengths.max()), 1)
+  buf = np.frombuffer(b''.join(lines), dtype = np.uint8)
+  positions = np.arange(width)[None, :]
+  mask = positions < lengths[:, None]
+  if reverse:
+    positions = lengths[:, None] - 1 - positions
+  index = np.clip(offsets[:, None] + positions, 0, len(buf) - 1)
+  return np.where(mask, buf[index], 0), lengths
+
+def overlap_counts(forward, reverse):
+  '''
+  compared bases and matches of every overlap length (column ov - 1) of the end of forward
+  with the start of reverse, both given as code matrices with forward reversed
+  '''
+  size = forward.shape[1] + reverse.shape[1]
+  width = min(forward.shape[1], reverse.shape[1])
+  # sum of the dot products of the aligned bases for all shifts at once
+  spectrum = 0
+  for axis in range(3):
+    spectrum = spectrum + np.fft.rfft(TETRAHEDRON[forward, axis], size, axis = 1) \
+                          * np.fft.rfft(TETRAHEDRON[reverse, axis], size, axis = 1)
+  dots = np.fft.irfft(spectrum, size, axis = 1)[:, :width]
+  # ambiguous bases within the overlap are not compared
+  compared = np.arange(1, width + 1)[None, :] \
+             - np.cumsum(forward[:, :width] == AMBIGUOUS, axis = 1) \
+             - np.cumsum(reverse[:, :width] == AMBIGUOUS, axis = 1)
+  # dots = matches - (compared - matches) / 3
+  matches = np.rint((3 * dots + compared) / 4).astype(np.int64)
+  return compared, matches
+
+def best_overlap(forward, lengths_f, reverse, lengths_r, min_overlap, max_overlap, max_density):
+  '''overlap length with the lowest mismatch density of every pair, 0 if there is none'''
+  compared, matches = overlap_counts(forward, reverse)
+  overlaps = np.arange(1, compared.shape[1] + 1)[None, :]
+  density = (compared - matches) / np.maximum(np.minimum(compared, max_overlap), 1).astype(np.float64)
+  # the reverse read must not extend beyond the start of the forward read
+  valid = (overlaps >= min_overlap) & (compared >= min_overlap) & (density <= max_density) \
+          & (overlaps <= np.minimum(lengths_f, lengths_r)[:, None])
+  # lowest density first, longer overlaps win ties
+  score = np.where(valid, density - overlaps * 1e-9, np.inf)
+  best = score.argmin(axis = 1)
+  return np.where(valid[np.arange(len(best)), best], best + 1, 0)
+
+def merge_batch(left, right, min_overlap, max_overlap, max_density):
+  '''
+  merge the pairs of a batch, returns the extendedFrags and interleaved notCombined records
+  of the batch and the lengths of their reads
+  '''
+  seq_f, len_f = padded_matrix(left[1])
+  qual_f, _ = padded_matrix(left[3])
+  # reverse complement of the reverse read
+  seq_r, len_r = padded_matrix(right[1], reverse = True)
+  seq_r = COMPLEMENT[seq_r]
+  qual_r, _ = padded_matrix(right[3], reverse = True)
+  # the forward read is reversed, so its end meets the start of the reverse read in the convolution
+  overlap = best_overlap(CODES[padded_matrix(left[1], reverse = True)[0]], len_f,
+                         CODES[seq_r], len_r, min_overlap, max_overlap, max_density)
+  combined = np.flatnonzero(overlap)
+  extended = []
+  # lengths of the merged reads
+  length = np.zeros(0, dtype = np.int64)
+  if len(combined):
+    # layout of the merged reads: forward read, then the reverse read from the start of the overlap
+    o = overlap[combined]
+    lf, lr = len_f[combined], len_r[combined]
+    start = lf - o
+    length = lf + lr - o
+    positions = np.arange(int(length.max()))[None, :]
+    in_f = positions < lf[:, None]
+    in_r = (positions >= start[:, None]) & (positions < length[:, None])
+    rows = np.arange(len(combined))[:, None]
+    pf = np.minimum(positions, seq_f.shape[1] - 1)
+    pr = np.clip(positions - start[:, None], 0, seq_r.shape[1] - 1)
+    base_f, score_f = seq_f[combined][rows, pf], qual_f[combined][rows, pf].astype(np.int16)
+    base_r, score_r = seq_r[combined][rows, pr], qual_r[combined][rows, pr].astype(np.int16)
+    # consensus in the overlap: agreeing bases get the higher quality, mismatches the base
+    # of the higher quality with the difference of the qualities, ambiguous bases lose
+    both = in_f & in_r
+    ambiguous_f = CODES[base_f] == AMBIGUOUS
+    ambiguous_r = CODES[base_r] == AMBIGUOUS
+    take_r = (~in_f) | (both & ~ambiguous_r & (ambiguous_f | (score_r > score_f)))
+    bases = np.where(take_r, base_r, base_f)
+    agree = both & (base_f == base_r)
+    mismatch = both & (base_f != base_r) & ~ambiguous_f & ~ambiguous_r
+    scores = np.where(take_r, score_r, score_f)
+    scores = np.where(agree, np.maximum(score_f, score_r), scores)
+    scores = np.where(mismatch, np.maximum(np.abs(score_f - score_r) + PHRED_OFFSET,
+                                           MIN_MISMATCH_QUALITY + PHRED_OFFSET), scores)
+    bases = bases.astype(np.uint8)
+    scores = scores.astype(np.uint8)
+    for j, i in enumerate(combined):
+      end = length[j]
+      extended.append(b''.join([left[0][i], bases[j, :end].tobytes(), b'\n+\n', scores[j, :end].tobytes(), b'\n']))
+  # pairs without overlap are written interleaved like flash --interleaved-output
+  single = np.flatnonzero(overlap == 0)
+  not_combined = [b''.join([left[0][i], left[1][i], left[2][i], left[3][i],
+                            right[0][i], right[1][i], right[2][i], right[3][i]])
+                  for i in single]
+  return b''.join(extended), b''.join(not_combined), length, np.concatenate([len_f[single], len_r[single]])
+
+def merge_paired(input, extended, not_combined, min_overlap = MIN_OVERLAP, max_overlap = MAX_OVERLAP,
+                 max_density = MAX_MISMATCH_DENSITY, batch = 4096):
+  '''
+  merge the read pairs of the open input handles into the open extended and not_combined
+  handles, returns the summary with the total, combined and uncombined pairs and the
+  length histograms of both outputs
+  '''
+  summary = {'total': 0, 'combined': 0, 'uncombined': 0,
+             'lengths': {'extended': {}, 'not_combined': {}}}
+  # the mates are read in turns, the inputs may be named pipes written by quality_control.py
+  for left, right in read_paired_batches(input[0], input[1], batch):
+    merged, unmerged, merged_lengths, unmerged_lengths = merge_batch(left, right, min_overlap, max_overlap, max_density)
+    extended.write(merged)
+    not_combined.write(unmerged)
+    combined = len(merged_lengths)
+    summary['total'] += len(left[0])
+    summary['combined'] += combined
+    summary['uncombined'] += len(left[0]) - combined
+    metrics.progress(2 * len(left[0]))
+    add_lengths(summary['lengths']['extended'], merged_lengths)
+    add_lengths(summary['lengths']['not_combined'], unmerged_lengths)
+  return summary
+
+def merge_shard(ranges, paths, outputs, min_overlap, max_overlap, max_density):
+  '''merge one shard of a read pair into the extendedFrags and notCombined shard outputs'''
+  with open(paths[0], 'rb') as forward, open(paths[1], 'rb') as reverse, \
+       open_output(outputs[0]) as extended, open_output(outputs[1]) as not_combined:
+    return merge_paired([read_range(forward, *ranges[0]), read_range(reverse, *ranges[1])],
+                        extended, not_combined, min_overlap, max_overlap, max_density)
+
+def merge_paired_sharded(paths, outputs, processes, min_overlap = MIN_OVERLAP, max_overlap = MAX_OVERLAP,
+                         max_density = MAX_MISMATCH_DENSITY):
+  '''merge read pairs in record aligned shards on several processes, same results as merge_paired'''
+  return run_sharded(merge_shard, paths, outputs, processes, (min_overlap, max_overlap, max_density),
+                     reads = lambda summary: 2 * summary['total'])
@@ -0,0 +1,234 @@
+'''
+instrumentation of the pipeline stages: wall and cpu time (including waited child processes),
+peak memory, bytes read and written, reads per second and threads of every stage are collected in
+a run report (json and tsv), optionally exported for the Prometheus node exporter. A stage that
+raised is reported with error set.
+While a stage runs, its processed reads and reads per second are reported on stderr.
+Also parsers for the summaries of trimmomatic, flash and fastx_collapser.
+'''
+
+# imports
+import os
+import re
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+# columns of the tsv report, the first ones label the metrics in prometheus
+TAGS = ['sample', 'script', 'stage']
+FIELDS = TAGS + ['started', 'wall_seconds', 'cpu_seconds', 'peak_rss_kb', 'bytes_read', 'bytes_written', 'bytes_spilled',
+          'reads_in', 'reads_out', 'reads_in_per_second', 'reads_out_per_second', 'reused', 'threads', 'engine', 'error']
+# metrics exported to prometheus with their help text
+PROMETHEUS = [('wall_seconds', 'wall time of the stage'),
+              ('cpu_seconds', 'user and system time of the stage and its tools'),
+              ('peak_rss_kb', 'peak resident memory of the process and its tools up to the end of the stage'),
+              ('bytes_read', 'size of the input files of the stage'),
+              ('bytes_written', 'size of the output files of the stage'),
+              ('bytes_spilled', 'size of the temporary runs spilled to disk by the stage'),
+              ('reads_in', 'reads processed by the stage'),
+              ('reads_out', 'reads written by the stage')]
+
+# seconds between two progress reports of a stage
+PROGRESS_INTERVAL = float(os.environ.get('METAPIPELINE_PROGRESS_INTERVAL', '10'))
+# progress report of a stage: [progress] <stage> <reads> reads <reads per second> reads/s
+PROGRESS = re.compile(r'^\[progress\] (\S+) (\d+) reads ([\d.]+) reads/s')
+
+# summaries of the external tools
+TRIMMOMATIC_PE = re.compile(r'Input Read Pairs:\s*(\d+)\s+Both Surviving:\s*(\d+).*?'
+                            r'Forward Only(?: Surviving)?:\s*(\d+).*?'
+                            r'Reverse Only(?: Surviving)?:\s*(\d+).*?Dropped:\s*(\d+)', re.S)
+TRIMMOMATIC_SE = re.compile(r'Input Reads:\s*(\d+)\s+Surviving:\s*(\d+).*?Dropped:\s*(\d+)', re.S)
+FLASH_PAIRS = re.compile(r'Total pairs:\s*(\d+).*?Combined pairs:\s*(\d+).*?Uncombined pairs:\s*(\d+)', re.S)
+COLLAPSER = re.compile(r'Input:\s*(\d+) sequences \(representing (\d+) reads\).*?'
+                       r'Output:\s*(\d+) sequences \(representing (\d+) reads\)', re.S)
+
+def text(output):
+  '''tool output as native string'''
+  return output if isinstance(output, str) else output.decode('utf-8', 'replace')
+
+def summary(pattern, output, keys, tool):
+  '''dictionary of the numbers of a tool summary, raises ValueError if the tool did not report'''
+  match = pattern.search(text(output))
+  if match is None:
+    raise ValueError('no summary found in the output of %s:\n%s' % (tool, text(output)))
+  return dict(zip(keys, [int(item) for item in match.groups()]))
+
+def parse_trimmomatic_pe(output):
+  '''counts of a paired end trimmomatic run'''
+  return summary(TRIMMOMATIC_PE, output, ['input', 'both', 'forward', 'reverse', 'dropped'], 'trimmomatic')
+
+def parse_trimmomatic_se(output):
+  '''counts of a single end trimmomatic run'''
+  return summary(TRIMMOMATIC_SE, output, ['input', 'surviving', 'dropped'], 'trimmomatic')
+
+def parse_flash(output):
+  '''counts of a flash run'''
+  return summary(FLASH_PAIRS, output, ['total', 'combined', 'uncombined'], 'flash')
+
+def parse_collapser(output):
+  '''counts of a fastx_collapser run'''
+  return summary(COLLAPSER, output, ['input_sequences', 'input_reads', 'output_sequences', 'output_reads'],
+                 'fastx_collapser')
+
+def file_sizes(paths):
+  '''summed size of the regular files in paths'''
+  return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+def usage():
+  '''cpu seconds and peak rss (kb) of this process and all waited children'''
+  own = resource.getrusage(resource.RUSAGE_SELF)
+  children = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return (own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+          max(own.ru_maxrss, children.ru_maxrss))
+
+class Stage(object):
+  '''measurements of one stage'''
+
+  def __init__(self, name, inputs):
+    self.record = {'stage': name, 'started': time.time(), 'bytes_read': file_sizes(inputs),
+                   'bytes_spilled': None, 'reads_in': None, 'reads_out': None, 'reused': False,
+                   'threads': None, 'engine': None, 'error': False}
+    self.cpu = usage()[0]
+    # reads processed so far and time of the last progress report, only the process of the
+    # stage reports (not the forked workers of its pools)
+    self.processed = 0
+    self.reported = self.record['started']
+    self.pid = os.getpid()
+
+  def advance(self, reads = None, total = None):
+    '''add processed reads or set their total, reported every PROGRESS_INTERVAL seconds'''
+    if os.getpid() != self.pid:
+      return
+    self.processed = total if total is not None else self.processed + reads
+    now = time.time()
+    if now - self.reported < PROGRESS_INTERVAL:
+      return
+    self.reported = now
+    wall = now - self.record['started']
+    sys.stderr.write('[progress] %s %d reads %.1f reads/s\n' % (self.record['stage'], self.processed,
+                                                                self.processed / wall if wall > 0 else 0.0))
+    sys.stderr.flush()
+
+  def count(self, reads_in = None, reads_out = None):
+    '''reads processed and written by the stage'''
+    if reads_in is not None:
+      self.record['reads_in'] = reads_in
+    if reads_out is not None:
+      self.record['reads_out'] = reads_out
+
+  def finish(self, outputs):
+    '''complete the record at the end of the stage'''
+    cpu, rss = usage()
+    wall = time.time() - self.record['started']
+    self.record.update({'wall_seconds': round(wall, 3),
+                        'cpu_seconds': round(cpu - self.cpu, 3),
+                        'peak_rss_kb': rss,
+                        'bytes_written': file_sizes(outputs)})
+    for key in ('reads_in', 'reads_out'):
+      value = self.record[key]
+      self.record[key + '_per_second'] = None if value is None or wall <= 0 else round(value / wall, 1)
+    return self.record
+
+# stages measured at the moment, counts go to the innermost
+ACTIVE = []
+
+def count(reads_in = None, reads_out = None):
+  '''report the reads of the running stage (ignored outside of a measured stage)'''
+  if ACTIVE:
+    ACTIVE[-1].count(reads_in, reads_out)
+
+def progress(reads = None, total = None):
+  '''report processed reads (or their total) of the running stage, also from background threads'''
+  if ACTIVE:
+    ACTIVE[-1].advance(reads, total)
+
+def spilled(size):
+  '''report bytes of temporary data spilled to disk by the running stage'''
+  if ACTIVE:
+    ACTIVE[-1].record['bytes_spilled'] = (ACTIVE[-1].record['bytes_spilled'] or 0) + size
+
+def threads(count, engine):
+  '''report the threads given to the running stage and the engine (tool) running it'''
+  if ACTIVE:
+    ACTIVE[-1].record.update({'threads': count, 'engine': engine})
+
+def reused():
+  '''mark the running stage as reused from a previous run'''
+  if ACTIVE:
+    ACTIVE[-1].record['reused'] = True
+
+class Recorder(object):
+  '''collects the records of all stages of a run'''
+
+  def __init__(self, labels = None):
+    self.labels = labels or {}
+    self.records = []
+
+  @contextmanager
+  def stage(self, name, inputs, outputs = None):
+    '''measure the stage in the with block, outputs is a callable returning the output files'''
+    stage = Stage(name, inputs)
+    stage.record.update(self.labels)
+    ACTIVE.append(stage)
+    failed = True
+    try:
+      yield stage
+      failed = False
+    finally:
+      ACTIVE.remove(stage)
+      # a failed stage is recorded too, its outputs are incomplete and not measured
+      stage.record['error'] = failed
+      self.records.append(stage.finish(outputs() if outputs and not failed else []))
+
+  def write(self, prefix, prometheus = None):
+    '''write <prefix>.json and <prefix>.tsv and the prometheus textfile'''
+    write_report(self.records, self.labels, prefix, prometheus)
+
+def write_atomic(path, data):
+  '''replace path with data, readers (e.g. the node exporter or other runs) never see a partial file'''
+  tmp = '%s.%d.tmp' % (path, os.getpid())
+  with open(tmp, 'w') as fout:
+    fout.write(data)
+  os.rename(tmp, path)
+
+def write_report(records, labels, prefix, prometheus = None):
+  '''write the records of a run as json, tsv and prometheus textfile'''
+  write_atomic(prefix + '.json', json.dumps({'labels': labels, 'stages': records}, indent = 2, sort_keys = True))
+  lines = ['\t'.join(FIELDS)]
+  for record in records:
+    lines.append('\t'.join('' if record.get(key) is None else str(record.get(key)) for key in FIELDS))
+  write_atomic(prefix + '.tsv', '\n'.join(lines) + '\n')
+  if prometheus:
+    write_atomic(prometheus, prometheus_text(records, labels))
+
+def prometheus_text(records, labels):
+  '''records in the prometheus text exposition format'''
+  lines = []
+  for key, help in PROMETHEUS:
+    name = 'metapipeline_stage_' + key
+    lines.append('# HELP %s %s' % (name, help))
+    lines.append('# TYPE %s gauge' % (name))
+    for record in records:
+      if record.get(key) is None:
+        continue
+      tags = dict(labels)
+      tags.update((tag, record[tag]) for tag in TAGS if record.get(tag) is not None)
+      lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (tag, str(tags[tag]).replace('\\', '\\\\').replace('"', '\\"'))
+                                                  for tag in sorted(tags)), record[key]))
+  return '\n'.join(lines) + '\n'
+
+def merge_reports(reports, prefix, prometheus = None, labels = None):
+  '''
+  combine the json reports of several scripts or samples of one run, missing reports are skipped,
+  returns the records of the run
+  '''
+  records = []
+  for report in reports:
+    if not os.path.isfile(report):
+      continue
+    with open(report) as fin:
+      records.extend(json.load(fin)['stages'])
+  write_report(records, labels or {}, prefix, prometheus)
+  return records
@@ -0,0 +1,402 @@
+'''
+compact columnar store of fastq reads (.mprs), an intermediate format between the stages:
+bases are packed with 2 bits (other characters like N are kept as exceptions, listed or in a
+bitmap if they are frequent), qualities are run-length encoded or packed with 4 bits for up
+to 16 levels (whatever is smallest) and optionally binned to the 8 Illumina levels, read
+lengths and names are kept in offset indexes. A store is a sequence of independent blocks,
+that can be concatenated like gzip members (e.g. shard outputs), read through a memory map
+and split at block boundaries. The + line of a record is not kept, the fastq export writes '+'.
+'''
+
+# imports
+import os
+import mmap
+import struct
+import bisect
+
+import numpy as np
+
+# start of every block and version of the format
+MAGIC = b'MPRS'
+VERSION = 1
+# magic, version, flags, reads, bases, bytes of the names, exceptions, quality runs
+HEADER = struct.Struct('<4sBB2xIQQQQ')
+# flags of a block: run-length encoded, binned and 4 bit packed qualities, bitmap of the exceptions
+RLE = 1
+BINNED = 2
+BITMAP = 4
+PACKED = 8
+# quality levels of 4 bit packed qualities
+LEVELS = 16
+# reads per block
+BLOCK_READS = 1 << 16
+# sections are aligned to 8 bytes
+ALIGN = 8
+# bin the qualities of new stores to the 8 Illumina levels (lossy)
+BIN_QUALITIES = False
+
+# 2 bit codes of the bases, 4 marks an exception
+CODES = np.full(256, 4, dtype = np.uint8)
+CODES[np.frombuffer(b'ACGT', dtype = np.uint8)] = np.arange(4, dtype = np.uint8)
+# the four bases of every packed byte
+UNPACKED = np.frombuffer(b'ACGT', dtype = np.uint8)[(np.arange(256)[:, None] >> np.array([0, 2, 4, 6])) & 3]
+# Illumina quality bins (phred + 33): N, 2-9, 10-19, 20-24, 25-29, 30-34, 35-39, >= 40
+BINS = np.arange(256, dtype = np.uint8)
+for low, high, level in [(0, 2, 2), (2, 10, 6), (10, 20, 15), (20, 25, 22), (25, 30, 27),
+                         (30, 35, 33), (35, 40, 37), (40, 223, 40)]:
+  BINS[low + 33:high + 33] = level + 33
+
+def padded(size):
+  '''size rounded up to the alignment of the sections'''
+  return (size + ALIGN - 1) // ALIGN * ALIGN
+
+def sections(flags, reads, bases, names, exceptions, runs):
+  '''(name, dtype, count) of the sections of a block in order'''
+  if flags & RLE:
+    quality = [('run_ends', '<u4', reads), ('run_values', 'u1', runs), ('run_lengths', 'u1', runs)]
+  elif flags & PACKED:
+    quality = [('quality_levels', 'u1', LEVELS), ('quality_codes', 'u1', (bases + 1) // 2)]
+  else:
+    quality = [('quality_values', 'u1', bases)]
+  if flags & BITMAP:
+    positions = [('exception_bitmap', 'u1', (bases + 7) // 8)]
+  else:
+    positions = [('exception_list', '<u4', exceptions)]
+  return [('lengths', '<u4', reads), ('name_ends', '<u4', reads), ('name_data', 'u1', names),
+          ('packed_bases', 'u1', (bases + 3) // 4)] + positions + [('exception_bases', 'u1', exceptions)] + quality
+
+def run_length(values, starts):
+  '''
+  run-length encode values, runs also end at the starts of the reads and are at most 255
+  long, returns the run values, run lengths and the cumulative runs of every read
+  '''
+  if not len(values):
+    return values, values, np.zeros(len(starts), dtype = np.uint32)
+  change = np.ones(len(values), dtype = bool)
+  change[1:] = values[1:] != values[:-1]
+  change[starts[starts < len(values)]] = True
+  run_starts = np.flatnonzero(change)
+  lengths = np.diff(np.append(run_starts, len(values)))
+  # longer runs are split into pieces of 255
+  pieces = (lengths + 254) // 255
+  piece_lengths = np.full(int(pieces.sum()), 255, dtype = np.int64)
+  piece_lengths[np.cumsum(pieces) - 1] = lengths - 255 * (pieces - 1)
+  # runs of every read
+  read = np.searchsorted(starts, run_starts, side = 'right') - 1
+  per_read = np.bincount(read, weights = pieces, minlength = len(starts)).astype(np.int64)
+  return (np.repeat(values[run_starts], pieces), piece_lengths.astype(np.uint8),
+          np.cumsum(per_read).astype(np.uint32))
+
+def encode_block(names, sequences, qualities, binned = False):
+  '''one block of the reads with the names (headers without @), sequences and qualities (without line breaks)'''
+  lengths = np.array([len(item) for item in sequences], dtype = np.int64)
+  if lengths.tolist() != [len(item) for item in qualities]:
+    raise ValueError('sequence and quality of a read differ in length')
+  starts = np.cumsum(lengths) - lengths
+  sequence = np.frombuffer(b''.join(sequences), dtype = np.uint8)
+  quality = np.frombuffer(b''.join(qualities), dtype = np.uint8)
+  name_data = b''.join(names)
+  # pack 4 bases into a byte, other characters are kept with their positions
+  codes = CODES[sequence]
+  exceptions = np.flatnonzero(codes == 4)
+  flags = 0
+  positions = exceptions
+  # a bitmap of the exceptions, if they are frequent
+  if (len(sequence) + 7) // 8 < 4 * len(exceptions):
+    flags |= BITMAP
+    positions = np.packbits(codes == 4)
+  codes[exceptions] = 0
+  codes = np.append(codes, np.zeros(-len(codes) % 4, dtype = np.uint8)).reshape(-1, 4)
+  packed = codes[:, 0] | (codes[:, 1] << 2) | (codes[:, 2] << 4) | (codes[:, 3] << 6)
+  if binned:
+    quality = BINS[quality]
+    flags |= BINNED
+  values, runs, run_ends = run_length(quality, starts)
+  levels = np.unique(quality)
+  packable = len(levels) <= LEVELS and len(quality) > 0
+  # qualities are run-length encoded or packed, if that is smaller
+  if 2 * len(values) + 4 * len(lengths) < ((len(quality) + 1) // 2 if packable else len(quality)):
+    flags |= RLE
+    quality = [run_ends, values, runs]
+  elif packable:
+    flags |= PACKED
+    indexes = np.append(np.searchsorted(levels, quality).astype(np.uint8), np.zeros(len(quality) % 2, dtype = np.uint8))
+    values = []
+    quality = [np.append(levels, np.zeros(LEVELS - len(levels), dtype = np.uint8)), indexes[0::2] | (indexes[1::2] << 4)]
+  else:
+    values = []
+    quality = [quality]
+  arrays = [lengths, np.cumsum([len(name) for name in names]), np.frombuffer(name_data, dtype = np.uint8),
+            packed, positions, sequence[exceptions]] + quality
+  parts = [HEADER.pack(MAGIC, VERSION, flags, len(lengths), len(sequence), len(name_data), len(exceptions), len(values))]
+  parts.append(b'\0' * (padded(HEADER.size) - HEADER.size))
+  for array, (name, dtype, count) in zip(arrays, sections(flags, len(lengths), len(sequence), len(name_data),
+                                                          len(exceptions), len(values))):
+    data = np.asarray(array, dtype = dtype).tobytes()
+    parts.append(data + b'\0' * (padded(len(data)) - len(data)))
+  return b''.join(parts)
+
+def split(data, ends):
+  '''cut the concatenated data of the reads at their end offsets'''
+  ends = ends.tolist()
+  return [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+class Block(object):
+  '''the reads of a block at offset of data, the arrays are views of the (memory mapped) data'''
+
+  def __init__(self, data, offset = 0):
+    magic, version, self.flags, self.reads, self.bases, names, exceptions, runs = HEADER.unpack_from(data, offset)
+    if magic != MAGIC or version != VERSION:
+      raise ValueError('no read store block at offset %d' % (offset))
+    position = offset + padded(HEADER.size)
+    for name, dtype, count in sections(self.flags, self.reads, self.bases, names, exceptions, runs):
+      setattr(self, name, np.frombuffer(data, dtype = dtype, count = count, offset = position))
+      position += padded(count * np.dtype(dtype).itemsize)
+    self.offset = offset
+    self.size = position - offset
+
+  def __len__(self):
+    return self.reads
+
+  def names(self):
+    '''headers of the reads without @'''
+    return split(self.name_data.tobytes(), self.name_ends)
+
+  def read_names(self):
+    '''names of the reads (first word of the headers)'''
+    return [name.split(None, 1)[0] if name.strip() else b'' for name in self.names()]
+
+  def exception_positions(self):
+    '''positions of the exceptions in the concatenated sequences'''
+    if self.flags & BITMAP:
+      return np.flatnonzero(np.unpackbits(self.exception_bitmap)[:self.bases])
+    return self.exception_list
+
+  def sequence_data(self):
+    '''concatenated sequences of the reads'''
+    sequence = UNPACKED[self.packed_bases].reshape(-1)[:self.bases]
+    sequence[self.exception_positions()] = self.exception_bases
+    return sequence.tobytes()
+
+  def sequences(self):
+    return split(self.sequence_data(), np.cumsum(self.lengths))
+
+  def quality_data(self):
+    '''concatenated qualities of the reads'''
+    if self.flags & RLE:
+      return np.repeat(self.run_values, self.run_lengths).tobytes()
+    return self.quality_range(0, self.bases)
+
+  def quality_range(self, start, end):
+    '''qualities between the positions start and end of packed or plain qualities'''
+    if self.flags & PACKED:
+      codes = self.quality_codes[start // 2:(end + 1) // 2]
+      codes = np.column_stack([codes & 15, codes >> 4]).reshape(-1)[start % 2:start % 2 + end - start]
+      return self.quality_levels[codes].tobytes()
+    return self.quality_values[start:end].tobytes()
+
+  def qualities(self):
+    return split(self.quality_data(), np.cumsum(self.lengths))
+
+  def record(self, index):
+    '''(name, sequence, quality) of one read without decoding the whole block'''
+    start = int(self.lengths[:index].sum())
+    end = start + int(self.lengths[index])
+    sequence = UNPACKED[self.packed_bases[start // 4:(end + 3) // 4]].reshape(-1)[start % 4:start % 4 + end - start]
+    positions = self.exception_positions()
+    mask = (positions >= start) & (positions < end)
+    sequence[positions[mask] - start] = self.exception_bases[mask]
+    if self.flags & RLE:
+      runs = slice(int(self.run_ends[index - 1]) if index else 0, int(self.run_ends[index]))
+      quality = np.repeat(self.run_values[runs], self.run_lengths[runs]).tobytes()
+    else:
+      quality = self.quality_range(start, end)
+    return self.names()[index], sequence.tobytes(), quality
+
+  def fastq(self):
+    '''the reads of the block in fastq format'''
+    return b''.join(b''.join([b'@', name, b'\n', sequence, b'\n+\n', quality, b'\n'])
+                    for name, sequence, quality in zip(self.names(), self.sequences(), self.qualities()))
+
+class ReadStore(object):
+  '''memory mapped read store with random access to its reads and blocks'''
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as fin:
+      size = os.fstat(fin.fileno()).st_size
+      # an empty store has no blocks
+      self.data = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ) if size else b''
+    # offsets and first reads of the blocks, only the headers are read
+    self.offsets, self.firsts = [], []
+    offset, reads = 0, 0
+    while offset < size:
+      block = Block(self.data, offset)
+      self.offsets.append(offset)
+      self.firsts.append(reads)
+      offset += block.size
+      reads += len(block)
+    self.reads = reads
+    self.size = size
+
+  def __len__(self):
+    return self.reads
+
+  def block(self, index):
+    return Block(self.data, self.offsets[index])
+
+  def blocks(self, start = 0, end = None):
+    '''yield the blocks between the byte offsets start and end'''
+    end = self.size if end is None else end
+    for offset in self.offsets[bisect.bisect_left(self.offsets, start):]:
+      if offset >= end:
+        break
+      yield Block(self.data, offset)
+
+  def __getitem__(self, index):
+    '''(name, sequence, quality) of the read with the index'''
+    if index < 0:
+      index += self.reads
+    if not 0 <= index < self.reads:
+      raise IndexError('read %d is not in %s' % (index, self.path))
+    block = bisect.bisect_right(self.firsts, index) - 1
+    return self.block(block).record(index - self.firsts[block])
+
+  def ranges(self, shards):
+    '''split the store into at most shards block aligned byte ranges [(start, end), ...]'''
+    bounds = sorted(set([self.offsets[len(self.offsets) * i // shards] for i in range(1, shards)]) - set([0]))
+    bounds = [0] + bounds + [self.size]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    pass
+
+def read_blocks(path, start = 0, end = None):
+  '''yield the blocks of the store path between the byte offsets start and end'''
+  for block in ReadStore(path).blocks(start, end):
+    yield block
+
+class FastqReader(object):
+  '''read only file object, that returns the reads of a store in fastq format'''
+
+  def __init__(self, path):
+    self.name = path
+    self.chunks = (block.fastq() for block in read_blocks(path))
+    # fastq of the current blocks and the read position in it
+    self.buffer = b''
+    self.position = 0
+
+  def fill(self):
+    '''append the next block to the unread data, False at the end of the store'''
+    chunk = next(self.chunks, None)
+    if chunk is None:
+      return False
+    self.buffer = self.buffer[self.position:] + chunk
+    self.position = 0
+    return True
+
+  def read(self, size = -1):
+    while (size < 0 or len(self.buffer) - self.position < size) and self.fill():
+      pass
+    end = len(self.buffer) if size < 0 else self.position + size
+    data = self.buffer[self.position:end]
+    self.position += len(data)
+    return data
+
+  def readline(self):
+    end = self.buffer.find(b'\n', self.position)
+    while end < 0:
+      searched = len(self.buffer) - self.position
+      if not self.fill():
+        return self.read()
+      end = self.buffer.find(b'\n', searched)
+    line = self.buffer[self.position:end + 1]
+    self.position = end + 1
+    return line
+
+  def __iter__(self):
+    # like a file, iterators share the read position
+    return self
+
+  def __next__(self):
+    line = self.readline()
+    if not line:
+      raise StopIteration
+    return line
+
+  next = __next__
+
+  def close(self):
+    self.chunks = iter([])
+    self.buffer = b''
+    self.position = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class StoreWriter(object):
+  '''
+  write only file object, that stores the fastq records written to it (in any pieces) in
+  blocks of the read store, binned reduces the qualities to the Illumina levels
+  '''
+
+  def __init__(self, path, binned = None):
+    self.name = path
+    self.handle = open(path, 'wb')
+    self.binned = BIN_QUALITIES if binned is None else binned
+    self.rest = b''
+    self.lines = []
+
+  def write(self, data):
+    lines = (self.rest + data).split(b'\n')
+    # the last line is incomplete (empty after a line break)
+    self.rest = lines.pop()
+    self.lines.extend(lines)
+    if len(self.lines) >= 4 * BLOCK_READS:
+      self.flush_block(4 * BLOCK_READS * (len(self.lines) // (4 * BLOCK_READS)))
+
+  def write_reads(self, names, sequences, qualities):
+    '''write reads with the names (headers without @), sequences and qualities (without line breaks)'''
+    for start in range(0, len(sequences), BLOCK_READS):
+      self.handle.write(encode_block(names[start:start + BLOCK_READS], sequences[start:start + BLOCK_READS],
+                                     qualities[start:start + BLOCK_READS], self.binned))
+
+  def flush_block(self, count):
+    '''store the first count complete lines'''
+    lines, self.lines = self.lines[:count], self.lines[count:]
+    headers = lines[0::4]
+    if any(not header.startswith(b'@') for header in headers) or \
+       any(not plus.startswith(b'+') for plus in lines[2::4]):
+      raise ValueError('%s: the written data is not in fastq format' % (self.name))
+    self.write_reads([header[1:].rstrip(b'\r') for header in headers],
+                     [line.rstrip(b'\r') for line in lines[1::4]],
+                     [line.rstrip(b'\r') for line in lines[3::4]])
+
+  def flush(self):
+    self.handle.flush()
+
+  def close(self):
+    if self.handle.closed:
+      return
+    try:
+      if self.rest:
+        # the last line of a file may come without line break
+        self.lines.append(self.rest)
+        self.rest = b''
+      if len(self.lines) % 4:
+        raise ValueError('truncated fastq record written to %s' % (self.name))
+      self.flush_block(len(self.lines))
+    finally:
+      self.handle.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
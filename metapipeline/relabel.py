@@ -0,0 +1,121 @@
+'''
+relabeling of fasta headers for qiime (pick_otus.py): every record of a sample gets the
+header ><SampleID>_<N> <original header>, records shorter than the minimum length are dropped.
+The files are read in large blocks, record boundaries and sequence lengths of a whole block
+are found with numpy, several files are relabeled in parallel and appended in input order.
+'''
+
+# imports
+import os
+import re
+
+from metapipeline.concat import copy_file
+from metapipeline.cache import partial_name, commit
+from metapipeline.compress import open_input
+
+# bytes read at once, a block is extended until it holds at least one complete record
+BLOCK_SIZE = 1 << 24
+# qiime sample ids consist of alphanumeric characters and periods
+INVALID_ID = re.compile(r'[^A-Za-z0-9.]')
+
+def sample_id(name):
+  '''valid qiime sample id of a name, other characters become periods'''
+  return INVALID_ID.sub('.', name)
+
+def record_blocks(handle, size = BLOCK_SIZE):
+  '''yield blocks of complete fasta records, every block ends with a line break'''
+  rest = b''
+  while True:
+    data = handle.read(size)
+    if not data:
+      break
+    block = rest + data
+    # cut behind the last line break followed by a new record
+    cut = block.rfind(b'\n>')
+    if cut < 0:
+      rest = block
+      continue
+    rest = block[cut + 1:]
+    yield block[:cut + 1]
+  if rest.strip():
+    yield rest if rest.endswith(b'\n') else rest + b'\n'
+
+def relabel_block(block, sample, number, minlength):
+  '''
+  relabel the records of a block starting with the number, returns the fasta and mapping
+  data, the number of records and of the written records
+  '''
+  import numpy as np
+  buf = np.frombuffer(block, dtype = np.uint8)
+  newlines = np.flatnonzero(buf == ord('\n'))
+  # records start with > at the beginning of a line
+  starts = np.flatnonzero(buf == ord('>'))
+  starts = starts[(starts == 0) | (buf[np.maximum(starts - 1, 0)] == ord('\n'))]
+  ends = np.append(starts[1:], len(buf))
+  # the header ends with the first line break of the record
+  first = np.searchsorted(newlines, starts)
+  header_ends = newlines[first]
+  # bases of a record are its bytes after the header without the line breaks
+  lengths = (ends - header_ends - 1) - (np.searchsorted(newlines, ends) - first - 1)
+  keep = np.flatnonzero(lengths >= minlength)
+  fasta, mapping = [], []
+  for start, header_end, end in zip(starts[keep].tolist(), header_ends[keep].tolist(), ends[keep].tolist()):
+    header = block[start + 1:header_end]
+    label = b'%s_%d' % (sample, number)
+    fasta.append(b'>' + label + b' ' + header + block[header_end:end])
+    mapping.append(label + b'\t' + (header.split(None, 1) or [b''])[0] + b'\n')
+    number += 1
+  return b''.join(fasta), b''.join(mapping), len(starts), len(keep)
+
+def relabel_file(task):
+  '''relabel one fasta file into its own fasta and mapping part, returns the records and written records'''
+  path, sample, number, minlength, output, mapping = task
+  sample = sample.encode('ascii')
+  records = written = 0
+  with open_input(path) as fin, open(output, 'wb') as fasta, open(mapping, 'wb') as fmap:
+    for block in record_blocks(fin):
+      if not block.startswith(b'>'):
+        raise ValueError('%s is not in fasta format' % (path))
+      data, labels, count, kept = relabel_block(block, sample, number + written, minlength)
+      fasta.write(data)
+      fmap.write(labels)
+      records += count
+      written += kept
+  return records, written
+
+def relabel(input, samples, output, mapping, minlength, processes = 1, count_start = 0):
+  '''
+  relabel the fasta files input of the samples into one fasta output for qiime, mapping gets
+  <new id> <old id> of every written record, returns the records and written records per file
+  '''
+  tasks = [(path, sample, count_start, minlength,
+            '%s.part%04d' % (output, i), '%s.part%04d' % (mapping, i))
+           for i, (path, sample) in enumerate(zip(input, samples))]
+  counts = []
+  # outputs appear when they are complete
+  with open(partial_name(output), 'wb') as fout, open(partial_name(mapping), 'wb') as fmap:
+    fmap.write(b'#new_id\told_id\n')
+    pool = None
+    if processes > 1 and len(tasks) > 1:
+      # multiprocessing is only imported for parallel runs, it slows down the start of small jobs
+      from multiprocessing import Pool
+      pool = Pool(processes)
+    try:
+      # the parts are appended in input order while later files are still relabeled
+      for task, result in zip(tasks, pool.imap(relabel_file, tasks) if pool else map(relabel_file, tasks)):
+        for part, handle in ((task[4], fout), (task[5], fmap)):
+          copy_file(part, handle)
+          os.remove(part)
+        counts.append(result)
+      if pool:
+        pool.close()
+    except:
+      if pool:
+        pool.terminate()
+      raise
+    finally:
+      if pool:
+        pool.join()
+  commit(output)
+  commit(mapping)
+  return counts
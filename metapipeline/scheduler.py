@@ -0,0 +1,177 @@
+'''
+scheduler for running the stages of many samples at the same time: every stage is a job
+with its cores, memory and the jobs it depends on. Jobs are started as soon as their
+dependencies are done and they fit into the global core and memory budget. The progress
+reports of the running jobs are followed in their logs and summarized periodically.
+'''
+
+# imports
+import os
+import sys
+import time
+import subprocess
+
+from metapipeline.metrics import PROGRESS, PROGRESS_INTERVAL, text
+
+# memory reserved for stages, that do not state their needs
+DEFAULT_MEMORY = 1 << 30
+# seconds between polling the running jobs
+POLL_INTERVAL = 0.5
+
+def available_cores():
+  '''number of cpus of the host'''
+  # multiprocessing is imported when needed, it slows down the start of small commands
+  import multiprocessing
+  return multiprocessing.cpu_count()
+
+def available_memory():
+  '''physical memory of the host in bytes'''
+  return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+def read_sample_sheet(path):
+  '''
+  read a tab separated sample sheet with <sample> <forward reads> <reverse reads> per line,
+  empty lines and lines starting with # are ignored
+  '''
+  samples = []
+  with open(path) as fin:
+    for number, line in enumerate(fin):
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      fields = line.split('\t')
+      if len(fields) != 3:
+        raise ValueError('%s line %d: expected <sample> <forward reads> <reverse reads>' % (path, number + 1))
+      samples.append((fields[0], fields[1:]))
+  names = [name for name, reads in samples]
+  if len(set(names)) != len(names):
+    raise ValueError('%s: sample names are not unique' % (path))
+  return samples
+
+class Job(object):
+  '''a command, that needs cores and memory and runs after the jobs in requires'''
+
+  def __init__(self, name, command, cores = 1, memory = DEFAULT_MEMORY, log = None, requires = ()):
+    self.name = name
+    self.command = command
+    self.cores = cores
+    self.memory = memory
+    self.log = log
+    self.requires = list(requires)
+    self.process = None
+    self.state = 'waiting'
+    # read position in the log, the last progress report (stage, reads, reads per second)
+    # and the one written by the scheduler
+    self.offset = 0
+    self.last = None
+    self.shown = None
+
+  def start(self):
+    '''run the command, its output goes to the log file'''
+    output = open(self.log, 'w') if self.log else None
+    try:
+      self.process = subprocess.Popen(self.command, stdout = output, stderr = subprocess.STDOUT if output else None)
+    finally:
+      if output is not None:
+        output.close()
+    self.state = 'running'
+
+  def progress(self):
+    '''latest progress report of the job in its log, None if there is none'''
+    if not self.log or not os.path.isfile(self.log):
+      return self.last
+    with open(self.log, 'rb') as fin:
+      fin.seek(self.offset)
+      data = fin.read()
+    # incomplete lines are read again
+    end = data.rfind(b'\n') + 1
+    self.offset += end
+    for line in data[:end].splitlines():
+      match = PROGRESS.match(text(line))
+      if match:
+        self.last = match.groups()
+    return self.last
+
+  def poll(self):
+    '''update the state of a running job, returns True when it finished'''
+    if self.process.poll() is None:
+      return False
+    self.state = 'done' if self.process.returncode == 0 else 'failed'
+    return True
+
+class Scheduler(object):
+  '''run jobs as a DAG under a budget of cores and memory (bytes)'''
+
+  def __init__(self, cores, memory):
+    self.cores = cores
+    self.memory = memory
+    self.jobs = []
+
+  def add(self, job):
+    '''add a job, its dependencies have to be added before'''
+    for item in job.requires:
+      if item not in self.jobs:
+        raise ValueError('%s depends on unknown job %s' % (job.name, item.name))
+    self.jobs.append(job)
+    return job
+
+  def fits(self, job, running):
+    '''True if job can be started next to the running jobs'''
+    if not running:
+      # a job larger than the budget runs alone
+      return True
+    return sum(item.cores for item in running) + job.cores <= self.cores and \
+           sum(item.memory for item in running) + job.memory <= self.memory
+
+  def ready(self):
+    '''waiting jobs with all dependencies done, jobs later in the DAG first to finish samples early'''
+    jobs = []
+    for job in self.jobs:
+      if job.state != 'waiting':
+        continue
+      states = set(item.state for item in job.requires)
+      if states & set(['failed', 'skipped']):
+        # never run jobs on the results of failed jobs
+        job.state = 'skipped'
+        sys.stdout.write('Skipping %s, a required job failed\n' % (job.name))
+      elif states <= set(['done']):
+        jobs.append(job)
+    return sorted(jobs, key = lambda job: -len(job.requires))
+
+  def run(self):
+    '''run all jobs, returns the jobs that failed or were skipped'''
+    running = []
+    reported = time.time()
+    try:
+      while True:
+        for job in list(running):
+          if job.poll():
+            running.remove(job)
+            sys.stdout.write('%s %s\n' % ('Finished' if job.state == 'done' else 'FAILED', job.name))
+        ready = self.ready()
+        if not ready and not running:
+          break
+        for job in ready:
+          if self.fits(job, running):
+            sys.stdout.write('Starting %s (%d cores, %d MB)\n' % (job.name, job.cores, job.memory >> 20))
+            job.start()
+            running.append(job)
+        if time.time() - reported >= PROGRESS_INTERVAL:
+          reported = time.time()
+          self.report(running)
+        time.sleep(POLL_INTERVAL)
+    except:
+      # stop all running jobs on errors and interrupts
+      for job in running:
+        job.process.terminate()
+      raise
+    return [job for job in self.jobs if job.state != 'done']
+
+  def report(self, running):
+    '''write the progress of the running jobs'''
+    for job in running:
+      progress = job.progress()
+      if progress is not None and progress != job.shown:
+        job.shown = progress
+        sys.stdout.write('Progress %s: %s %s reads, %s reads/s\n' % ((job.name,) + progress))
+    sys.stdout.flush()
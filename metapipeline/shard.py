@@ -0,0 +1,153 @@
+'''
+splitting of (paired) fastq files into record aligned byte ranges, that are processed
+in a multiprocessing pool and merged back in the original order
+'''
+
+# imports
+import os
+from functools import partial
+from multiprocessing import Pool
+
+from metapipeline.concat import copy_file, BackgroundWriter
+from metapipeline import metrics
+
+# windows around the guessed offset of a mate to search for its record
+SEARCH_WINDOWS = [1 << 20, 1 << 24, 1 << 28]
+# do not create shards smaller than this
+MIN_SHARD_SIZE = 1 << 22
+
+def read_id(header):
+  '''name of a read without the leading @ and the /1 or /2 mate suffix'''
+  name = header.split()[0][1:]
+  if name[-2:] in (b'/1', b'/2'):
+    name = name[:-2]
+  return name
+
+def record_start(handle, offset):
+  '''offset of the first fastq record starting at or after offset'''
+  handle.seek(offset)
+  if offset > 0:
+    # skip the rest of the line we jumped into
+    handle.seek(offset - 1)
+    handle.readline()
+  position = handle.tell()
+  lines = [handle.readline() for i in range(3)]
+  while lines[0]:
+    # a header starts with @ and its + line follows after the sequence,
+    # quality lines starting with @ are followed by a sequence two lines later
+    if lines[0].startswith(b'@') and lines[2].startswith(b'+'):
+      return position
+    position += len(lines[0])
+    lines = lines[1:] + [handle.readline()]
+  return position
+
+def find_mate(handle, name, guess, lower, size):
+  '''offset of the record called name in the mate file, searched around guess'''
+  for window in SEARCH_WINDOWS + [size]:
+    start = record_start(handle, max(lower, guess - window))
+    position = start
+    handle.seek(start)
+    while position < guess + window:
+      header = handle.readline()
+      if not header:
+        break
+      if read_id(header) == name:
+        return position
+      # jump over sequence, + and quality line
+      position += len(header) + sum(len(handle.readline()) for i in range(3))
+  raise ValueError('cannot find mate of read %s in paired input' % (name))
+
+def split_records(paths, shards):
+  '''split files into at most shards record aligned ranges [(start, end), ...] per file, mates stay in sync'''
+  size = os.path.getsize(paths[0])
+  shards = max(1, min(shards, size // MIN_SHARD_SIZE))
+  handles = [open(path, 'rb') for path in paths]
+  try:
+    sizes = [os.path.getsize(path) for path in paths]
+    bounds = [[0] for path in paths]
+    for i in range(1, shards):
+      offset = record_start(handles[0], size * i // shards)
+      if offset <= bounds[0][-1] or offset >= size:
+        continue
+      bounds[0].append(offset)
+      # name of the first read in the new shard
+      handles[0].seek(offset)
+      name = read_id(handles[0].readline())
+      # find the same read in the mate files
+      for j in range(1, len(paths)):
+        bounds[j].append(find_mate(handles[j], name, sizes[j] * i // shards,
+                                   bounds[j][-1], sizes[j]))
+    for j in range(len(paths)):
+      bounds[j].append(sizes[j])
+  finally:
+    for handle in handles:
+      handle.close()
+  # transpose to ranges per shard
+  return [[(bounds[j][i], bounds[j][i + 1]) for j in range(len(paths))]
+          for i in range(len(bounds[0]) - 1)]
+
+def read_range(handle, start, end):
+  '''yield the lines of handle between the byte offsets start and end'''
+  handle.seek(start)
+  position = start
+  for line in handle:
+    if position >= end:
+      break
+    position += len(line)
+    yield line
+
+def shard_name(path, index):
+  '''name of the partial output of a shard, with the extension of path'''
+  return os.path.join(os.path.dirname(path), '.shard%03d.%s' % (index, os.path.basename(path)))
+
+def merge_shard(output, handle, index):
+  '''append the shard output to the open final output and remove it'''
+  copy_file(shard_name(output, index), handle)
+  os.remove(shard_name(output, index))
+
+def add_summary(total, summary):
+  '''sum up the counts of a shard summary, nested dictionaries (e.g. length histograms) key by key'''
+  for key, value in summary.items():
+    if isinstance(value, dict):
+      total[key] = add_summary(total.get(key, {}), value)
+    else:
+      total[key] = total.get(key, 0) + value
+  return total
+
+def run_sharded(worker, paths, outputs, processes, args, shards = None, reads = None):
+  '''
+  process record aligned shards of paths with worker(ranges, paths, shard outputs, *args)
+  in a pool of processes, the shard outputs are merged in order into outputs, reads gives
+  the processed reads of a summary for the progress of the stage
+  '''
+  tasks = [(worker, ranges, paths, [None if output is None else shard_name(output, i) for output in outputs], args)
+           for i, ranges in enumerate(split_records(paths, shards or processes * 4))]
+  # final outputs stay open for the whole run and are merged independently,
+  # they may be named pipes read in lockstep
+  outputs = [output for output in outputs if output is not None]
+  handles = [BackgroundWriter(open(output, 'wb')) for output in outputs]
+  total = {}
+  pool = Pool(processes)
+  try:
+    # imap returns in shard order, so merging overlaps with processing of later shards
+    for i, summary in enumerate(pool.imap(run_task, tasks)):
+      for output, handle in zip(outputs, handles):
+        handle.write(partial(merge_shard, output, handle.handle, i))
+      add_summary(total, summary)
+      if reads is not None:
+        metrics.progress(total = reads(total))
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+    for handle in handles:
+      handle.close()
+
+  return total
+
+def run_task(task):
+  '''unpack a shard task in the pool process'''
+  worker, ranges, paths, outputs, args = task
+  return worker(ranges, paths, outputs, *args)
@@ -0,0 +1,93 @@
+'''
+read statistics of the files written by the stages: number of reads, bases and the length
+histogram are collected while the native engines write the records, of the files of external
+tools only the number of reads of their summary is known. They are stored in a small per-sample
+sidecar, that show_read_distribution.R reads instead of counting the lines of every file again.
+'''
+
+# imports
+import os
+from collections import Counter
+
+from metapipeline import metrics
+
+# columns of the sidecar
+FIELDS = ['sample', 'script', 'stage', 'kind', 'file', 'reads', 'bases', 'lengths']
+# kinds of files: raw input, filtered pairs and singles, merged and not merged pairs, unique reads
+KINDS = ['raw', 'paired', 'single', 'concat', 'not_combined', 'nodup']
+
+# statistics of the files written in this run, reused stages add the ones of their manifest
+RECORDED = []
+
+def reset():
+  '''forget the statistics of an earlier command, that ran in the same process'''
+  del RECORDED[:]
+
+def add_lengths(histogram, lengths):
+  '''add the read lengths (list or numpy array) to the histogram {length: reads}'''
+  if hasattr(lengths, 'dtype'):
+    import numpy as np
+    counts = np.bincount(lengths)
+    for length in np.flatnonzero(counts):
+      histogram[int(length)] = histogram.get(int(length), 0) + int(counts[length])
+  else:
+    for length, reads in Counter(lengths).items():
+      histogram[length] = histogram.get(length, 0) + reads
+  return histogram
+
+def record(kind, path, histogram = None, reads = None):
+  '''
+  statistics of a written file, from the length histogram of its reads or only the number
+  of reads (e.g. reported by an external tool), the stage is the one measured at the moment
+  '''
+  lengths = sorted((int(length), count) for length, count in (histogram or {}).items())
+  RECORDED.append({'stage': metrics.ACTIVE[-1].record['stage'] if metrics.ACTIVE else None,
+                   'kind': kind,
+                   'file': os.path.basename(path),
+                   'reads': sum(count for length, count in lengths) if histogram is not None else reads,
+                   'bases': sum(length * count for length, count in lengths) if histogram is not None else None,
+                   'lengths': lengths})
+
+def format_lengths(lengths):
+  '''histogram as <length>:<reads>,...'''
+  return ','.join('%d:%d' % (length, count) for length, count in lengths)
+
+def format_row(row, labels):
+  '''line of the sidecar for a row with the labels (sample and script)'''
+  row = dict(labels, **row)
+  return '\t'.join(format_lengths(row[key]) if key == 'lengths' else
+                   'NA' if row.get(key) is None else str(row[key]) for key in FIELDS)
+
+def write_sidecar(path, labels, rows = None):
+  '''write the statistics of this run (or rows) as tsv with the labels (sample and script)'''
+  lines = ['\t'.join(FIELDS)]
+  for row in (RECORDED if rows is None else rows):
+    lines.append(format_row(row, labels))
+  metrics.write_atomic(path, '\n'.join(lines) + '\n')
+
+def replace_rows(path, labels, rows):
+  '''
+  replace the rows of an existing sidecar, that have the kind of one of rows (e.g. the unique
+  reads of a sample after adding a lane), the sample and script of the sidecar are kept
+  '''
+  lines = ['\t'.join(FIELDS)]
+  if os.path.isfile(path):
+    with open(path) as fin:
+      lines.extend(line.rstrip('\n') for line in list(fin)[1:])
+  kinds = set(row['kind'] for row in rows)
+  if len(lines) > 1:
+    # labels of the existing rows
+    labels = dict(labels, **dict(zip(['sample', 'script'], lines[1].split('\t')[:2])))
+  kept = [line for line in lines[1:] if line.split('\t')[FIELDS.index('kind')] not in kinds]
+  lines = lines[:1] + kept + [format_row(row, labels) for row in rows]
+  metrics.write_atomic(path, '\n'.join(lines) + '\n')
+
+def merge_sidecars(sidecars, path):
+  '''combine the sidecars of several scripts or samples, missing sidecars are skipped'''
+  lines = ['\t'.join(FIELDS)]
+  for sidecar in sidecars:
+    if not os.path.isfile(sidecar):
+      continue
+    with open(sidecar) as fin:
+      lines.extend(line.rstrip('\n') for line in list(fin)[1:])
+  metrics.write_atomic(path, '\n'.join(lines) + '\n')
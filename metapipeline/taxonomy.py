@@ -0,0 +1,171 @@
+'''
+parallel generation of the taxonomy db: the blast db (sqlite, written by blastr) is split
+by query into partitions, the rows of tables with a query_id column are distributed by
+their query, the other tables are copied into every partition. The taxonomy reports of the
+partitions (create_taxonomyDB.R) run in parallel and are merged into one taxonomy db, that
+has to have the tables of QUERY_TABLES and SHARED_TABLES. All hsps of a query stay in one
+partition, so the bitscore tolerance and coverage threshold, which relate the hits of a query
+to each other, select the same hits as in one report.
+'''
+
+# imports
+import os
+import bisect
+import shutil
+import sqlite3
+
+from metapipeline.cache import partial_name, commit
+
+# column, that assigns the rows of a table to a query
+QUERY_COLUMN = 'query_id'
+# rows inserted into a partition at once
+BATCH_SIZE = 10000
+# schema of the taxonomy db written by create_taxonomyDB.R (generate.TaxonomyReport of metaR)
+# tables with the rows of the queries: their integer primary key (None without), that is shifted
+# past the keys of the earlier partitions, and their columns referring to such keys as {column: table}
+QUERY_TABLES = {'taxonomy': ('id', {})}
+# tables describing the whole report (metadata = list(SampleId = 1)), the same in every partition
+SHARED_TABLES = ['metadata']
+
+def quote(name):
+  '''quoted sql identifier'''
+  return '"%s"' % (name.replace('"', '""'))
+
+def tables(connection, schema = 'main'):
+  '''(name, create statement) of the tables of a db'''
+  return connection.execute("SELECT name, sql FROM %s.sqlite_master WHERE type = 'table' "
+                            "AND name NOT LIKE 'sqlite_%%' ORDER BY rowid" % (schema)).fetchall()
+
+def columns(connection, table, schema = 'main'):
+  '''(name, type, primary key) of the columns of a table'''
+  return [(row[1], row[2].upper(), row[5]) for row in
+          connection.execute('PRAGMA %s.table_info(%s)' % (schema, quote(table)))]
+
+def column_names(connection, table, schema = 'main'):
+  '''names of the columns of a table'''
+  return [name for name, type, key in columns(connection, table, schema)]
+
+def query_bounds(path, partitions):
+  '''
+  largest query id of every partition but the last, the partitions get about the same number
+  of rows of the largest per query table (e.g. the hsps), there are at most as many as queries
+  '''
+  connection = sqlite3.connect(path)
+  try:
+    per_query = [name for name, sql in tables(connection) if QUERY_COLUMN in column_names(connection, name)]
+    if not per_query:
+      raise ValueError('%s has no table with a %s column' % (path, QUERY_COLUMN))
+    largest = max(per_query, key = lambda name: connection.execute('SELECT COUNT(*) FROM %s' % (quote(name))).fetchone()[0])
+    counts = connection.execute('SELECT %s, COUNT(*) FROM %s WHERE %s IS NOT NULL GROUP BY %s ORDER BY %s' %
+                                (QUERY_COLUMN, quote(largest), QUERY_COLUMN, QUERY_COLUMN, QUERY_COLUMN)).fetchall()
+  finally:
+    connection.close()
+  total = sum(count for query, count in counts)
+  bounds, rows = [], 0
+  for query, count in counts[:-1]:
+    rows += count
+    if len(bounds) < partitions - 1 and rows * partitions >= total * (len(bounds) + 1):
+      bounds.append(query)
+  return bounds
+
+def partition_of(bounds, query):
+  '''index of the partition of a query id (rows without query go to the first one)'''
+  return 0 if query is None else bisect.bisect_left(bounds, query)
+
+def split_db(path, bounds, directory):
+  '''
+  split the blast db into len(bounds) + 1 partition dbs in directory by query id, the indexes,
+  views and triggers are created in every partition, returns the partitions
+  '''
+  parts = [directory + os.sep + 'blast.part%04d.db' % (i) for i in range(len(bounds) + 1)]
+  for item in parts:
+    if os.path.exists(item):
+      os.remove(item)
+  source = sqlite3.connect(path)
+  targets = [sqlite3.connect(item) for item in parts]
+  try:
+    for name, sql in tables(source):
+      names = column_names(source, name)
+      insert = 'INSERT INTO %s VALUES (%s)' % (quote(name), ', '.join(['?'] * len(names)))
+      for target in targets:
+        target.execute(sql)
+      if QUERY_COLUMN not in names:
+        # e.g. the metadata of the db, every partition gets all rows
+        for target in targets:
+          target.executemany(insert, source.execute('SELECT * FROM %s' % (quote(name))))
+        continue
+      # the table is read once, the rows are routed to the partition of their query
+      position = names.index(QUERY_COLUMN)
+      batches = [[] for item in parts]
+      for row in source.execute('SELECT * FROM %s' % (quote(name))):
+        part = partition_of(bounds, row[position])
+        batches[part].append(row)
+        if len(batches[part]) >= BATCH_SIZE:
+          targets[part].executemany(insert, batches[part])
+          batches[part] = []
+      for target, batch in zip(targets, batches):
+        target.executemany(insert, batch)
+    # indexes are created after the rows are inserted
+    for sql, in source.execute("SELECT sql FROM sqlite_master WHERE type IN ('index', 'view', 'trigger') "
+                               "AND sql IS NOT NULL ORDER BY rowid"):
+      for target in targets:
+        target.execute(sql)
+    for target in targets:
+      target.commit()
+  finally:
+    source.close()
+    for target in targets:
+      target.close()
+  return parts
+
+def check_schema(connection, schema, query_tables, shared_tables):
+  '''raise ValueError, if the tables of a taxonomy db are not the ones of query_tables and shared_tables'''
+  expected = set(query_tables) | set(shared_tables)
+  found = set(name for name, sql in tables(connection, schema))
+  if found != expected:
+    raise ValueError('the taxonomy db has the tables %s, expected %s' % (', '.join(sorted(found)), ', '.join(sorted(expected))))
+  for name, (key, references) in query_tables.items():
+    missing = set([QUERY_COLUMN, key] + list(references)) - set([None]) - set(column_names(connection, name, schema))
+    if missing:
+      raise ValueError('table %s of the taxonomy db has no column %s' % (name, ', '.join(sorted(missing))))
+
+def merge_dbs(parts, output, query_tables = QUERY_TABLES, shared_tables = SHARED_TABLES):
+  '''
+  merge the taxonomy dbs of the partitions into output: the rows of query_tables are concatenated,
+  their keys and the columns referring to them are shifted past the keys of the earlier partitions,
+  so that the references stay intact. The shared_tables have to be the same in every partition
+  '''
+  shutil.copyfile(parts[0], partial_name(output))
+  connection = sqlite3.connect(partial_name(output))
+  try:
+    check_schema(connection, 'main', query_tables, shared_tables)
+    for item in parts[1:]:
+      connection.execute('ATTACH DATABASE ? AS part', (item,))
+      check_schema(connection, 'part', query_tables, shared_tables)
+      for name in shared_tables:
+        # the same rows in both directions and as often
+        for first, second in (('part', 'main'), ('main', 'part')):
+          if connection.execute('SELECT COUNT(*) FROM (SELECT * FROM %s.%s EXCEPT SELECT * FROM %s.%s)' %
+                                (first, quote(name), second, quote(name))).fetchone()[0]:
+            raise ValueError('table %s differs between the partitions' % (name))
+        if len(set(connection.execute('SELECT COUNT(*) FROM %s.%s' % (schema, quote(name))).fetchone()[0]
+                   for schema in ('main', 'part'))) > 1:
+          raise ValueError('table %s differs between the partitions' % (name))
+      # keys of the partition start after the largest key merged so far
+      offsets = dict((name, connection.execute('SELECT COALESCE(MAX(%s), 0) FROM main.%s' %
+                                               (quote(key), quote(name))).fetchone()[0])
+                     for name, (key, references) in query_tables.items() if key)
+      for name, (key, references) in query_tables.items():
+        names = column_names(connection, name, 'part')
+        shifted = dict((column, offsets[table]) for column, table in references.items())
+        if key:
+          shifted[key] = offsets[name]
+        values = ', '.join('%s + %d' % (quote(column), shifted[column]) if column in shifted else quote(column)
+                           for column in names)
+        connection.execute('INSERT INTO main.%s (%s) SELECT %s FROM part.%s' %
+                           (quote(name), ', '.join(quote(column) for column in names), values, quote(name)))
+      connection.commit()
+      connection.execute('DETACH DATABASE part')
+  finally:
+    connection.close()
+  return commit(output)
@@ -0,0 +1,216 @@
+'''
+command lines of the external tools, shared by the scripts and the scheduler of the driver,
+each can be replaced by an environment variable (e.g. with the stand-ins of bench/stubs).
+The tools run with their output collected on an asyncio event loop (threads on python
+before 3.8) and parsed for progress.
+'''
+
+# imports
+import os
+import re
+import sys
+import threading
+import subprocess
+
+if sys.version_info >= (3, 8):
+  # an event loop outside of the main thread watches its processes since python 3.8
+  import asyncio
+else:
+  asyncio = None
+
+from metapipeline import metrics
+
+# jar of trimmomatic and the default heap of its jvm
+TRIMMOMATIC_JAR = os.environ.get('METAPIPELINE_TRIMMOMATIC_JAR', 'ext/Trimmomatic/trimmomatic-0.32.jar')
+JAVA_HEAP = os.environ.get('METAPIPELINE_JAVA_HEAP', '12G')
+# executables
+TRIMMOMATIC = os.environ.get('METAPIPELINE_TRIMMOMATIC', 'java -Xmx%s -jar %s' % (JAVA_HEAP, TRIMMOMATIC_JAR))
+# long-lived trimmomatic worker (default: metapipeline/TrimmomaticWorker.java)
+TRIMMOMATIC_WORKER = os.environ.get('METAPIPELINE_TRIMMOMATIC_WORKER')
+FLASH = os.environ.get('METAPIPELINE_FLASH', 'ext/flash')
+COLLAPSER = os.environ.get('METAPIPELINE_COLLAPSER', 'ext/fastx_collapser')
+RSCRIPT = os.environ.get('METAPIPELINE_RSCRIPT', 'Rscript')
+
+# progress line of flash: read pairs processed so far
+FLASH_PROGRESS = re.compile(r'Processed (\d+) read pairs')
+
+# units of java memory options
+JAVA_UNITS = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+def java_heap(command):
+  '''maximum heap in bytes, that a java command line reserves with -Xmx (0 without)'''
+  match = re.search(r'-Xmx(\d+)([kKmMgGtT]?)', command)
+  if match is None:
+    return 0
+  return int(match.group(1)) * JAVA_UNITS.get(match.group(2).lower(), 1)
+
+def with_heap(command, heap):
+  '''java command line with the maximum heap heap (e.g. 4G), other commands are unchanged'''
+  parts = command.split()
+  if heap is None or not parts or os.path.basename(parts[0]) != 'java':
+    return command
+  # replace the -Xmx option or add it behind the executable
+  options = [item for item in parts[1:] if not item.startswith('-Xmx')]
+  return ' '.join([parts[0], '-Xmx%s' % (heap)] + options)
+
+# event loop of the tools of this process and the process it belongs to (forks start their own)
+LOOP = [None, None]
+LOOP_LOCK = threading.Lock()
+
+def tool_loop():
+  '''the event loop of the tools, that runs in a background thread from its first use'''
+  with LOOP_LOCK:
+    if LOOP[1] != os.getpid():
+      loop = asyncio.new_event_loop()
+      thread = threading.Thread(target = loop.run_forever)
+      thread.daemon = True
+      thread.start()
+      LOOP[:] = [loop, os.getpid()]
+    return LOOP[0]
+
+class ToolProtocol(asyncio.SubprocessProtocol if asyncio else object):
+  '''collects the output of a tool on the event loop, finished is set after its exit and the end of its output'''
+
+  def __init__(self, tool):
+    self.tool = tool
+    # incomplete last line of stdout and stderr
+    self.partial = {1: b'', 2: b''}
+    self.finished = threading.Event()
+
+  def pipe_data_received(self, fd, data):
+    self.tool.output[fd - 1].append(data)
+    if self.tool.progress:
+      lines = (self.partial[fd] + data).split(b'\n')
+      self.partial[fd] = lines.pop()
+      for line in lines:
+        self.tool.report(line)
+
+  def connection_lost(self, exc):
+    self.finished.set()
+
+class Tool(object):
+  '''
+  a running external tool, its stdout and stderr are collected while it runs (a verbose tool
+  never blocks on a full pipe), lines matching the progress pattern report the processed
+  reads (first group times factor) of the running stage, as well as the lines of a log with
+  one line per read (e.g. the trimlog of trimmomatic), stderr = None passes stderr through.
+  The tools of a process share one event loop, without asyncio every tool has its own threads.
+  '''
+
+  def __init__(self, command, progress = None, factor = 1, log = None, stdin = None, stderr = subprocess.PIPE):
+    self.command = command
+    self.progress = progress
+    self.factor = factor
+    self.output = ([], [])
+    if asyncio is None:
+      self.start_threads(stdin, stderr)
+    else:
+      self.start_loop(stdin, stderr)
+    self.counter = LineCounter(log) if log else None
+
+  def start_loop(self, stdin, stderr):
+    '''start the tool on the event loop, stdin = PIPE is a plain pipe for the threads of the caller'''
+    self.loop = tool_loop()
+    self.stdin = None
+    if stdin == subprocess.PIPE:
+      stdin, write = os.pipe()
+      self.stdin = os.fdopen(write, 'wb')
+    self.protocol = ToolProtocol(self)
+    try:
+      start = self.loop.subprocess_exec(lambda: self.protocol, *self.command, stdin = stdin,
+                                        stdout = subprocess.PIPE, stderr = stderr)
+      self.transport = asyncio.run_coroutine_threadsafe(start, self.loop).result()[0]
+    except:
+      if self.stdin is not None:
+        self.stdin.close()
+      raise
+    finally:
+      # the tool has its own end of the pipe
+      if self.stdin is not None:
+        os.close(stdin)
+
+  def start_threads(self, stdin, stderr):
+    '''start the tool, its output is drained by a thread per pipe'''
+    # tools running at the same time must not inherit each others pipes (default of python 2)
+    self.process = subprocess.Popen(self.command, stdin = stdin, stdout = subprocess.PIPE, stderr = stderr,
+                                    close_fds = True)
+    self.stdin = self.process.stdin
+    self.threads = [threading.Thread(target = self.drain, args = (stream, lines))
+                    for stream, lines in zip([self.process.stdout, self.process.stderr], self.output)
+                    if stream is not None]
+    for thread in self.threads:
+      thread.daemon = True
+      thread.start()
+
+  def drain(self, stream, lines):
+    for line in iter(stream.readline, b''):
+      lines.append(line)
+      self.report(line)
+    stream.close()
+
+  def report(self, line):
+    '''report the progress of a line of the output'''
+    match = self.progress.search(metrics.text(line)) if self.progress else None
+    if match:
+      metrics.progress(total = int(match.group(1)) * self.factor)
+
+  def finish(self):
+    '''wait for the end of the tool and its output, returns its exit status'''
+    if asyncio is None:
+      self.process.wait()
+      for thread in self.threads:
+        thread.join()
+      return self.process.returncode
+    self.protocol.finished.wait()
+    returncode = self.transport.get_returncode()
+    self.loop.call_soon_threadsafe(self.transport.close)
+    return returncode
+
+  def wait(self):
+    '''
+    wait for the tool and its output, raises CalledProcessError if it failed (before its
+    summary is parsed or its outputs are committed)
+    '''
+    returncode = self.finish()
+    if self.counter is not None:
+      self.counter.stop()
+    if returncode != 0:
+      # the captured output tells why
+      sys.stderr.write(metrics.text(self.stderr or self.stdout))
+      raise subprocess.CalledProcessError(returncode, ' '.join(self.command), self.stdout)
+    return returncode
+
+  @property
+  def stdout(self):
+    return b''.join(self.output[0])
+
+  @property
+  def stderr(self):
+    return b''.join(self.output[1])
+
+class LineCounter(object):
+  '''count the lines of a growing log in the background as processed reads of the running stage'''
+
+  def __init__(self, path, interval = 1.0):
+    self.path = path
+    self.interval = interval
+    self.done = threading.Event()
+    self.thread = threading.Thread(target = self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def run(self):
+    lines, offset = 0, 0
+    while not self.done.wait(self.interval):
+      if not os.path.isfile(self.path):
+        continue
+      with open(self.path, 'rb') as fin:
+        fin.seek(offset)
+        for block in iter(lambda: fin.read(1 << 20), b''):
+          lines += block.count(b'\n')
+          offset += len(block)
+      metrics.progress(total = lines)
+
+  def stop(self):
+    self.done.set()
+    self.thread.join()
@@ -0,0 +1,153 @@
+'''
+native replacement for the trimmomatic steps of the quality control:
+LEADING, TRAILING, SLIDINGWINDOW and MINLEN are applied in a single pass over every
+read pair. Qualities are processed with numpy on whole batches of reads.
+'''
+
+# imports
+import numpy as np
+
+from metapipeline.fastq import read_batches, format_record
+from metapipeline.shard import read_range, run_sharded
+from metapipeline.compress import open_output
+from metapipeline.stats import add_lengths
+from metapipeline import metrics
+
+# offset of the phred33 quality encoding
+PHRED_OFFSET = 33
+
+def parse_sliding_window(sliding_window):
+  '''split the trimmomatic window argument <size>:<quality> into integers'''
+  size, quality = sliding_window.split(':')
+  return int(size), int(quality)
+
+def quality_matrix(qualities):
+  '''convert a list of quality lines into a padded matrix of phred scores and the read lengths'''
+  # read length without line break
+  lengths = np.array([len(q) - 1 for q in qualities], dtype = np.int64)
+  offsets = np.zeros(len(qualities), dtype = np.int64)
+  offsets[1:] = np.cumsum(lengths + 1)[:-1]
+  width = max(int(lengths.max()), 1)
+  buf = np.frombuffer(b''.join(qualities), dtype = np.uint8)
+  # index every position of every read in the flat buffer and mask the padding
+  positions = np.arange(width)
+  mask = positions[None, :] < lengths[:, None]
+  index = np.minimum(offsets[:, None] + positions[None, :], len(buf) - 1)
+  scores = np.where(mask, buf[index].astype(np.int32) - PHRED_OFFSET, 0)
+  return scores, mask, lengths
+
+def last_true(matrix):
+  '''index of the last True value in every row (only valid where the row has any True)'''
+  return matrix.shape[1] - 1 - matrix[:, ::-1].argmax(axis = 1)
+
+def trim_batch(qualities, leading, trailing, window, minlength):
+  '''compute start and end of the surviving part of every read, end is 0 for dropped reads'''
+  scores, mask, lengths = quality_matrix(qualities)
+  positions = np.arange(scores.shape[1])[None, :]
+  # LEADING: first base at or above the threshold
+  good = mask & (scores >= leading)
+  start = good.argmax(axis = 1)
+  alive = good.any(axis = 1)
+  # TRAILING: last base at or above the threshold
+  good = mask & (scores >= trailing)
+  end = np.where(good.any(axis = 1), last_true(good) + 1, 0)
+  alive &= end > start
+  # SLIDINGWINDOW: window sums via cumulative sums over the trimmed read
+  size, required = window
+  alive &= (end - start) >= size
+  width = scores.shape[1]
+  if width >= size:
+    sums = np.zeros((scores.shape[0], width + 1), dtype = np.int64)
+    np.cumsum(scores, axis = 1, out = sums[:, 1:])
+    windows = sums[:, size:] - sums[:, :-size]
+    begin = positions[:, :windows.shape[1]]
+    failed = (windows < size * required) & (begin >= start[:, None]) & (begin + size <= end[:, None])
+    cut = failed.any(axis = 1)
+    first = failed.argmax(axis = 1)
+    # the first window of the read already fails
+    alive &= ~(cut & (first == start))
+    # keep up to the end of the last good window and drop its low quality tail
+    limit = np.where(cut, first - 1 + size, end)
+    good = mask & (scores >= required) & (positions >= start[:, None]) & (positions < limit[:, None])
+    end = np.where(cut, np.where(good.any(axis = 1), last_true(good) + 1, 0), end)
+    alive &= end > start
+  # MINLEN
+  alive &= (end - start) >= minlength
+  return start, np.where(alive, end, 0)
+
+def trim_paired(input, paired, single, leading, trailing, sliding_window, minlength, batch = 10000):
+  '''
+  trim and length filter the read pairs of the open input handles in one pass
+  surviving pairs are written to the paired handles, reads that lost their mate to single
+  (if single is None, they are dropped), the summary has the length histograms of all files
+  '''
+  window = parse_sliding_window(sliding_window)
+  summary = {'input': 0, 'both': 0, 'forward': 0, 'reverse': 0, 'dropped': 0,
+             'lengths': {'input_forward': {}, 'input_reverse': {}, 'forward': {}, 'reverse': {}, 'single': {}}}
+  lengths = summary['lengths']
+  forward = read_batches(input[0], batch)
+  reverse = read_batches(input[1], batch)
+  for left in forward:
+    right = next(reverse, None)
+    if right is None or len(right[0]) != len(left[0]):
+      raise ValueError('paired input files contain an unequal number of reads')
+    # trim both mates of the batch
+    start_l, end_l = trim_batch(left[3], leading, trailing, window, minlength)
+    start_r, end_r = trim_batch(right[3], leading, trailing, window, minlength)
+    keep_l = end_l > 0
+    keep_r = end_r > 0
+    both = keep_l & keep_r
+    # collect the records of the batch and write them at once
+    out_l, out_r, out_s = [], [], []
+    for i in np.flatnonzero(keep_l | keep_r):
+      if both[i]:
+        out_l.append(format_record(left[0][i], left[1][i], left[2][i], left[3][i], start_l[i], end_l[i]))
+        out_r.append(format_record(right[0][i], right[1][i], right[2][i], right[3][i], start_r[i], end_r[i]))
+      elif keep_l[i]:
+        out_s.append(format_record(left[0][i], left[1][i], left[2][i], left[3][i], start_l[i], end_l[i]))
+      else:
+        out_s.append(format_record(right[0][i], right[1][i], right[2][i], right[3][i], start_r[i], end_r[i]))
+    paired[0].write(b''.join(out_l))
+    paired[1].write(b''.join(out_r))
+    if single is not None:
+      single.write(b''.join(out_s))
+    # update the summary
+    summary['input'] += len(both)
+    summary['both'] += int(both.sum())
+    summary['forward'] += int((keep_l & ~keep_r).sum())
+    summary['reverse'] += int((keep_r & ~keep_l).sum())
+    summary['dropped'] += int((~keep_l & ~keep_r).sum())
+    metrics.progress(2 * len(both))
+    add_lengths(lengths['input_forward'], np.array([len(line) - 1 for line in left[1]], dtype = np.int64))
+    add_lengths(lengths['input_reverse'], np.array([len(line) - 1 for line in right[1]], dtype = np.int64))
+    add_lengths(lengths['forward'], (end_l - start_l)[both])
+    add_lengths(lengths['reverse'], (end_r - start_r)[both])
+    if single is not None:
+      add_lengths(lengths['single'], np.concatenate([(end_l - start_l)[keep_l & ~keep_r],
+                                                     (end_r - start_r)[keep_r & ~keep_l]]))
+  if next(reverse, None) is not None:
+    raise ValueError('paired input files contain an unequal number of reads')
+
+  return summary
+
+def trim_shard(ranges, paths, outputs, leading, trailing, sliding_window, minlength):
+  '''
+  trim one shard of a read pair, outputs are the paired forward, paired reverse and single file
+  compressed outputs are independent gzip members or zstd frames, that are merged by concatenation
+  '''
+  with open(paths[0], 'rb') as forward, open(paths[1], 'rb') as reverse, \
+       open_output(outputs[0]) as paired_forward, open_output(outputs[1]) as paired_reverse:
+    single = open_output(outputs[2]) if outputs[2] is not None else None
+    try:
+      return trim_paired([read_range(forward, *ranges[0]), read_range(reverse, *ranges[1])],
+                         [paired_forward, paired_reverse], single,
+                         leading, trailing, sliding_window, minlength)
+    finally:
+      if single is not None:
+        single.close()
+
+def trim_paired_sharded(paths, outputs, processes, leading, trailing, sliding_window, minlength):
+  '''trim read pairs in record aligned shards on several processes, same results as trim_paired'''
+  return run_sharded(trim_shard, paths, outputs, processes,
+                     (leading, trailing, sliding_window, minlength),
+                     reads = lambda summary: 2 * summary['input'])
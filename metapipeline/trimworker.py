@@ -0,0 +1,111 @@
+'''
+long-lived trimmomatic worker: one jvm runs the trimmomatic calls of a whole run or batch
+instead of a new jvm per call. The worker (TrimmomaticWorker.java, compiled against the jar
+on first use) listens on a local port, a job is one line with the access token and the
+trimmomatic arguments, the answer one json line with the exit status, runtime and log of
+the job, the summary counts are parsed from the log like from the output of trimmomatic.
+'''
+
+# imports
+import os
+import json
+import shlex
+import socket
+import binascii
+import subprocess
+
+from metapipeline import metrics
+from metapipeline.tools import TRIMMOMATIC_JAR, TRIMMOMATIC_WORKER, JAVA_HEAP
+
+# source of the jvm worker
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TrimmomaticWorker.java')
+# environment variable with the access token of the worker, inherited by the scripts
+TOKEN_VARIABLE = 'METAPIPELINE_WORKER_TOKEN'
+# summary parsers of the trimmomatic modes
+PARSERS = {'PE': metrics.parse_trimmomatic_pe, 'SE': metrics.parse_trimmomatic_se}
+
+def compile_worker(directory, jar = TRIMMOMATIC_JAR):
+  '''compile the worker against the trimmomatic jar into directory (once), returns its class path'''
+  target = directory + os.sep + 'TrimmomaticWorker.class'
+  if not os.path.isfile(target) or os.path.getmtime(target) < os.path.getmtime(SOURCE):
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    subprocess.check_call(['javac', '-cp', jar, '-d', directory, SOURCE])
+  return os.pathsep.join([jar, directory])
+
+def worker_command(directory, heap = JAVA_HEAP):
+  '''command line of the worker: the stand-in in METAPIPELINE_TRIMMOMATIC_WORKER or the jvm worker'''
+  if TRIMMOMATIC_WORKER:
+    return shlex.split(TRIMMOMATIC_WORKER)
+  return ['java', '-Xmx%s' % (heap), '-cp', compile_worker(directory), 'TrimmomaticWorker']
+
+class Client(object):
+  '''jobs for a running worker at address <host>:<port>, the token defaults to the one of the environment'''
+
+  def __init__(self, address, token = None):
+    self.address = address
+    self.token = token or os.environ.get(TOKEN_VARIABLE)
+    if not self.token:
+      raise RuntimeError('no access token of the trimmomatic worker in %s' % (TOKEN_VARIABLE))
+
+  def submit(self, mode, args):
+    '''run a trimmomatic job on the worker, returns its summary counts'''
+    return submit(self.address, mode, args, self.token)
+
+  def close(self):
+    pass
+
+class Worker(Client):
+  '''
+  a worker started by this process, classes are compiled into directory, it stops with
+  close (also when this process dies)
+  '''
+
+  def __init__(self, directory, heap = JAVA_HEAP):
+    self.token = binascii.hexlify(os.urandom(16)).decode('ascii')
+    env = dict(os.environ)
+    env[TOKEN_VARIABLE] = self.token
+    # the worker stops, when its stdin is closed
+    self.process = subprocess.Popen(worker_command(directory, heap), stdin = subprocess.PIPE,
+                                    stdout = subprocess.PIPE, env = env)
+    port = self.process.stdout.readline().strip()
+    if not port.isdigit():
+      self.close()
+      raise RuntimeError('trimmomatic worker did not start')
+    self.address = '127.0.0.1:%d' % (int(port))
+
+  def close(self):
+    if self.process.poll() is None:
+      self.process.stdin.close()
+      self.process.wait()
+    self.process.stdout.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+def submit(address, mode, args, token):
+  '''
+  run trimmomatic in mode (PE or SE) with the arguments on the worker at address, returns
+  the summary counts of the job
+  '''
+  if any('\t' in item or '\n' in item for item in args):
+    raise ValueError('trimmomatic arguments with tabs or line breaks cannot be sent to the worker')
+  host, port = address.rsplit(':', 1)
+  connection = socket.create_connection((host, int(port)))
+  try:
+    connection.sendall(('\t'.join([token, mode] + list(args)) + '\n').encode('utf-8'))
+    # the answer comes, when the job is finished
+    answer = connection.makefile('rb')
+    line = answer.readline()
+    answer.close()
+  finally:
+    connection.close()
+  if not line:
+    raise RuntimeError('trimmomatic worker at %s closed the connection' % (address))
+  result = json.loads(line.decode('utf-8'))
+  if result['status'] != 0:
+    raise RuntimeError('trimmomatic %s failed on the worker:\n%s' % (mode, result['log']))
+  return PARSERS[mode](result['log'])
@@ -0,0 +1,51 @@
+'''
+synthetic reads of the tests: random sequences with qualities, that drop towards the end of
+the reads, some with low quality at the start or throughout
+'''
+
+# imports
+import random
+
+def quality(generator, length):
+  '''phred33 quality line of a read'''
+  kind = generator.random()
+  scores = []
+  for position in range(length):
+    if kind < 0.1:
+      score = generator.randint(2, 20)
+    else:
+      score = generator.randint(25, 40) - int(30 * position / length * generator.random())
+    if kind > 0.9 and position < 3:
+      score = generator.randint(0, 5)
+    scores.append(max(0, min(score, 41)))
+  return ''.join(chr(score + 33) for score in scores).encode('ascii')
+
+def sequence(generator, length):
+  return ''.join(generator.choice('ACGT') for position in range(length)).encode('ascii')
+
+def read_pairs(count, seed = 1, length = (20, 150), duplicates = 0.2):
+  '''
+  forward and reverse records (header, sequence, quality) of count read pairs, a fraction
+  of them repeats the sequences of an earlier pair
+  '''
+  generator = random.Random(seed)
+  forward, reverse = [], []
+  for index in range(count):
+    if forward and generator.random() < duplicates:
+      copy = generator.randrange(len(forward))
+      sequences = [forward[copy][1], reverse[copy][1]]
+    else:
+      sequences = [sequence(generator, generator.randint(*length)) for mate in range(2)]
+    name = ('@read%d' % (index)).encode('ascii')
+    forward.append((name + b'/1', sequences[0], quality(generator, len(sequences[0]))))
+    reverse.append((name + b'/2', sequences[1], quality(generator, len(sequences[1]))))
+  return forward, reverse
+
+def fastq(records):
+  '''records as fastq text'''
+  return b''.join(b'%s\n%s\n+\n%s\n' % record for record in records)
+
+def write_fastq(path, records):
+  with open(path, 'wb') as fout:
+    fout.write(fastq(records))
+  return path
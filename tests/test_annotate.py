@@ -0,0 +1,101 @@
+'''
+streaming GO annotation of hmmer tables: every hit with every GO term of its family
+'''
+
+# imports
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import annotate
+
+MAPPING = b'''!version date: 2015/01/01
+!description: Mapping of Pfam entries to GO terms
+PF00001\tGO:0004930\tG-protein coupled receptor activity
+PF00001\tGO:0007186\tG-protein coupled receptor signaling pathway
+PF00002\tGO:0016021\tintegral component of membrane
+'''
+
+# hmmsearch --tblout: target, accession, query, query accession, e-value, score, ...
+TBLOUT = b'''# target name accession query name accession E-value score bias
+seq1 - 7tm_1 PF00001.21 1.2e-10 40.1 0.1 2.0e-10 39.4 0.1 1.1 1 0 0 1 1 1 1 -
+seq2 - 7tm_1 PF00001.21 3.4e-05 20.5 0.0 4.0e-05 20.2 0.0 1.0 1 0 0 1 1 1 1 -
+seq3 - 7tm_2 PF00002.25 5.6e-08 31.0 0.2 6.0e-08 30.9 0.2 1.0 1 0 0 1 1 1 1 -
+seq4 - Unknown PF09999.1 7.8e-03 12.0 0.0 8.0e-03 11.9 0.0 1.0 1 0 0 1 1 1 1 -
+'''
+
+# hmmsearch --domtblout: target, accession, tlen, query, query accession, qlen, e-value, score,
+# bias, #, of, c-evalue, i-evalue, score, ...
+DOMTBLOUT = b'''# target name accession tlen query name accession qlen E-value score bias # of c-Evalue i-Evalue score
+seq1 - 300 7tm_1 PF00001.21 268 1.2e-10 40.1 0.1 1 1 1.0e-13 2.0e-10 39.4 0.1 1 268 10 280 5 290 0.95 -
+seq2 - 310 7tm_1 PF00001.21 268 3.4e-05 20.5 0.0 1 1 2.0e-08 4.0e-05 20.2 0.0 1 268 12 282 8 300 0.90 -
+'''
+
+def rows(path):
+  '''rows of an annotation without the header as tuples'''
+  with open(path, 'rb') as fin:
+    return [tuple(line.rstrip(b'\n').split(b'\t')) for line in fin if not line.startswith(b'#')]
+
+class AnnotateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.mapping = self.write('pfam2go', MAPPING)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, name, data):
+    path = os.path.join(self.directory, name)
+    with open(path, 'wb') as fout:
+      fout.write(data)
+    return path
+
+  def test_tblout(self):
+    output = os.path.join(self.directory, 'annotation.tsv')
+    self.assertEqual(annotate.annotate(self.write('hits.tbl', TBLOUT), self.mapping, output), (4, 3))
+    # every hit of a family is kept, with one row per GO term of the family
+    self.assertEqual(rows(output),
+                     [(b'PF00001', b'seq1', b'GO:0004930', b'G-protein coupled receptor activity', b'', b'1.2e-10', b'40.1'),
+                      (b'PF00001', b'seq1', b'GO:0007186', b'G-protein coupled receptor signaling pathway', b'', b'1.2e-10', b'40.1'),
+                      (b'PF00001', b'seq2', b'GO:0004930', b'G-protein coupled receptor activity', b'', b'3.4e-05', b'20.5'),
+                      (b'PF00001', b'seq2', b'GO:0007186', b'G-protein coupled receptor signaling pathway', b'', b'3.4e-05', b'20.5'),
+                      (b'PF00002', b'seq3', b'GO:0016021', b'integral component of membrane', b'', b'5.6e-08', b'31.0')])
+    with open(output, 'rb') as fin:
+      self.assertEqual(fin.readline(), annotate.HEADER.encode('ascii'))
+
+  def test_domtblout(self):
+    output = os.path.join(self.directory, 'annotation.tsv')
+    self.assertEqual(annotate.annotate(self.write('hits.domtbl', DOMTBLOUT), self.mapping, output,
+                                       table = 'domtblout'), (2, 2))
+    # the accession of the query and the independent e-value and score of the domain
+    self.assertEqual([(row[0], row[1], row[2], row[5], row[6]) for row in rows(output)],
+                     [(b'PF00001', b'seq1', b'GO:0004930', b'2.0e-10', b'39.4'),
+                      (b'PF00001', b'seq1', b'GO:0007186', b'2.0e-10', b'39.4'),
+                      (b'PF00001', b'seq2', b'GO:0004930', b'4.0e-05', b'20.2'),
+                      (b'PF00001', b'seq2', b'GO:0007186', b'4.0e-05', b'20.2')])
+
+  def test_chunks(self):
+    generator = random.Random(1)
+    lines = TBLOUT.splitlines(True)
+    table = self.write('hits.tbl', lines[0] + b''.join(generator.choice(lines[1:]).replace(b'seq', b'seq%d_' % (i), 1)
+                                                       for i in range(5000)))
+    single = os.path.join(self.directory, 'single.tsv')
+    expected = annotate.annotate(table, self.mapping, single)
+    min_chunk_size = annotate.MIN_CHUNK_SIZE
+    annotate.MIN_CHUNK_SIZE = 1 << 12
+    try:
+      self.assertTrue(len(annotate.line_ranges(table, 12)) > 1)
+      chunked = os.path.join(self.directory, 'chunked.tsv')
+      self.assertEqual(annotate.annotate(table, self.mapping, chunked, processes = 3), expected)
+    finally:
+      annotate.MIN_CHUNK_SIZE = min_chunk_size
+    with open(single, 'rb') as fin, open(chunked, 'rb') as other:
+      self.assertEqual(fin.read(), other.read())
+    # the part files of the chunks are removed
+    self.assertEqual([name for name in os.listdir(self.directory) if '.part' in name], [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,98 @@
+'''
+reuse of the stage results with --resume, by fingerprint or by content of the inputs
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+
+from metapipeline.cache import StageCache
+
+class CacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.input = self.path('input.txt')
+    self.output = self.path('output.txt')
+    self.write(self.input, 'reads')
+    self.runs = 0
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def write(self, path, data):
+    with open(path, 'w') as fout:
+      fout.write(data)
+
+  def stage(self):
+    '''the stage of the tests, writes the input in upper case'''
+    self.runs += 1
+    with open(self.input) as fin:
+      self.write(self.output, fin.read().upper())
+    return [self.output]
+
+  def run_stage(self, input = None, params = ['a'], resume = True, **options):
+    cache = StageCache(self.path('cache'), resume, **options)
+    return cache.run('trimming', [input or self.input], params, 'tool 1', self.stage)
+
+  def test_resume(self):
+    self.assertEqual(self.run_stage(resume = False), [self.output])
+    self.assertEqual(self.run_stage(), [self.output])
+    self.assertEqual(self.runs, 1)
+    # without resume the stage runs again
+    self.run_stage(resume = False)
+    self.assertEqual(self.runs, 2)
+    # inputs are addressed by their fingerprint, no hashes are kept
+    self.assertFalse(os.path.exists(self.path('cache/digests.json')))
+
+  def test_changes(self):
+    self.run_stage()
+    # other parameters
+    self.run_stage(params = ['b'])
+    self.assertEqual(self.runs, 2)
+    # another input
+    os.utime(self.input, (1000000000, 1000000000))
+    self.run_stage(params = ['b'])
+    self.assertEqual(self.runs, 3)
+    # changed output
+    self.write(self.output, 'other')
+    self.run_stage(params = ['b'])
+    self.assertEqual(self.runs, 4)
+    # forced stage
+    self.run_stage(params = ['b'], force = ['trimming'])
+    self.assertEqual(self.runs, 5)
+    self.run_stage(params = ['b'])
+    self.assertEqual(self.runs, 5)
+
+  def test_content(self):
+    self.run_stage(content = True)
+    self.assertTrue(os.path.exists(self.path('cache/digests.json')))
+    # a copy of the input with the same content is only reused with content hashing
+    shutil.copyfile(self.input, self.path('copy.txt'))
+    os.remove(self.input)
+    os.rename(self.path('copy.txt'), self.input)
+    os.utime(self.input, (1000000000, 1000000000))
+    self.run_stage(content = True)
+    self.assertEqual(self.runs, 1)
+    self.run_stage()
+    self.assertEqual(self.runs, 2)
+
+  def test_failed_stage(self):
+    def fail():
+      raise RuntimeError('tool failed')
+    self.run_stage()
+    # the manifest is removed before the stage runs again
+    cache = StageCache(self.path('cache'))
+    with self.assertRaises(RuntimeError):
+      cache.run('trimming', [self.input], ['a'], 'tool 1', fail)
+    self.assertFalse(os.path.exists(self.path('cache/trimming.json')))
+    self.run_stage()
+    self.assertEqual(self.runs, 2)
+
+if __name__ == '__main__':
+  unittest.main()
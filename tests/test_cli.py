@@ -0,0 +1,86 @@
+'''
+the single entry point: commands are dispatched to their modules, that are imported only
+when they run
+'''
+
+# imports
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from importlib import import_module
+
+from metapipeline import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules, that a command must not import before it needs them
+HEAVY = ['numpy', 'multiprocessing']
+# help of a command in a fresh interpreter, prints the heavy modules it imported
+HELP = '''
+import sys
+from metapipeline import cli
+try:
+  cli.main([sys.argv[1], '--help'])
+except SystemExit:
+  pass
+sys.stderr.write(' '.join(name for name in %r if name in sys.modules))
+''' % (HEAVY)
+
+class CliTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_commands(self):
+    for name, module, help in cli.COMMANDS:
+      self.assertTrue(cli.command(name) is import_module('metapipeline.commands.' + module).main)
+    with self.assertRaises(KeyError):
+      cli.command('unknown')
+
+  def test_dispatch(self):
+    # the arguments go to the command
+    with open(self.path('pfam2go'), 'wb') as fout:
+      fout.write(b'!version\n!description\nPF00001\tGO:0004930\tG-protein coupled receptor activity\n')
+    with open(self.path('hits.tbl'), 'wb') as fout:
+      fout.write(b'seq1 - 7tm_1 PF00001.21 1.2e-10 40.1 0.1\n')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+      cli.main(['pfam2go', '--mode', 'stream', '-i', self.path('hits.tbl'), '-m', self.path('pfam2go'),
+                '-o', self.path('annotation.tsv')])
+    finally:
+      sys.stdout.close()
+      sys.stdout = stdout
+    with open(self.path('annotation.tsv'), 'rb') as fin:
+      self.assertEqual(fin.read().splitlines()[1].split(b'\t')[:3], [b'PF00001', b'seq1', b'GO:0004930'])
+    # unknown commands are refused by the parser
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+      with self.assertRaises(SystemExit):
+        cli.main(['unknown'])
+    finally:
+      sys.stderr.close()
+      sys.stderr = stderr
+
+  def test_lazy_imports(self):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    for name, module, help in cli.COMMANDS:
+      process = subprocess.Popen([sys.executable, '-c', HELP, name], stdout = subprocess.PIPE,
+                                 stderr = subprocess.PIPE, env = env)
+      output, imported = process.communicate()
+      self.assertEqual(process.returncode, 0)
+      self.assertTrue(b'usage: metapipeline ' + name.encode('ascii') in output)
+      self.assertEqual(imported, b'', '%s --help imports %s' % (name, imported))
+
+if __name__ == '__main__':
+  unittest.main()
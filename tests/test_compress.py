@@ -0,0 +1,73 @@
+'''
+reading and writing of compressed fastq files with the external tools and the python modules
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import compress
+
+DATA = b''.join(b'@read%d\nACGTTGCA\n+\nIIIIHHHH\n' % (index) for index in range(5000))
+
+class CompressTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.readers, self.writers = compress.READERS, compress.WRITERS
+
+  def tearDown(self):
+    compress.READERS, compress.WRITERS = self.readers, self.writers
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def round_trip(self, name):
+    '''write and read back DATA, returns the detected codec'''
+    with compress.open_output(self.path(name), threads = 2) as fout:
+      fout.write(DATA)
+    fin = compress.open_input(self.path(name), threads = 2)
+    try:
+      self.assertEqual(fin.read(), DATA)
+    finally:
+      fin.close()
+    return compress.detect(self.path(name))
+
+  def test_tools(self):
+    self.assertEqual(self.round_trip('reads.fastq'), None)
+    if compress.tool_command(compress.WRITERS['gzip'], 1, 1):
+      self.assertTrue(self.round_trip('reads.fastq.gz') in ('gzip', 'bgzf'))
+    if compress.which('zstd'):
+      self.assertEqual(self.round_trip('reads.fastq.zst'), 'zstd')
+
+  def test_modules(self):
+    # without external tools the python modules are used
+    compress.READERS = dict((codec, []) for codec in self.readers)
+    compress.WRITERS = dict((codec, []) for codec in self.writers)
+    self.assertEqual(self.round_trip('reads.fastq.gz'), 'gzip')
+    try:
+      compress.zstandard()
+    except IOError:
+      with self.assertRaises(IOError):
+        self.round_trip('reads.fastq.zst')
+    else:
+      self.assertEqual(self.round_trip('reads.fastq.zst'), 'zstd')
+
+  def test_names(self):
+    self.assertEqual(compress.strip_extension('reads.fastq.zstd'), 'reads.fastq')
+    self.assertEqual(compress.codec_of_name('reads.fastq.bgz'), 'gzip')
+    self.assertEqual(compress.extension(None), '')
+    # the magic bytes win over the extension
+    with open(self.path('reads.fastq'), 'wb') as fout:
+      fout.write(b'\x28\xb5\x2f\xfd' + DATA[:16])
+    self.assertEqual(compress.detect(self.path('reads.fastq')), 'zstd')
+    # bgzf is gzip with the extra field BC
+    with open(self.path('reads.bgz'), 'wb') as fout:
+      fout.write(b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00')
+    self.assertEqual(compress.detect(self.path('reads.bgz')), 'bgzf')
+
+if __name__ == '__main__':
+  unittest.main()
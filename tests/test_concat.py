@@ -0,0 +1,119 @@
+'''
+concatenation of files, streams into tools and the errors of their feeder threads
+'''
+
+# imports
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+try:
+  from queue import Queue
+except ImportError:
+  from Queue import Queue
+
+from reads import read_pairs, fastq, write_fastq
+from metapipeline import concat
+
+class ConcatTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.forward, self.reverse = read_pairs(500)
+    self.paths = [write_fastq(self.path('reads_1.fastq'), self.forward),
+                  write_fastq(self.path('reads_2.fastq'), self.reverse)]
+    with gzip.open(self.path('reads_2.fastq.gz'), 'wb') as fout:
+      fout.write(fastq(self.reverse))
+    self.expected = fastq(self.forward) + fastq(self.reverse)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_cat_files(self):
+    concat.cat_files(self.paths, self.path('all.fastq'))
+    with open(self.path('all.fastq'), 'rb') as fin:
+      self.assertEqual(fin.read(), self.expected)
+    self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.startswith('.part')), [])
+
+  def test_open_chain(self):
+    input = [self.paths[0], self.path('reads_2.fastq.gz')]
+    with concat.open_chain(input) as fin:
+      self.assertEqual(fin.read(), self.expected)
+    with concat.open_chain(input) as fin:
+      self.assertEqual(b''.join(iter(fin.readline, b'')), self.expected)
+    with concat.open_chain(input) as fin:
+      self.assertEqual(list(fin), self.expected.splitlines(True))
+    with concat.open_chain(input) as fin:
+      self.assertEqual(b''.join(iter(lambda: fin.read(1000), b'')), self.expected)
+
+  def test_stream_into(self):
+    fout = io.BytesIO()
+    concat.stream_into([self.paths[0], self.path('reads_2.fastq.gz')], fout, close = False).wait()
+    self.assertEqual(fout.getvalue(), self.expected)
+
+  def test_interleave_into(self):
+    fout = io.BytesIO()
+    concat.interleave_into(self.paths, fout, close = False).wait()
+    lines = fout.getvalue().splitlines(True)
+    # whole records of both inputs in any order
+    records = sorted(b''.join(lines[i:i + 4]) for i in range(0, len(lines), 4))
+    self.assertEqual(records, sorted(fastq([record]) for record in self.forward + self.reverse))
+
+  def test_fifo_from(self):
+    feeder = concat.fifo_from([self.paths[0], self.path('reads_2.fastq.gz')], self.path('reads.fifo'))
+    with open(feeder.name, 'rb') as fin:
+      self.assertEqual(fin.read(), self.expected)
+    feeder.wait()
+
+  def test_fifo_from_queue(self):
+    queue = Queue()
+    feeder = concat.fifo_from_queue(queue, self.path('reads.fifo'))
+    queue.put([self.paths[0]])
+    with open(feeder.name, 'rb') as fin:
+      # the files added later follow the ones read so far
+      self.assertEqual(fin.read(len(fastq(self.forward))), fastq(self.forward))
+      queue.put([self.path('reads_2.fastq.gz')])
+      queue.put(None)
+      self.assertEqual(fin.read(), fastq(self.reverse))
+    feeder.wait()
+
+  def test_feeder_errors(self):
+    # a missing input ends the stream early, wait raises the error of the thread
+    feeder = concat.fifo_from([self.paths[0], self.path('missing.fastq')], self.path('reads.fifo'))
+    with open(feeder.name, 'rb') as fin:
+      self.assertTrue(len(fin.read()) < len(self.expected))
+    with self.assertRaises(EnvironmentError):
+      feeder.wait()
+    fout = io.BytesIO()
+    with self.assertRaises(EnvironmentError):
+      concat.stream_into([self.path('missing.fastq')], fout, close = False).wait()
+
+  def test_discard_fifos(self):
+    feeder = concat.fifo_from(self.paths, self.path('reads.fifo'))
+    # the writer of the pipe finishes, nothing is read
+    concat.discard_fifos([self.paths[0], feeder.name])
+    feeder.wait()
+
+  def test_background_writer(self):
+    fout = io.BytesIO()
+    fout.close = lambda: None
+    with concat.BackgroundWriter(fout) as writer:
+      for record in self.forward:
+        writer.write(fastq([record]))
+    self.assertEqual(fout.getvalue(), fastq(self.forward))
+    # errors of the writer thread are raised in the writing thread
+    def fail():
+      raise ValueError('write failed')
+    writer = concat.BackgroundWriter(io.BytesIO())
+    writer.write(fail)
+    with self.assertRaises(ValueError):
+      writer.close()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,136 @@
+'''
+the native duplicate removal against the output of fastx_collapser
+'''
+
+# imports
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from reads import read_pairs, write_fastq
+from metapipeline import dedup
+from metapipeline.commands import classify_input
+
+def collapser(records):
+  '''fasta of fastx_collapser: unique sequences labeled <rank>-<count>, most frequent first'''
+  counts = Counter(sequence for name, sequence, quality in records)
+  return b''.join(('>%d-%d\n' % (rank + 1, count)).encode('ascii') + sequence + b'\n'
+                  for rank, (sequence, count) in enumerate(sorted(counts.items(), key = lambda item: (-item[1], item[0]))))
+
+def index_entries(path):
+  '''lines of an index as label, count, sequence, hash and the set of read names, their order may differ'''
+  with open(path, 'rb') as fin:
+    return [line.rstrip(b'\n').split(b'\t')[:4] + [set(line.rstrip(b'\n').split(b'\t')[4].split(b','))] for line in fin]
+
+class DedupTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.forward, self.reverse = read_pairs(3000, length = (10, 40), duplicates = 0.4)
+    self.paths = [write_fastq(self.path('reads_1.fastq'), self.forward),
+                  write_fastq(self.path('reads_2.fastq'), self.reverse)]
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_same_as_collapser(self):
+    expected = collapser(self.forward + self.reverse)
+    for processes in (1, 3):
+      output, index = self.path('nodup%d.fasta' % (processes)), self.path('nodup%d.index.tsv' % (processes))
+      reads, uniques, lengths = dedup.remove_duplicates(self.paths, output, index, processes)
+      with open(output, 'rb') as fin:
+        self.assertEqual(fin.read(), expected)
+      self.assertEqual(reads, 2 * len(self.forward))
+      self.assertEqual(uniques, expected.count(b'>'))
+      self.assertEqual(sum(lengths.values()), uniques)
+
+  def test_index(self):
+    output, index = self.path('nodup.fasta'), self.path('nodup.index.tsv')
+    dedup.remove_duplicates(self.paths, output, index, 2)
+    names = {}
+    for name, sequence, quality in self.forward + self.reverse:
+      names.setdefault(sequence, set()).add(name[1:])
+    with open(output, 'rb') as fin:
+      labels = [line[1:].rstrip(b'\n') for line in fin if line.startswith(b'>')]
+    with open(index, 'rb') as fin:
+      lines = [line.rstrip(b'\n').split(b'\t') for line in fin]
+    # every unique sequence has its line with the label of the fasta and the names of its reads
+    self.assertEqual([line[0] for line in lines], labels)
+    for label, count, sequence, key, reads in lines:
+      self.assertEqual(set(reads.split(b',')), names.pop(sequence))
+      self.assertEqual(int(count), len(reads.split(b',')))
+      self.assertEqual(label.split(b'-')[1], count)
+      self.assertEqual(key, dedup.sequence_key(sequence))
+    self.assertEqual(names, {})
+
+  def test_reverse_complement(self):
+    output, index = self.path('nodup.fasta'), self.path('nodup.index.tsv')
+    dedup.remove_duplicates(self.paths, output, index, 2, reverse_complement = True)
+    canonical = set(dedup.canonical(sequence) for name, sequence, quality in self.forward + self.reverse)
+    with open(output, 'rb') as fin:
+      sequences = [line.rstrip(b'\n') for line in fin if not line.startswith(b'>')]
+    self.assertEqual(sorted(sequences), sorted(canonical))
+    self.assertEqual(dedup.canonical(b'TTGCA'), b'TGCAA')
+
+  def test_external_sort(self):
+    native = [self.path('native.fasta'), self.path('native.index.tsv')]
+    expected = dedup.remove_duplicates(self.paths, native[0], native[1], 2)
+    # several runs of a few reads, merged in several passes
+    min_memory, fanin = dedup.MIN_MEMORY, dedup.MERGE_FANIN
+    dedup.MIN_MEMORY, dedup.MERGE_FANIN = 1, 4
+    try:
+      for processes in (1, 3):
+        external = [self.path('external%d.fasta' % (processes)), self.path('external%d.index.tsv' % (processes))]
+        reads, uniques, lengths, spills = dedup.remove_duplicates_external(self.paths, external[0], external[1],
+                                                                           20000, processes)
+        self.assertEqual((reads, uniques, lengths), expected)
+        self.assertTrue(spills['runs'] > 4 * dedup.MERGE_FANIN)
+        with open(native[0], 'rb') as fin, open(external[0], 'rb') as other:
+          self.assertEqual(fin.read(), other.read())
+        self.assertEqual(index_entries(native[1]), index_entries(external[1]))
+    finally:
+      dedup.MIN_MEMORY, dedup.MERGE_FANIN = min_memory, fanin
+
+  def test_merge_lanes(self):
+    # the reads of both files as two lanes of a sample
+    whole = [self.path('all.fasta'), self.path('all.index.tsv')]
+    dedup.remove_duplicates(self.paths, whole[0], whole[1])
+    sample = [self.path('sample.fasta'), self.path('sample.index.tsv')]
+    lane = [self.path('lane.fasta'), self.path('lane.index.tsv')]
+    for path in self.paths:
+      dedup.remove_duplicates([path], lane[0], lane[1])
+      lane_reads, lane_uniques, new, reads, uniques, lengths = dedup.merge_index(lane[1], sample[0], sample[1])
+      self.assertEqual(lane_reads, len(self.forward))
+    with open(whole[0], 'rb') as fin, open(sample[0], 'rb') as other:
+      self.assertEqual(fin.read(), other.read())
+    self.assertEqual(index_entries(whole[1]), index_entries(sample[1]))
+    self.assertEqual((reads, uniques), (2 * len(self.forward), len(index_entries(whole[1]))))
+
+  def test_lane_setting(self):
+    # a lane deduplicated with another --reverse_complement than the first dedup of the sample is refused
+    sample, lane = self.path('sample'), self.path('lane')
+    for folder in (sample, lane):
+      os.makedirs(folder)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+      classify_input.native_remove_duplicates(self.paths[0], sample, 1, False)
+      classify_input.native_remove_duplicates(self.paths[1], lane, 1, True)
+      with self.assertRaises(RuntimeError):
+        classify_input.merge_lane(lane, sample, True)
+      classify_input.native_remove_duplicates(self.paths[1], lane, 1, False)
+      classify_input.merge_lane(lane, sample, False)
+    finally:
+      sys.stdout.close()
+      sys.stdout = stdout
+    with open(os.path.join(sample, 'classify.nodup.lanes.tsv')) as fin:
+      self.assertEqual([line.split('\t')[2] for line in fin], ['reverse_complement', 'False', 'False'])
+
+if __name__ == '__main__':
+  unittest.main()
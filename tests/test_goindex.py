@@ -0,0 +1,102 @@
+'''
+the memory mapped pfam2go index: lookups like the mapping file and rebuilds when it changes
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import goindex
+
+MAPPING = b'''!version date: 2015/01/01
+!description: Mapping of Pfam entries to GO terms
+PF00001\tGO:0004930\tG-protein coupled receptor activity
+PF00002\tGO:0004930\tG-protein coupled receptor activity
+PF00002\tGO:0016021\tintegral component of membrane
+
+PF00010\tGO:0046983\tprotein dimerization activity
+PF00001\tGO:0007186\tG-protein coupled receptor signaling pathway
+'''
+
+class GoIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.mapping = os.path.join(self.directory, 'pfam2go')
+    self.index = self.mapping + '.idx'
+    self.write(MAPPING)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, data, mtime = None):
+    with open(self.mapping, 'wb') as fout:
+      fout.write(data)
+    if mtime is not None:
+      os.utime(self.mapping, (mtime, mtime))
+
+  def load(self):
+    '''load the index, True if it was built again'''
+    before = os.stat(self.index).st_ino if os.path.exists(self.index) else None
+    index = goindex.load(self.mapping)
+    index.close()
+    return os.stat(self.index).st_ino != before
+
+  def test_lookup(self):
+    index = goindex.load(self.mapping)
+    try:
+      table = goindex.read_mapping(self.mapping)
+      self.assertEqual(len(index), len(table))
+      self.assertEqual(list(index), sorted(table))
+      for key, rows in table.items():
+        self.assertEqual(index.rows(key), [goindex.text(row).split('\t') for row in rows])
+        self.assertEqual(index.get(goindex.text(key)), goindex.text(rows[-1]).split('\t'))
+      self.assertEqual(index.rows('PF00001'), [['GO:0004930', 'G-protein coupled receptor activity'],
+                                               ['GO:0007186', 'G-protein coupled receptor signaling pathway']])
+      self.assertTrue('PF00010' in index)
+      self.assertFalse('PF00003' in index)
+      self.assertEqual(index.rows('PF99999'), [])
+      self.assertEqual(index.get('PF00000', 'none'), 'none')
+    finally:
+      index.close()
+
+  def test_rebuild_on_change(self):
+    self.assertTrue(self.load())
+    # unchanged mapping, the index is reused
+    self.assertFalse(self.load())
+    # new content of another size
+    self.write(MAPPING + b'PF00011\tGO:0005515\tprotein binding\n')
+    self.assertTrue(self.load())
+    index = goindex.load(self.mapping)
+    self.assertEqual(index.get('PF00011'), ['GO:0005515', 'protein binding'])
+    index.close()
+
+  def test_rebuild_same_size(self):
+    self.write(MAPPING, 1000000000)
+    self.assertTrue(self.load())
+    self.write(MAPPING.replace(b'PF00010', b'PF00012'), 1000000100)
+    self.assertTrue(self.load())
+    index = goindex.load(self.mapping)
+    self.assertEqual((index.get('PF00010'), index.get('PF00012')), (None, ['GO:0046983', 'protein dimerization activity']))
+    index.close()
+
+  def test_touched_mapping(self):
+    self.write(MAPPING, 1000000000)
+    self.assertTrue(self.load())
+    # same content with a new mtime is hashed once, the new mtime is stored in the index
+    self.write(MAPPING, 1000000100)
+    self.assertFalse(self.load())
+    index = goindex.GoIndex(self.index)
+    self.assertEqual(index.mtime, 1000000100)
+    index.close()
+
+  def test_not_an_index(self):
+    with open(self.index, 'wb') as fout:
+      fout.write(b'\0' * goindex.HEADER.size)
+    with self.assertRaises(ValueError):
+      goindex.GoIndex(self.index)
+
+if __name__ == '__main__':
+  unittest.main()
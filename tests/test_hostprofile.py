@@ -0,0 +1,92 @@
+'''
+threads chosen from the throughput profile of the host
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import ArgumentTypeError
+
+from metapipeline import hostprofile
+
+def profile(stage, engine, measured):
+  '''profile with the reads per second of a stage by threads'''
+  return {'stages': {hostprofile.stage_key(stage, engine): dict((str(threads), samples)
+                                                                 for threads, samples in measured.items())}}
+
+class ChooseTest(unittest.TestCase):
+
+  def test_without_measurements(self):
+    self.assertEqual(hostprofile.choose({}, 'trimming', 'native', 8), 8)
+    self.assertEqual(hostprofile.choose(profile('merging', 'flash', {4: [100]}), 'trimming', 'native', 8), 8)
+    # samples are ignored above the limit
+    self.assertEqual(hostprofile.choose(profile('trimming', 'native', {16: [100]}), 'trimming', 'native', 8), 8)
+
+  def test_single_threaded(self):
+    self.assertEqual(hostprofile.choose(profile('dedup', 'collapser', {8: [100]}), 'dedup', 'collapser', 8), 1)
+
+  def test_still_scaling(self):
+    # the most threads measured were the fastest, the limit is tried
+    measured = profile('trimming', 'native', {1: [100], 2: [190], 4: [370]})
+    self.assertEqual(hostprofile.choose(measured, 'trimming', 'native', 8), 8)
+    self.assertEqual(hostprofile.choose(measured, 'trimming', 'native', 4), 4)
+
+  def test_not_scaling(self):
+    # the fewest threads measured were as fast, half of them are tried
+    measured = profile('merging', 'flash', {4: [100], 8: [98]})
+    self.assertEqual(hostprofile.choose(measured, 'merging', 'flash', 8), 2)
+    # down to one thread
+    self.assertEqual(hostprofile.choose(profile('merging', 'flash', {1: [100], 2: [100]}), 'merging', 'flash', 8), 1)
+
+  def test_saturated(self):
+    # the fewest threads within the tolerance of the best
+    measured = profile('trimming', 'native', {1: [100], 2: [190], 4: [350], 8: [360]})
+    self.assertEqual(hostprofile.choose(measured, 'trimming', 'native', 8), 4)
+    # the median of the samples counts
+    measured = profile('trimming', 'native', {1: [100], 2: [100, 300, 310], 4: [320, 100, 330]})
+    self.assertEqual(hostprofile.choose(measured, 'trimming', 'native', 8), 2)
+
+  def test_allocate(self):
+    measured = profile('trimming', 'native', {1: [100], 2: [190], 4: [350], 8: [360]})
+    self.assertEqual(hostprofile.allocate(measured, [('trimming', 'native'), ('dedup', 'collapser'),
+                                                     ('merging', 'flash')], 8),
+                     {'trimming': 4, 'dedup': 1, 'merging': 8})
+
+  def test_stage_threads(self):
+    self.assertEqual(hostprofile.stage_threads('trimming=4'), ('trimming', 4))
+    for text in ('trimming', 'trimming=', 'trimming=0', 'trimming=x'):
+      with self.assertRaises(ArgumentTypeError):
+        hostprofile.stage_threads(text)
+
+class UpdateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'profiles', 'profile.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def record(self, **values):
+    record = {'stage': 'trimming', 'engine': 'native', 'threads': 4, 'reads_in_per_second': 1000.0,
+              'wall_seconds': hostprofile.MIN_SECONDS + 1, 'reused': False, 'error': False}
+    record.update(values)
+    return record
+
+  def test_update(self):
+    self.assertEqual(hostprofile.load(self.path), {})
+    skipped = [self.record(threads = None), self.record(reused = True), self.record(error = True),
+               self.record(reads_in_per_second = None), self.record(wall_seconds = hostprofile.MIN_SECONDS / 2)]
+    self.assertEqual(hostprofile.update(self.path, skipped), 0)
+    self.assertFalse(os.path.exists(self.path))
+    for i in range(hostprofile.MAX_SAMPLES + 2):
+      self.assertEqual(hostprofile.update(self.path, [self.record(reads_in_per_second = float(i + 1))]), 1)
+    samples = hostprofile.load(self.path)['stages']['trimming/native']['4']
+    # only the latest samples are kept
+    self.assertEqual(samples, [float(i) for i in range(3, hostprofile.MAX_SAMPLES + 3)])
+    self.assertEqual(hostprofile.throughput(hostprofile.load(self.path), 'trimming', 'native', 8), {4: 5.0})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+'''
+the native read pair merger against a base by base search of the best overlap
+'''
+
+# imports
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from reads import quality, fastq, write_fastq
+
+try:
+  import numpy
+  from metapipeline import merger, shard
+except ImportError:
+  numpy = None
+
+COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A', 'N': 'N'}
+
+def reverse_complement(sequence):
+  return ''.join(COMPLEMENT[base] for base in reversed(sequence))
+
+def fragments(count, seed = 1, length = 100, errors = 0.02):
+  '''read pairs of fragments of 60 to 260 bases, some bases are changed or N'''
+  generator = random.Random(seed)
+  forward, reverse, inserts = [], [], []
+  for index in range(count):
+    insert = ''.join(generator.choice('ACGT') for i in range(generator.randint(60, 260)))
+    mates = [insert[:length], reverse_complement(insert)[:length]]
+    for mate in range(2):
+      mates[mate] = ''.join(generator.choice('ACGTN') if generator.random() < errors else base for base in mates[mate])
+    name = ('@pair%d' % (index)).encode('ascii')
+    forward.append((name + b'/1', mates[0].encode('ascii'), quality(generator, len(mates[0]))))
+    reverse.append((name + b'/2', mates[1].encode('ascii'), quality(generator, len(mates[1]))))
+    inserts.append(insert)
+  return forward, reverse, inserts
+
+def best_overlap(forward, reverse, min_overlap, max_overlap, max_density):
+  '''overlap with the lowest mismatch density (longer ones win ties), 0 without'''
+  reverse = reverse_complement(reverse)
+  best = None
+  for overlap in range(1, min(len(forward), len(reverse)) + 1):
+    pairs = [(a, b) for a, b in zip(forward[len(forward) - overlap:], reverse[:overlap]) if 'N' not in (a, b)]
+    mismatches = sum(1 for a, b in pairs if a != b)
+    density = mismatches / float(max(min(len(pairs), max_overlap), 1))
+    if overlap < min_overlap or len(pairs) < min_overlap or density > max_density:
+      continue
+    if best is None or (density, -overlap) <= best:
+      best = (density, -overlap)
+  return 0 if best is None else -best[1]
+
+@unittest.skipIf(numpy is None, 'numpy is missing')
+class MergerTest(unittest.TestCase):
+
+  def test_best_overlap(self):
+    forward, reverse, inserts = fragments(500)
+    batches = [[[name + b'\n', sequence + b'\n', b'+\n', scores + b'\n'] for name, sequence, scores in records]
+               for records in (forward, reverse)]
+    left, right = [[list(lines) for lines in zip(*batch)] for batch in batches]
+    for options in ((10, 200, 0.25), (20, 50, 0.1)):
+      merged, unmerged = merger.merge_batch(left, right, *options)[:2]
+      overlaps = [best_overlap(first[1].decode('ascii'), second[1].decode('ascii'), *options)
+                  for first, second in zip(forward, reverse)]
+      # lengths of the merged reads in the order of the pairs
+      lines = merged.splitlines()
+      self.assertEqual([len(lines[i]) for i in range(1, len(lines), 4)],
+                       [len(first[1]) + len(second[1]) - overlap
+                        for first, second, overlap in zip(forward, reverse, overlaps) if overlap])
+      self.assertEqual(unmerged.count(b'\n'), 8 * overlaps.count(0))
+
+  def test_exact_pairs(self):
+    forward, reverse, inserts = fragments(300, errors = 0)
+    extended, not_combined = io.BytesIO(), io.BytesIO()
+    summary = merger.merge_paired([io.BytesIO(fastq(forward)), io.BytesIO(fastq(reverse))], extended, not_combined,
+                                  batch = 64)
+    lines = extended.getvalue().splitlines()
+    merged = dict((lines[i][1:-2], lines[i + 1]) for i in range(0, len(lines), 4))
+    # pairs of short fragments merge into the fragment, pairs without any overlap are not combined
+    for left, right, insert in zip(forward, reverse, inserts):
+      name = left[0][1:-2]
+      if len(insert) <= len(left[1]) + len(right[1]) - merger.MIN_OVERLAP:
+        self.assertEqual(merged.get(name), insert.encode('ascii'))
+      elif not best_overlap(left[1].decode('ascii'), right[1].decode('ascii'), merger.MIN_OVERLAP,
+                            merger.MAX_OVERLAP, merger.MAX_MISMATCH_DENSITY):
+        self.assertFalse(name in merged)
+    self.assertEqual(summary['total'], len(forward))
+    self.assertEqual(summary['combined'], len(merged))
+    # not combined pairs are interleaved
+    self.assertEqual(not_combined.getvalue(), b''.join(fastq([left, right]) for left, right in zip(forward, reverse)
+                                                       if left[0][1:-2] not in merged))
+
+  def test_sharded(self):
+    directory = tempfile.mkdtemp()
+    min_shard_size = shard.MIN_SHARD_SIZE
+    shard.MIN_SHARD_SIZE = 1 << 12
+    try:
+      forward, reverse, inserts = fragments(2000)
+      paths = [write_fastq(os.path.join(directory, 'reads_1.fastq'), forward),
+               write_fastq(os.path.join(directory, 'reads_2.fastq'), reverse)]
+      outputs = [os.path.join(directory, 'extendedFrags.fastq'), os.path.join(directory, 'notCombined.fastq')]
+      with open(paths[0], 'rb') as left, open(paths[1], 'rb') as right, \
+           open(outputs[0], 'wb') as extended, open(outputs[1], 'wb') as not_combined:
+        expected = merger.merge_paired([left, right], extended, not_combined)
+      sharded = [output + '.sharded' for output in outputs]
+      self.assertEqual(merger.merge_paired_sharded(paths, sharded, 3), expected)
+      for output, other in zip(outputs, sharded):
+        with open(output, 'rb') as fin, open(other, 'rb') as other_fin:
+          self.assertEqual(fin.read(), other_fin.read())
+    finally:
+      shard.MIN_SHARD_SIZE = min_shard_size
+      shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+'''
+run reports of the stages and the parsers of the tool summaries
+'''
+
+# imports
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import metrics
+
+class RecorderTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_stages(self):
+    with open(self.path('input'), 'wb') as fout:
+      fout.write(b'x' * 100)
+    recorder = metrics.Recorder({'sample': 'A', 'script': 'quality_control'})
+    with recorder.stage('trimming', [self.path('input')], lambda: [self.path('input')]):
+      metrics.count(reads_in = 10, reads_out = 8)
+      metrics.threads(4, 'native')
+      metrics.spilled(5)
+      metrics.spilled(7)
+    with self.assertRaises(ValueError):
+      with recorder.stage('dedup', [self.path('input')], lambda: [self.path('missing')]):
+        raise ValueError('tool failed')
+    # the failed stage is recorded with error set, outside of a stage counts are ignored
+    metrics.count(reads_in = 1)
+    trimming, dedup = recorder.records
+    self.assertEqual((trimming['stage'], trimming['error'], trimming['sample']), ('trimming', False, 'A'))
+    self.assertEqual((trimming['reads_in'], trimming['reads_out'], trimming['threads'], trimming['engine']),
+                     (10, 8, 4, 'native'))
+    self.assertEqual((trimming['bytes_read'], trimming['bytes_written'], trimming['bytes_spilled']), (100, 100, 12))
+    self.assertEqual((dedup['stage'], dedup['error'], dedup['bytes_written'], dedup['reads_in']), ('dedup', True, 0, None))
+    self.assertEqual(metrics.ACTIVE, [])
+
+  def test_reports(self):
+    recorder = metrics.Recorder({'sample': 'A "1"', 'script': 'quality_control'})
+    with recorder.stage('trimming', []):
+      metrics.count(reads_in = 10)
+    recorder.write(self.path('metrics'), self.path('metrics.prom'))
+    with open(self.path('metrics.json')) as fin:
+      self.assertEqual(json.load(fin)['stages'], recorder.records)
+    with open(self.path('metrics.tsv')) as fin:
+      lines = [line.rstrip('\n').split('\t') for line in fin]
+    self.assertEqual(lines[0], metrics.FIELDS)
+    self.assertEqual(dict(zip(lines[0], lines[1]))['reads_in'], '10')
+    with open(self.path('metrics.prom')) as fin:
+      self.assertTrue('metapipeline_stage_reads_in{sample="A \\"1\\"",script="quality_control",stage="trimming"} 10\n'
+                      in fin.read())
+    # reports of several scripts are merged, missing ones are skipped
+    records = metrics.merge_reports([self.path('metrics.json'), self.path('missing.json'), self.path('metrics.json')],
+                                    self.path('run'))
+    self.assertEqual(len(records), 2)
+    self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.tmp')])
+
+class ParserTest(unittest.TestCase):
+
+  def test_trimmomatic(self):
+    output = ('Input Read Pairs: 100 Both Surviving: 80 (80.00%) Forward Only Surviving: 10 (10.00%) '
+              'Reverse Only Surviving: 5 (5.00%) Dropped: 5 (5.00%)\nTrimmomaticPE: Completed successfully\n')
+    self.assertEqual(metrics.parse_trimmomatic_pe(output.encode('ascii')),
+                     {'input': 100, 'both': 80, 'forward': 10, 'reverse': 5, 'dropped': 5})
+    self.assertEqual(metrics.parse_trimmomatic_se('Input Reads: 20 Surviving: 15 (75.00%) Dropped: 5 (25.00%)'),
+                     {'input': 20, 'surviving': 15, 'dropped': 5})
+
+  def test_flash_and_collapser(self):
+    self.assertEqual(metrics.parse_flash('[FLASH] Read combination statistics:\n[FLASH]     Total pairs:      100\n'
+                                         '[FLASH]     Combined pairs:   60\n[FLASH]     Uncombined pairs: 40\n'),
+                     {'total': 100, 'combined': 60, 'uncombined': 40})
+    self.assertEqual(metrics.parse_collapser('Input: 10 sequences (representing 10 reads)\n'
+                                             'Output: 7 sequences (representing 10 reads)\n'),
+                     {'input_sequences': 10, 'input_reads': 10, 'output_sequences': 7, 'output_reads': 10})
+
+  def test_missing_summary(self):
+    with self.assertRaises(ValueError):
+      metrics.parse_flash('Segmentation fault\n')
+
+if __name__ == '__main__':
+  unittest.main()
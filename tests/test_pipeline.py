@@ -0,0 +1,104 @@
+'''
+meta-pipeline.py end to end with the stand-ins of bench/stubs: the streaming run gives the
+classify input of the run with intermediate files, a failed stage stops the run cleanly
+'''
+
+# imports
+import os
+import sys
+import stat
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from reads import read_pairs, write_fastq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, 'bench', 'stubs')
+# trimming parameters of the runs
+QC_PARAMS = ['--leading', '3', '--trailing', '3', '--sliding_window', '4:15', '--minlength', '36']
+# seconds until a run counts as hanging
+TIMEOUT = 120
+
+class PipelineTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    forward, reverse = read_pairs(1000)
+    self.reads = [write_fastq(self.path('reads_1.fastq'), forward),
+                  write_fastq(self.path('reads_2.fastq'), reverse)]
+    self.env = dict(os.environ)
+    self.env['METAPIPELINE_PROFILE_DIR'] = self.path('profile')
+    for variable, stub in (('METAPIPELINE_TRIMMOMATIC', 'trimmomatic.py'), ('METAPIPELINE_FLASH', 'flash.py'),
+                           ('METAPIPELINE_COLLAPSER', 'fastx_collapser.py')):
+      self.env[variable] = '%s %s' % (sys.executable, os.path.join(STUBS, stub))
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def run_pipeline(self, output, options = [], **env):
+    '''exit code of meta-pipeline.py, that has to finish within TIMEOUT'''
+    with open(self.path(output + '.log'), 'wb') as log:
+      process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'meta-pipeline.py'), '-t', '2',
+                                  '-o', self.path(output)] + QC_PARAMS + options + self.reads,
+                                 stdout = log, stderr = subprocess.STDOUT, env = dict(self.env, **env),
+                                 cwd = self.directory)
+      deadline = time.time() + TIMEOUT
+      while process.poll() is None and time.time() < deadline:
+        time.sleep(0.1)
+      if process.poll() is None:
+        process.kill()
+        process.wait()
+        self.fail('meta-pipeline.py did not finish within %d seconds' % (TIMEOUT))
+    return process.returncode
+
+  def fifos(self, output):
+    '''named pipes left in the output folder'''
+    return [os.path.join(folder, name) for folder, folders, names in os.walk(self.path(output))
+            for name in names if stat.S_ISFIFO(os.lstat(os.path.join(folder, name)).st_mode)]
+
+  def processes(self, output):
+    '''running processes, whose command line names the output folder'''
+    found = []
+    for pid in os.listdir('/proc'):
+      try:
+        with open('/proc/%s/cmdline' % (pid), 'rb') as fin:
+          command = fin.read()
+      except (IOError, OSError):
+        continue
+      if pid.isdigit() and self.path(output).encode('utf-8') in command:
+        found.append(command.replace(b'\0', b' '))
+    return found
+
+  def test_streaming(self):
+    self.assertEqual(self.run_pipeline('streaming'), 0)
+    self.assertEqual(self.run_pipeline('intermediates', ['--keep-intermediates']), 0)
+    nodup = []
+    for output in ('streaming', 'intermediates'):
+      with open(os.path.join(self.path(output), 'classify_input', 'classify.nodup.fasta'), 'rb') as fin:
+        nodup.append(fin.read())
+    self.assertTrue(nodup[0].count(b'>') > 0)
+    self.assertEqual(nodup[0], nodup[1])
+    # the quality controlled reads went through named pipes only
+    self.assertEqual(self.fifos('streaming'), [])
+    self.assertFalse(os.path.exists(os.path.join(self.path('streaming'), 'quality_controled', 'reads_1.filtered.fastq')))
+
+  @unittest.skipIf(not os.path.isdir('/proc'), 'processes are listed from /proc')
+  def test_failed_stage(self):
+    # every stage fails in turn, the other one must neither wait on its named pipes forever
+    # nor leave tools behind, that do
+    for variable in ('METAPIPELINE_TRIMMOMATIC', 'METAPIPELINE_FLASH', 'METAPIPELINE_COLLAPSER'):
+      output = 'failed_' + variable.lower()
+      self.assertNotEqual(self.run_pipeline(output, **{variable: 'false'}), 0)
+      self.assertEqual(self.fifos(output), [])
+      # killed tools are gone after a moment
+      time.sleep(0.5)
+      self.assertEqual(self.processes(output), [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,131 @@
+'''
+read stores give back the fastq written to them, with every encoding of bases and qualities
+'''
+
+# imports
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from reads import read_pairs, fastq
+
+try:
+  import numpy
+  from metapipeline import readstore
+except ImportError:
+  numpy = None
+
+@unittest.skipIf(numpy is None, 'numpy is missing')
+class ReadStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    # several blocks per store
+    self.block_reads = readstore.BLOCK_READS
+    readstore.BLOCK_READS = 100
+
+  def tearDown(self):
+    readstore.BLOCK_READS = self.block_reads
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def store(self, records, name = 'reads.mprs', binned = False):
+    '''write the records to a store in pieces of random size'''
+    data = fastq(records)
+    generator = random.Random(len(data))
+    position = 0
+    with readstore.StoreWriter(self.path(name), binned) as fout:
+      while position < len(data):
+        size = generator.randint(1, 5000)
+        fout.write(data[position:position + size])
+        position += size
+    return self.path(name)
+
+  def export(self, path):
+    with readstore.FastqReader(path) as fin:
+      return fin.read()
+
+  def check(self, records, flags = 0):
+    path = self.store(records)
+    self.assertEqual(self.export(path), fastq(records))
+    store = readstore.ReadStore(path)
+    self.assertEqual(len(store), len(records))
+    for block in store.blocks():
+      self.assertEqual(block.flags & flags, flags)
+    return store
+
+  def test_round_trip(self):
+    forward, reverse = read_pairs(1000)
+    store = self.check(forward)
+    self.assertEqual(len(store.offsets), 10)
+    for index in (0, 99, 100, 555, 999, -1):
+      self.assertEqual(store[index], (forward[index][0][1:], forward[index][1], forward[index][2]))
+    with self.assertRaises(IndexError):
+      store[1000]
+    with readstore.FastqReader(store.path) as fin:
+      self.assertEqual(list(fin), fastq(forward).splitlines(True))
+
+  def test_encodings(self):
+    generator = random.Random(1)
+    def records(bases, qualities, count = 300):
+      reads = []
+      for index in range(count):
+        length = generator.randint(0, 80)
+        reads.append((('@read%d extra' % (index)).encode('ascii'),
+                      ''.join(generator.choice(bases) for i in range(length)).encode('ascii'),
+                      ''.join(generator.choice(qualities) for i in range(length)).encode('ascii')))
+      return reads
+    # constant qualities are run-length encoded
+    self.check(records('ACGT', 'I'), readstore.RLE)
+    # up to 16 levels are packed with 4 bits
+    self.check(records('ACGT', '#+5?FIJ'), readstore.PACKED)
+    # more levels are kept as they are
+    store = self.check(records('ACGT', ''.join(chr(33 + i) for i in range(42))))
+    self.assertFalse(any(block.flags & (readstore.RLE | readstore.PACKED) for block in store.blocks()))
+    # rare and frequent other bases
+    self.check(records('ACGT' * 50 + 'N', 'IJ'))
+    self.check(records('ACGTNRY', 'IJ'), readstore.BITMAP)
+
+  def test_binned(self):
+    forward, reverse = read_pairs(300)
+    path = self.store(forward, binned = True)
+    bins = dict((chr(33 + score), chr(readstore.BINS[33 + score])) for score in range(42))
+    expected = [(name, sequence, ''.join(bins[char] for char in quality.decode('ascii')).encode('ascii'))
+                for name, sequence, quality in forward]
+    self.assertEqual(self.export(path), fastq(expected))
+
+  def test_concatenated_stores(self):
+    forward, reverse = read_pairs(450)
+    paths = [self.store(forward, 'a.mprs'), self.store(reverse, 'b.mprs')]
+    with open(self.path('both.mprs'), 'wb') as fout:
+      for path in paths:
+        with open(path, 'rb') as fin:
+          fout.write(fin.read())
+    store = readstore.ReadStore(self.path('both.mprs'))
+    self.assertEqual(self.export(store.path), fastq(forward + reverse))
+    # the ranges cover the store at block boundaries
+    for shards in (1, 3, 100):
+      ranges = store.ranges(shards)
+      self.assertTrue(len(ranges) <= shards)
+      self.assertEqual((ranges[0][0], ranges[-1][1]), (0, store.size))
+      self.assertEqual(b''.join(block.fastq() for start, end in ranges for block in store.blocks(start, end)),
+                       fastq(forward + reverse))
+
+  def test_empty_and_invalid(self):
+    self.assertEqual(self.export(self.store([])), b'')
+    self.assertEqual(len(readstore.ReadStore(self.path('reads.mprs'))), 0)
+    writer = readstore.StoreWriter(self.path('bad.mprs'))
+    writer.write(b'read\nACGT\n+\nIIII\n')
+    with self.assertRaises(ValueError):
+      writer.close()
+    writer = readstore.StoreWriter(self.path('truncated.mprs'))
+    writer.write(b'@read\nACGT\n+\n')
+    with self.assertRaises(ValueError):
+      writer.close()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+'''
+relabeling of the fasta files for qiime against a record by record relabeling
+'''
+
+# imports
+import os
+import random
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+try:
+  import numpy
+  from metapipeline import relabel
+except ImportError:
+  numpy = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# relabeling of one file in a fresh interpreter, prints whether it imported multiprocessing
+SINGLE = '''
+import sys
+from metapipeline import relabel
+relabel.relabel([sys.argv[1]], ['S1'], sys.argv[2], sys.argv[3], 1, 4)
+sys.stderr.write(str('multiprocessing' in sys.modules))
+'''
+
+def fasta(count, seed):
+  '''records as (header, sequence lines), some are short or span several lines'''
+  generator = random.Random(seed)
+  records = []
+  for index in range(count):
+    sequence = ''.join(generator.choice('ACGT') for i in range(generator.randint(1, 300)))
+    lines = [sequence[start:start + 70] for start in range(0, len(sequence), 70)]
+    records.append(('read%d-%d description' % (index, generator.randint(1, 9)), lines))
+  return records
+
+def expected(records, sample, minlength, start):
+  '''fasta and mapping lines of the records of one sample'''
+  fasta, mapping = [], []
+  for header, lines in records:
+    if len(''.join(lines)) < minlength:
+      continue
+    label = '%s_%d' % (sample, start + len(mapping))
+    fasta.append('>%s %s\n%s\n' % (label, header, '\n'.join(lines)))
+    mapping.append('%s\t%s\n' % (label, header.split()[0]))
+  return ''.join(fasta), mapping
+
+@unittest.skipIf(numpy is None, 'numpy is missing')
+class RelabelTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.block_size = relabel.BLOCK_SIZE
+    # many blocks, that are extended to complete records
+    relabel.BLOCK_SIZE = 1000
+
+  def tearDown(self):
+    relabel.BLOCK_SIZE = self.block_size
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_relabel(self):
+    samples = ['S1', 'S.2', 'S3']
+    records = [fasta(count, seed) for seed, count in enumerate((400, 1, 250))]
+    paths = []
+    for sample, items in zip(samples, records):
+      paths.append(self.path(sample + '.fasta'))
+      with open(paths[-1], 'w') as fout:
+        fout.write(''.join('>%s\n%s\n' % (header, '\n'.join(lines)) for header, lines in items))
+    fasta_out, mapping = [], ['#new_id\told_id\n']
+    for sample, items in zip(samples, records):
+      data, lines = expected(items, sample, 50, 1)
+      fasta_out.append(data)
+      mapping.extend(lines)
+    for processes in (1, 3):
+      output, mapping_output = self.path('seqs%d.fna' % (processes)), self.path('mapping%d.tsv' % (processes))
+      counts = relabel.relabel(paths, samples, output, mapping_output, 50, processes, 1)
+      with open(output) as fin:
+        self.assertEqual(fin.read(), ''.join(fasta_out))
+      with open(mapping_output) as fin:
+        self.assertEqual(fin.read(), ''.join(mapping))
+      self.assertEqual([count[0] for count in counts], [len(items) for items in records])
+      self.assertEqual(sum(count[1] for count in counts), len(mapping) - 1)
+    self.assertFalse([name for name in os.listdir(self.directory) if '.part' in name])
+
+  def test_not_fasta(self):
+    with open(self.path('reads.fastq'), 'w') as fout:
+      fout.write('@read\nACGT\n+\nIIII\n')
+    with self.assertRaises(ValueError):
+      relabel.relabel([self.path('reads.fastq')], ['S1'], self.path('seqs.fna'), self.path('mapping.tsv'), 1)
+
+  def test_single_file(self):
+    # one file is relabeled in the calling process, without multiprocessing
+    with open(self.path('reads.fasta'), 'w') as fout:
+      fout.write('>read\nACGT\n')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    process = subprocess.Popen([sys.executable, '-c', SINGLE, self.path('reads.fasta'), self.path('seqs.fna'),
+                                self.path('mapping.tsv')], stderr = subprocess.PIPE, env = env)
+    self.assertEqual(process.communicate()[1], b'False')
+    self.assertEqual(process.returncode, 0)
+
+  def test_sample_id(self):
+    self.assertEqual(relabel.sample_id('sample_1-a.b'), 'sample.1.a.b')
+
+if __name__ == '__main__':
+  unittest.main()
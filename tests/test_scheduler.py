@@ -0,0 +1,116 @@
+'''
+jobs of the batch mode run as a DAG under the core and memory budget
+'''
+
+# imports
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import scheduler
+from metapipeline.scheduler import Job, Scheduler
+
+class Output(object):
+  '''stand-in for stdout, that keeps the messages of the scheduler'''
+
+  def __init__(self):
+    self.lines = []
+
+  def write(self, data):
+    self.lines.append(data)
+
+  def flush(self):
+    pass
+
+class SchedulerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.stdout, self.interval = sys.stdout, scheduler.POLL_INTERVAL
+    sys.stdout, scheduler.POLL_INTERVAL = Output(), 0.02
+
+  def tearDown(self):
+    sys.stdout, scheduler.POLL_INTERVAL = self.stdout, self.interval
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def job(self, name, status = 0, **options):
+    '''job, that records its start and end time in the file name.times'''
+    script = ('import sys, time\n'
+              'fout = open(%r, "w")\n'
+              'fout.write("%%r\\n" %% time.time())\n'
+              'time.sleep(0.2)\n'
+              'fout.write("%%r\\n" %% time.time())\n'
+              'sys.exit(%d)\n') % (self.path(name + '.times'), status)
+    return Job(name, [sys.executable, '-c', script], **options)
+
+  def times(self, name):
+    with open(self.path(name + '.times')) as fin:
+      return [float(line) for line in fin]
+
+  def most_concurrent(self, names):
+    '''highest number of jobs running at the same time'''
+    events = sorted([(start, 1) for start, end in map(self.times, names)] +
+                    [(end, -1) for start, end in map(self.times, names)])
+    running, most = 0, 0
+    for time, change in events:
+      running += change
+      most = max(most, running)
+    return most
+
+  def test_dependencies(self):
+    jobs = Scheduler(4, 1 << 40)
+    trimming = jobs.add(self.job('trimming'))
+    merging = jobs.add(self.job('merging', requires = [trimming]))
+    dedup = jobs.add(self.job('dedup', requires = [trimming, merging]))
+    self.assertEqual(jobs.run(), [])
+    self.assertTrue(self.times('trimming')[1] <= self.times('merging')[0])
+    self.assertTrue(self.times('merging')[1] <= self.times('dedup')[0])
+    # unknown dependencies are refused
+    with self.assertRaises(ValueError):
+      jobs.add(Job('other', ['true'], requires = [Job('unknown', ['true'])]))
+
+  def test_failure(self):
+    jobs = Scheduler(4, 1 << 40)
+    failed = jobs.add(self.job('a_trimming', status = 1))
+    skipped = jobs.add(self.job('a_merging', requires = [failed]))
+    later = jobs.add(self.job('a_dedup', requires = [skipped]))
+    other = jobs.add(self.job('b_trimming'))
+    self.assertEqual(jobs.run(), [failed, skipped, later])
+    self.assertEqual([job.state for job in jobs.jobs], ['failed', 'skipped', 'skipped', 'done'])
+    self.assertFalse(os.path.exists(self.path('a_merging.times')))
+
+  def test_budget(self):
+    names = ['job%d' % (index) for index in range(6)]
+    jobs = Scheduler(4, 3 << 30)
+    for name in names:
+      jobs.add(self.job(name, cores = 2, memory = 1 << 30))
+    self.assertEqual(jobs.run(), [])
+    self.assertEqual(self.most_concurrent(names), 2)
+    # memory limits as well, a job larger than the budget runs alone
+    jobs = Scheduler(16, 3 << 30)
+    for name in names[:4]:
+      jobs.add(self.job(name, memory = 3 << 29))
+    jobs.add(self.job('large', memory = 1 << 32))
+    self.assertEqual(jobs.run(), [])
+    self.assertEqual(self.most_concurrent(names[:4]), 2)
+    for name in names[:4]:
+      self.assertEqual(self.most_concurrent([name, 'large']), 1)
+
+  def test_sample_sheet(self):
+    with open(self.path('samples.tsv'), 'w') as fout:
+      fout.write('# sample\tforward\treverse\n\nA\ta_1.fq\ta_2.fq\nB\tb_1.fq\tb_2.fq\n')
+    self.assertEqual(scheduler.read_sample_sheet(self.path('samples.tsv')),
+                     [('A', ['a_1.fq', 'a_2.fq']), ('B', ['b_1.fq', 'b_2.fq'])])
+    for data in ('A\ta_1.fq\n', 'A\ta_1.fq\ta_2.fq\nA\tb_1.fq\tb_2.fq\n'):
+      with open(self.path('samples.tsv'), 'w') as fout:
+        fout.write(data)
+      with self.assertRaises(ValueError):
+        scheduler.read_sample_sheet(self.path('samples.tsv'))
+
+if __name__ == '__main__':
+  unittest.main()
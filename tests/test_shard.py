@@ -0,0 +1,85 @@
+'''
+record aligned shards of paired files and the sharded quality control against the unsharded one
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+
+from reads import read_pairs, write_fastq
+from metapipeline import shard
+
+try:
+  import numpy
+  from metapipeline import trimmer
+except ImportError:
+  numpy = None
+
+class ShardTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    # mates of different lengths, so that the shards of the files start at different offsets
+    forward, reverse = read_pairs(3000, length = (20, 150))
+    self.paths = [write_fastq(os.path.join(self.directory, 'reads_1.fastq'), forward),
+                  write_fastq(os.path.join(self.directory, 'reads_2.fastq'), reverse)]
+    # small files are split into several shards too
+    self.min_shard_size = shard.MIN_SHARD_SIZE
+    shard.MIN_SHARD_SIZE = 1 << 12
+
+  def tearDown(self):
+    shard.MIN_SHARD_SIZE = self.min_shard_size
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def test_split_records(self):
+    for shards in (1, 2, 7, 40):
+      ranges = shard.split_records(self.paths, shards)
+      self.assertTrue(len(ranges) <= shards)
+      self.assertEqual(len(ranges) == 1, shards == 1)
+      for j, path in enumerate(self.paths):
+        # the shards cover the file without gaps
+        self.assertEqual([item[j][0] for item in ranges[1:]], [item[j][1] for item in ranges[:-1]])
+        self.assertEqual((ranges[0][j][0], ranges[-1][j][1]), (0, os.path.getsize(path)))
+      # every shard starts at a record and with the same read in both files
+      handles = [open(path, 'rb') for path in self.paths]
+      try:
+        for item in ranges:
+          lines = [list(shard.read_range(handle, *span)) for handle, span in zip(handles, item)]
+          self.assertEqual(len(lines[0]), len(lines[1]))
+          self.assertEqual(len(lines[0]) % 4, 0)
+          self.assertEqual([shard.read_id(line) for line in lines[0][::4]],
+                           [shard.read_id(line) for line in lines[1][::4]])
+      finally:
+        for handle in handles:
+          handle.close()
+
+  def test_add_summary(self):
+    total = {}
+    shard.add_summary(total, {'input': 2, 'lengths': {'forward': {10: 1}}})
+    shard.add_summary(total, {'input': 3, 'lengths': {'forward': {10: 2, 20: 1}}})
+    self.assertEqual(total, {'input': 5, 'lengths': {'forward': {10: 3, 20: 1}}})
+
+  @unittest.skipIf(numpy is None, 'numpy is missing')
+  def test_sharded_trimming(self):
+    names = ['paired_1.fastq', 'paired_2.fastq', 'single.fastq']
+    with open(self.paths[0], 'rb') as forward, open(self.paths[1], 'rb') as reverse, \
+         open(self.path(names[0]), 'wb') as paired_forward, open(self.path(names[1]), 'wb') as paired_reverse, \
+         open(self.path(names[2]), 'wb') as single:
+      expected = trimmer.trim_paired([forward, reverse], [paired_forward, paired_reverse], single, 3, 3, '4:15', 36)
+    for processes in (1, 3):
+      outputs = [self.path('%d.%s' % (processes, name)) for name in names]
+      summary = trimmer.trim_paired_sharded(self.paths, outputs, processes, 3, 3, '4:15', 36)
+      self.assertEqual(summary, expected)
+      for name, output in zip(names, outputs):
+        with open(self.path(name), 'rb') as fin, open(output, 'rb') as other:
+          self.assertEqual(fin.read(), other.read())
+      # no shard outputs are left
+      self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('.shard')], [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,64 @@
+'''
+read statistics of the written files and their per-sample sidecars
+'''
+
+# imports
+import os
+import shutil
+import tempfile
+import unittest
+
+from metapipeline import metrics, stats
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+class StatsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    stats.reset()
+
+  def tearDown(self):
+    stats.reset()
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def rows(self, path):
+    with open(path) as fin:
+      return [line.rstrip('\n').split('\t') for line in fin]
+
+  def test_lengths(self):
+    self.assertEqual(stats.add_lengths({3: 1}, [3, 5, 5]), {3: 2, 5: 2})
+    if numpy is not None:
+      self.assertEqual(stats.add_lengths({3: 1}, numpy.array([3, 5, 5])), {3: 2, 5: 2})
+
+  def test_sidecar(self):
+    recorder = metrics.Recorder()
+    with recorder.stage('trimming', []):
+      stats.record('paired', '/data/A_1.fastq', {100: 2, 50: 1})
+    stats.record('concat', 'A.extendedFrags.fastq', reads = 7)
+    labels = {'sample': 'A', 'script': 'quality_control'}
+    stats.write_sidecar(self.path('A.stats.tsv'), labels)
+    header, paired, concat = self.rows(self.path('A.stats.tsv'))
+    self.assertEqual(header, stats.FIELDS)
+    self.assertEqual(paired, ['A', 'quality_control', 'trimming', 'paired', 'A_1.fastq', '3', '250', '50:1,100:2'])
+    self.assertEqual(concat, ['A', 'quality_control', 'NA', 'concat', 'A.extendedFrags.fastq', '7', 'NA', ''])
+    # rows of a kind are replaced, the labels of the sidecar are kept
+    stats.replace_rows(self.path('A.stats.tsv'), {'sample': 'B', 'script': 'other'},
+                       [{'stage': 'dedup', 'kind': 'concat', 'file': 'A.fasta', 'reads': 5, 'bases': None,
+                         'lengths': []}])
+    rows = self.rows(self.path('A.stats.tsv'))
+    self.assertEqual([row[3] for row in rows[1:]], ['paired', 'concat'])
+    self.assertEqual(rows[2][:5], ['A', 'quality_control', 'dedup', 'concat', 'A.fasta'])
+    # sidecars of several samples are merged, missing ones are skipped
+    stats.merge_sidecars([self.path('A.stats.tsv'), self.path('missing.tsv'), self.path('A.stats.tsv')],
+                         self.path('all.stats.tsv'))
+    self.assertEqual(self.rows(self.path('all.stats.tsv')), rows + rows[1:])
+
+if __name__ == '__main__':
+  unittest.main()
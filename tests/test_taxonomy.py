@@ -0,0 +1,147 @@
+'''
+the taxonomy db merged from the partitions of a blast db equals the one of a single report
+'''
+
+# imports
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from metapipeline import taxonomy
+
+def blast_db(path, queries = 200, seed = 1):
+  '''small blast db with the tables of blastr, some queries without hits'''
+  generator = random.Random(seed)
+  connection = sqlite3.connect(path)
+  connection.execute('CREATE TABLE query (query_id INTEGER PRIMARY KEY, query_def TEXT, query_len INTEGER)')
+  connection.execute('CREATE TABLE hit (query_id INTEGER, hit_id INTEGER PRIMARY KEY, accession TEXT)')
+  connection.execute('CREATE TABLE hsp (query_id INTEGER, hit_id INTEGER, hsp_id INTEGER PRIMARY KEY, '
+                     'bit_score REAL, query_from INTEGER, query_to INTEGER)')
+  connection.execute('CREATE TABLE meta (key TEXT, value TEXT)')
+  connection.execute("INSERT INTO meta VALUES ('program', 'blastn')")
+  hit = hsp = 0
+  for query in range(1, queries + 1):
+    length = generator.randint(100, 400)
+    connection.execute('INSERT INTO query VALUES (?, ?, ?)', (query, 'read%d' % (query), length))
+    for number in range(generator.choice([0, 1, 3, 10])):
+      hit += 1
+      connection.execute('INSERT INTO hit VALUES (?, ?, ?)', (query, hit, 'ACC%04d' % (generator.randint(1, 500))))
+      for item in range(generator.randint(1, 3)):
+        hsp += 1
+        start = generator.randint(1, length)
+        connection.execute('INSERT INTO hsp VALUES (?, ?, ?, ?, ?, ?)',
+                           (query, hit, hsp, generator.uniform(30, 300), start, generator.randint(start, length)))
+  connection.execute('CREATE INDEX hsp_query ON hsp (query_id)')
+  connection.commit()
+  connection.close()
+
+def report(blast, output, lineage = False, tolerance = 0.9, coverage = 0.3):
+  '''
+  stand-in of create_taxonomyDB.R: the hits of a query within the bitscore tolerance and above
+  the coverage threshold, with lineage a table referring to the taxonomy rows
+  '''
+  source = sqlite3.connect(blast)
+  lengths = dict(source.execute('SELECT query_id, query_len FROM query'))
+  accessions = dict(source.execute('SELECT hit_id, accession FROM hit'))
+  hsps = {}
+  for query, hit, score, start, end in source.execute('SELECT query_id, hit_id, bit_score, query_from, query_to FROM hsp'):
+    hsps.setdefault(query, []).append((hit, score, start, end))
+  source.close()
+  connection = sqlite3.connect(output)
+  connection.execute('CREATE TABLE taxonomy (id INTEGER PRIMARY KEY, query_id INTEGER, tax_id TEXT, hits INTEGER)')
+  connection.execute('CREATE TABLE metadata (SampleId INTEGER)')
+  connection.execute('INSERT INTO metadata VALUES (1)')
+  if lineage:
+    connection.execute('CREATE TABLE lineage (id INTEGER PRIMARY KEY, query_id INTEGER, taxonomy_id INTEGER, rank TEXT)')
+  for query in sorted(lengths):
+    rows = hsps.get(query, [])
+    if not rows:
+      continue
+    best = max(score for hit, score, start, end in rows)
+    kept = [hit for hit, score, start, end in rows
+            if score >= tolerance * best and (end - start + 1) / float(lengths[query]) >= coverage]
+    if not kept:
+      continue
+    row = connection.execute('INSERT INTO taxonomy (query_id, tax_id, hits) VALUES (?, ?, ?)',
+                             (query, min(accessions[hit] for hit in kept), len(kept))).lastrowid
+    if lineage:
+      for rank in ('genus', 'species'):
+        connection.execute('INSERT INTO lineage (query_id, taxonomy_id, rank) VALUES (?, ?, ?)', (query, row, rank))
+  connection.commit()
+  connection.close()
+
+def dump(path):
+  '''all rows of all tables of a db'''
+  connection = sqlite3.connect(path)
+  try:
+    return dict((name, connection.execute('SELECT * FROM %s ORDER BY rowid' % (taxonomy.quote(name))).fetchall())
+                for name, sql in taxonomy.tables(connection))
+  finally:
+    connection.close()
+
+class MergeTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.blast = os.path.join(self.directory, 'blast.db')
+    blast_db(self.blast)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def partitioned(self, partitions, lineage = False, **merge):
+    '''taxonomy db of the partitions of the blast db, merged'''
+    parts = taxonomy.split_db(self.blast, taxonomy.query_bounds(self.blast, partitions), self.directory)
+    self.assertEqual(len(parts), partitions)
+    reports = []
+    for part in parts:
+      reports.append(part.replace('blast.', 'taxonomy.'))
+      if os.path.exists(reports[-1]):
+        os.remove(reports[-1])
+      report(part, reports[-1], lineage)
+    return taxonomy.merge_dbs(reports, self.path('merged.db'), **merge)
+
+  def test_split_keeps_all_rows(self):
+    parts = taxonomy.split_db(self.blast, taxonomy.query_bounds(self.blast, 3), self.directory)
+    whole = dump(self.blast)
+    tables = [dump(part) for part in parts]
+    for name in ('query', 'hit', 'hsp'):
+      self.assertEqual(sorted(row for table in tables for row in table[name]), sorted(whole[name]))
+    for table in tables:
+      self.assertEqual(table['meta'], whole['meta'])
+
+  def test_merged_equals_single_report(self):
+    report(self.blast, self.path('single.db'))
+    for partitions in (2, 3, 7):
+      self.assertEqual(dump(self.partitioned(partitions)), dump(self.path('single.db')))
+
+  def test_references_stay_intact(self):
+    report(self.blast, self.path('single.db'), lineage = True)
+    merged = self.partitioned(4, lineage = True,
+                              query_tables = {'taxonomy': ('id', {}), 'lineage': ('id', {'taxonomy_id': 'taxonomy'})})
+    self.assertEqual(dump(merged), dump(self.path('single.db')))
+
+  def test_unexpected_table(self):
+    with self.assertRaises(ValueError):
+      self.partitioned(2, lineage = True)
+
+  def test_shared_tables_differ(self):
+    parts = taxonomy.split_db(self.blast, taxonomy.query_bounds(self.blast, 2), self.directory)
+    reports = [self.path('first.db'), self.path('second.db')]
+    for part, output in zip(parts, reports):
+      report(part, output)
+    connection = sqlite3.connect(reports[1])
+    connection.execute('INSERT INTO metadata VALUES (1)')
+    connection.commit()
+    connection.close()
+    with self.assertRaises(ValueError):
+      taxonomy.merge_dbs(reports, self.path('merged.db'))
+
+if __name__ == '__main__':
+  unittest.main()
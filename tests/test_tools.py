@@ -0,0 +1,56 @@
+'''
+external tools with their output collected in the background, their progress and exit status
+'''
+
+# imports
+import sys
+import subprocess
+import unittest
+
+from metapipeline import metrics
+from metapipeline.tools import Tool, FLASH_PROGRESS
+
+def python(script):
+  '''command line of a python tool'''
+  return [sys.executable, '-c', script]
+
+class ToolTest(unittest.TestCase):
+
+  def test_output_and_progress(self):
+    # more output than a pipe buffer, the tool must not block
+    script = ('import sys\n'
+              'for i in range(1, 5001):\n'
+              '  sys.stderr.write("[FLASH] Processed %d read pairs\\n" % (i * 25))\n'
+              'sys.stdout.write("x" * 200000)\n')
+    recorder = metrics.Recorder()
+    with recorder.stage('merging', []) as stage:
+      tool = Tool(python(script), FLASH_PROGRESS, 2)
+      self.assertEqual(tool.wait(), 0)
+    self.assertEqual(len(tool.stdout), 200000)
+    self.assertEqual(tool.stderr.count(b'\n'), 5000)
+    # read pairs times factor
+    self.assertEqual(stage.processed, 250000)
+
+  def test_failure(self):
+    tool = Tool(python('import sys\nsys.stderr.write("no input\\n")\nsys.exit(3)'))
+    with self.assertRaises(subprocess.CalledProcessError) as context:
+      tool.wait()
+    self.assertEqual(context.exception.returncode, 3)
+    self.assertEqual(tool.stderr, b'no input\n')
+
+  def test_stdin(self):
+    tool = Tool(python('import sys\nsys.stdout.write(sys.stdin.read().upper())'), stdin = subprocess.PIPE)
+    tool.stdin.write(b'acgt')
+    tool.stdin.close()
+    tool.wait()
+    self.assertEqual(tool.stdout, b'ACGT')
+
+  def test_concurrent_tools(self):
+    # tools running at the same time keep their own output
+    tools = [Tool(python('import sys\nsys.stdout.write("%d" * 100000)' % (i))) for i in range(8)]
+    for i, tool in enumerate(tools):
+      tool.wait()
+      self.assertEqual(tool.stdout, str(i).encode('ascii') * 100000)
+
+if __name__ == '__main__':
+  unittest.main()
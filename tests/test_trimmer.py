@@ -0,0 +1,119 @@
+'''
+the native trimming engine against a transcription of the trimmomatic steps
+'''
+
+# imports
+import io
+import random
+import unittest
+
+from reads import read_pairs, quality, fastq
+
+try:
+  import numpy
+  from metapipeline import trimmer
+except ImportError:
+  numpy = None
+
+def leading(scores, start, end, threshold):
+  '''LeadingTrimmer: the read starts at the first base at or above threshold'''
+  for position in range(start, end):
+    if scores[position] >= threshold:
+      return position, end
+  return None
+
+def trailing(scores, start, end, threshold):
+  '''TrailingTrimmer: the read ends after the last base at or above threshold'''
+  for position in range(end - 1, start - 1, -1):
+    if scores[position] >= threshold:
+      return start, position + 1
+  return None
+
+def sliding_window(scores, start, end, size, required):
+  '''
+  SlidingWindowTrimmer: a read failing in its first window is dropped, a read failing in a later
+  window is cut at the end of the last good window and loses its bases below the required quality
+  at the end
+  '''
+  if end - start < size:
+    return None
+  total = sum(scores[start:start + size])
+  if total < size * required:
+    return None
+  keep = end
+  for position in range(start, end - size):
+    total += scores[position + size] - scores[position]
+    if total < size * required:
+      keep = position + size
+      while keep > start and scores[keep - 1] < required:
+        keep -= 1
+      break
+  return (start, keep) if keep > start else None
+
+def trimmomatic(line, lead, trail, window, minlength):
+  '''start and end of a read after LEADING, TRAILING, SLIDINGWINDOW and MINLEN, end 0 if dropped'''
+  scores = [ord(char) - 33 for char in line.decode('ascii')]
+  span = (0, len(scores))
+  for step, args in ((leading, (lead,)), (trailing, (trail,)), (sliding_window, window)):
+    span = step(scores, span[0], span[1], *args)
+    if span is None:
+      return 0, 0
+  return span if span[1] - span[0] >= minlength else (span[0], 0)
+
+@unittest.skipIf(numpy is None, 'numpy is missing')
+class TrimBatchTest(unittest.TestCase):
+
+  def check(self, lines, lead, trail, window, minlength):
+    start, end = trimmer.trim_batch([line + b'\n' for line in lines], lead, trail, window, minlength)
+    for index, line in enumerate(lines):
+      expected = trimmomatic(line, lead, trail, window, minlength)
+      if expected[1] == 0:
+        self.assertEqual(end[index], 0, line)
+      else:
+        self.assertEqual((start[index], end[index]), expected, line)
+
+  def test_random_reads(self):
+    generator = random.Random(1)
+    lines = [quality(generator, generator.randint(1, 150)) for index in range(3000)]
+    for lead, trail, window, minlength in ((3, 3, (4, 15), 36), (20, 20, (4, 20), 1),
+                                           (0, 0, (1, 30), 0), (3, 3, (10, 25), 50)):
+      self.check(lines, lead, trail, window, minlength)
+
+  def test_edge_cases(self):
+    lines = [b'I', b'!', b'!!!!', b'IIII', b'III', b'!IIIIIII!', b'IIII####IIII', b'####IIII', b'IIII!!!!']
+    self.check(lines, 3, 3, (4, 15), 1)
+    self.check(lines, 3, 3, (4, 15), 4)
+
+class TrimPairedTest(unittest.TestCase):
+
+  @unittest.skipIf(numpy is None, 'numpy is missing')
+  def test_pairs_and_singles(self):
+    forward, reverse = read_pairs(2000)
+    outputs = [io.BytesIO(), io.BytesIO(), io.BytesIO()]
+    summary = trimmer.trim_paired([io.BytesIO(fastq(forward)), io.BytesIO(fastq(reverse))],
+                                  outputs[:2], outputs[2], 3, 3, '4:15', 36, batch = 300)
+    expected = [[], [], []]
+    for left, right in zip(forward, reverse):
+      spans = [trimmomatic(record[2], 3, 3, (4, 15), 36) for record in (left, right)]
+      trimmed = [(record[0], record[1][start:end], record[2][start:end]) for record, (start, end) in zip((left, right), spans)]
+      if spans[0][1] and spans[1][1]:
+        expected[0].append(trimmed[0])
+        expected[1].append(trimmed[1])
+      elif spans[0][1] or spans[1][1]:
+        expected[2].append(trimmed[0] if spans[0][1] else trimmed[1])
+    for output, records in zip(outputs, expected):
+      self.assertEqual(output.getvalue(), fastq(records))
+    self.assertEqual(summary['input'], len(forward))
+    self.assertEqual(summary['both'], len(expected[0]))
+    self.assertEqual(summary['forward'] + summary['reverse'], len(expected[2]))
+    self.assertEqual(summary['both'] + summary['forward'] + summary['reverse'] + summary['dropped'], len(forward))
+
+  @unittest.skipIf(numpy is None, 'numpy is missing')
+  def test_unequal_pairs(self):
+    forward, reverse = read_pairs(10)
+    with self.assertRaises(ValueError):
+      trimmer.trim_paired([io.BytesIO(fastq(forward)), io.BytesIO(fastq(reverse[:-1]))],
+                          [io.BytesIO(), io.BytesIO()], io.BytesIO(), 3, 3, '4:15', 36)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+'''
+jobs of the long-lived trimmomatic worker, run by the stand-in of bench/stubs (set like
+METAPIPELINE_TRIMMOMATIC_WORKER)
+'''
+
+# imports
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+from reads import read_pairs, write_fastq
+from metapipeline import trimworker
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench', 'stubs',
+                    'trimmomatic_worker.py')
+
+class TrimWorkerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.command = trimworker.TRIMMOMATIC_WORKER
+    trimworker.TRIMMOMATIC_WORKER = '%s %s' % (sys.executable, STUB)
+    self.worker = trimworker.Worker(self.path('worker'))
+
+  def tearDown(self):
+    self.worker.close()
+    trimworker.TRIMMOMATIC_WORKER = self.command
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def single_end(self, name, count, seed = 1):
+    '''arguments of a SE job on count reads, that writes <name>.filtered.fastq and <name>.log'''
+    input = write_fastq(self.path(name + '.fastq'), read_pairs(count, seed)[0])
+    return ['-threads', '1', '-phred33', '-trimlog', self.path(name + '.log'), input,
+            self.path(name + '.filtered.fastq'), 'MINLEN:36']
+
+  def test_job(self):
+    summary = self.worker.submit('SE', self.single_end('reads', 200))
+    self.assertEqual(summary['input'], 200)
+    self.assertEqual(summary['surviving'] + summary['dropped'], 200)
+    with open(self.path('reads.filtered.fastq'), 'rb') as fin:
+      self.assertEqual(fin.read().count(b'\n'), 4 * summary['surviving'])
+    # the scripts reach the worker by its address and the token of the environment
+    self.assertEqual(trimworker.Client(self.worker.address, self.worker.token).submit('SE', self.single_end('reads', 200)),
+                     summary)
+
+  def test_token(self):
+    with self.assertRaises(RuntimeError) as context:
+      trimworker.Client(self.worker.address, 'not' + self.worker.token).submit('SE', self.single_end('reads', 10))
+    self.assertTrue('invalid request' in str(context.exception))
+    self.assertFalse(os.path.exists(self.path('reads.filtered.fastq')))
+    # no client without a token
+    token = os.environ.pop(trimworker.TOKEN_VARIABLE, None)
+    try:
+      with self.assertRaises(RuntimeError):
+        trimworker.Client(self.worker.address)
+    finally:
+      if token is not None:
+        os.environ[trimworker.TOKEN_VARIABLE] = token
+
+  def test_failed_job(self):
+    args = self.single_end('reads', 10)
+    args[5] = self.path('missing.fastq')
+    # the error of the job is raised with its log
+    with self.assertRaises(RuntimeError) as context:
+      self.worker.submit('SE', args)
+    self.assertTrue('missing.fastq' in str(context.exception))
+
+  def test_tabs(self):
+    args = self.single_end('reads', 10)
+    for separator in ('\t', '\n'):
+      with self.assertRaises(ValueError):
+        self.worker.submit('SE', args[:-1] + ['MINLEN:36' + separator + 'CROP:10'])
+    # the worker was not called
+    self.assertFalse(os.path.exists(self.path('reads.filtered.fastq')))
+
+  def test_concurrent_jobs(self):
+    # every job gets its own log, the counts of one job do not end up in the summary of the other
+    counts = {'first': 3000, 'second': 1000}
+    summaries = {}
+    def run(name):
+      summaries[name] = self.worker.submit('SE', self.single_end(name, counts[name], seed = len(name)))
+    threads = [threading.Thread(target = run, args = (name,)) for name in counts]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    for name, count in counts.items():
+      self.assertEqual(summaries[name]['input'], count)
+      with open(self.path(name + '.log'), 'rb') as fin:
+        self.assertEqual(len(fin.readlines()), count)
+
+if __name__ == '__main__':
+  unittest.main()